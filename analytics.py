@@ -0,0 +1,288 @@
+"""
+Sales analytics served from incrementally maintained rollup tables.
+
+Every bill adds itself to sales_rollups and tax_slab_rollups (one row per
+hour and one per day) and to product_sales_daily in the transaction that
+creates it, so reports read O(periods) pre-aggregated rows instead of
+scanning bills and bill_items. Amounts are summed in integer paise, so the
+totals stay exact however many bills they cover.
+
+Periods are local time at ANALYTICS_UTC_OFFSET_MINUTES from UTC. Product
+figures are kept per day only, as hourly rows per product would grow almost
+as large as bill_items. `python analytics.py rebuild` recomputes every
+rollup from the bills in one streaming pass.
+"""
+import argparse
+import time
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from datetime import time as time_of_day
+from functools import lru_cache
+from itertools import groupby
+from operator import itemgetter
+from typing import Dict, List, Mapping, Optional, Sequence, Tuple
+
+from sqlalchemy import delete, desc, func, select
+from sqlalchemy.dialects import sqlite
+from sqlalchemy.orm import Session
+
+import models
+import schemas
+from app.config import settings
+from app.sqlite import begin_write
+from pricing import BASIS_POINTS, PricedBill, from_paise, to_basis_points, to_paise
+
+GRANULARITIES = ("hour", "day")
+FETCH_SIZE = 1000
+
+_SALES_SUMS = ("bill_count", "units", "subtotal_paise", "tax_paise", "total_paise")
+_SLAB_SUMS = ("taxable_paise", "tax_paise")
+_PRODUCT_SUMS = ("units", "subtotal_paise", "tax_paise", "total_paise")
+
+
+def _upsert(model, sums: Sequence[str]):
+    """INSERT that adds its sums onto an existing row for the same key"""
+    table = model.__table__
+    statement = sqlite.insert(table)
+    return statement.on_conflict_do_update(
+        index_elements=[column.name for column in table.primary_key],
+        set_={name: table.c[name] + statement.excluded[name] for name in sums}
+    )
+
+
+# (SalesTally attribute, key columns, summed columns, upsert), built once as
+# constructing the upserts costs more than running them
+_ROLLUPS = tuple(
+    (attribute, tuple(column.name for column in model.__table__.primary_key), sums, _upsert(model, sums))
+    for attribute, model, sums in (
+        ("sales", models.SalesRollup, _SALES_SUMS),
+        ("slabs", models.TaxSlabRollup, _SLAB_SUMS),
+        ("products", models.ProductSalesDaily, _PRODUCT_SUMS),
+    )
+)
+
+
+def _add(totals: dict, key: tuple, values: Sequence[int]):
+    current = totals.get(key)
+    if current is None:
+        totals[key] = list(values)
+    else:
+        for i, value in enumerate(values):
+            current[i] += value
+
+
+class SalesTally:
+    """Sales summed in memory under the rollup tables' keys until written"""
+    
+    def __init__(self):
+        self.offset = timedelta(minutes=settings.ANALYTICS_UTC_OFFSET_MINUTES)
+        self.sales: Dict[Tuple[str, datetime], List[int]] = {}
+        self.slabs: Dict[Tuple[str, datetime, int], List[int]] = {}
+        self.products: Dict[Tuple[date, int], List[int]] = {}
+    
+    def periods(self, created_at: datetime) -> Tuple[datetime, datetime]:
+        """Local start of the hour and of the day a bill created at created_at (UTC) falls in"""
+        hour = (created_at + self.offset).replace(minute=0, second=0, microsecond=0)
+        return hour, hour.replace(hour=0)
+    
+    def add_bill(self, periods: Tuple[datetime, datetime], units: int, subtotal: int, tax: int, total: int):
+        for key in zip(GRANULARITIES, periods):
+            _add(self.sales, key, (1, units, subtotal, tax, total))
+    
+    def add_line(
+        self, periods: Tuple[datetime, datetime], product_pk: int, basis_points: int,
+        quantity: int, subtotal: int, tax: int, total: int
+    ):
+        for granularity, period in zip(GRANULARITIES, periods):
+            _add(self.slabs, (granularity, period, basis_points), (subtotal, tax))
+        _add(self.products, (periods[1].date(), product_pk), (quantity, subtotal, tax, total))
+    
+    def add_priced(self, created_at: datetime, priced: PricedBill, product_pks: Mapping[str, int]):
+        """Add a bill priced by price_cart; product_pks maps product_id to products.id"""
+        periods = self.periods(created_at)
+        self.add_bill(periods, sum(line.quantity for line in priced.lines), priced.subtotal, priced.tax, priced.total)
+        for line in priced.lines:
+            self.add_line(
+                periods, product_pks[line.product_id], line.tax_basis_points,
+                line.quantity, line.subtotal, line.tax, line.total
+            )
+    
+    def write(self, db: Session):
+        """Add the tally onto the rollup tables in db's current transaction"""
+        for attribute, key_columns, sums, upsert in _ROLLUPS:
+            tallies = getattr(self, attribute)
+            if tallies:
+                db.execute(upsert, [
+                    {**dict(zip(key_columns, key)), **dict(zip(sums, values))}
+                    for key, values in tallies.items()
+                ])
+
+
+def record_bill(db: Session, created_at: datetime, priced: PricedBill, product_pks: Mapping[str, int]):
+    """Add one bill to the rollups in the transaction that creates it"""
+    tally = SalesTally()
+    tally.add_priced(created_at, priced, product_pks)
+    tally.write(db)
+
+
+def rebuild(db: Session) -> int:
+    """Recompute every rollup from bills and bill_items; returns the number of bills counted.
+    
+    Holds the write lock throughout, so no bill can be created between the
+    read and the replacement of the old rollups.
+    """
+    bills = models.Bill.__table__
+    items = models.BillItem.__table__
+    begin_write(db)
+    try:
+        rows = db.execute(
+            select(
+                bills.c.id, bills.c.created_at, bills.c.subtotal, bills.c.total_tax, bills.c.total_amount,
+                items.c.product_id, items.c.tax_percentage, items.c.quantity,
+                items.c.item_subtotal, items.c.item_tax, items.c.item_total
+            )
+            .select_from(bills.outerjoin(items, items.c.bill_id == bills.c.id))
+            .order_by(bills.c.id),
+            execution_options={"yield_per": FETCH_SIZE}
+        )
+        # Stored amounts repeat a lot (prices times small quantities), and the
+        # exact Decimal conversions dominate the pass without a cache
+        paise = lru_cache(maxsize=65536)(to_paise)
+        basis_points = lru_cache(maxsize=1024)(to_basis_points)
+        tally = SalesTally()
+        count = 0
+        for _, lines in groupby(rows, key=itemgetter(0)):
+            lines = list(lines)
+            _, created_at, subtotal, tax, total = lines[0][:5]
+            periods = tally.periods(created_at)
+            units = 0
+            for line in lines:
+                # Bills with no items still come back once from the outer join
+                if line[5] is not None:
+                    tally.add_line(
+                        periods, line[5], basis_points(line[6]), line[7],
+                        paise(line[8]), paise(line[9]), paise(line[10])
+                    )
+                    units += line[7]
+            tally.add_bill(periods, units, paise(subtotal), paise(tax), paise(total))
+            count += 1
+        
+        for model in (models.SalesRollup, models.TaxSlabRollup, models.ProductSalesDaily):
+            db.execute(delete(model))
+        tally.write(db)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return count
+
+
+def init_sales_rollups(engine):
+    """Backfill the rollups the first time they are created next to existing bills"""
+    with Session(engine) as db:
+        if db.scalar(select(models.SalesRollup.granularity).limit(1)) is None \
+                and db.scalar(select(models.Bill.id).limit(1)) is not None:
+            db.rollback()
+            rebuild(db)
+
+
+def _in_range(column, start: Optional[date], end: Optional[date]) -> list:
+    """Filters for periods from start to end (inclusive, local dates)"""
+    filters = []
+    if start:
+        filters.append(column >= datetime.combine(start, time_of_day.min))
+    if end:
+        filters.append(column < datetime.combine(end + timedelta(days=1), time_of_day.min))
+    return filters
+
+
+def sales_report(
+    db: Session, granularity: str, start: Optional[date], end: Optional[date]
+) -> schemas.SalesReport:
+    """Sales per hour or day from start to end; periods without bills are left out"""
+    sales = models.SalesRollup
+    slabs = models.TaxSlabRollup
+    
+    slabs_by_period = defaultdict(list)
+    for period_start, basis_points, taxable, tax in db.execute(
+        select(slabs.period_start, slabs.tax_basis_points, slabs.taxable_paise, slabs.tax_paise)
+        .where(slabs.granularity == granularity, *_in_range(slabs.period_start, start, end))
+        .order_by(slabs.period_start, slabs.tax_basis_points)
+    ):
+        slabs_by_period[period_start].append(schemas.TaxSlabSales(
+            tax_percentage=basis_points * 100 / BASIS_POINTS,
+            taxable_amount=from_paise(taxable),
+            tax=from_paise(tax)
+        ))
+    
+    rows = db.execute(
+        select(sales.period_start, *(sales.__table__.c[name] for name in _SALES_SUMS))
+        .where(sales.granularity == granularity, *_in_range(sales.period_start, start, end))
+        .order_by(sales.period_start)
+    )
+    return schemas.SalesReport(
+        granularity=granularity,
+        buckets=[
+            schemas.SalesBucket(
+                period_start=period_start,
+                bill_count=bill_count,
+                units=units,
+                subtotal=from_paise(subtotal),
+                total_tax=from_paise(tax),
+                total_amount=from_paise(total),
+                tax_slabs=slabs_by_period[period_start]
+            )
+            for period_start, bill_count, units, subtotal, tax, total in rows
+        ]
+    )
+
+
+def top_products(
+    db: Session, start: Optional[date], end: Optional[date], by: str, limit: int
+) -> List[schemas.TopProduct]:
+    """Best-selling products from start to end by revenue or by units"""
+    daily = models.ProductSalesDaily
+    units = func.sum(daily.units)
+    total = func.sum(daily.total_paise)
+    filters = []
+    if start:
+        filters.append(daily.day >= start)
+    if end:
+        filters.append(daily.day <= end)
+    
+    rows = db.execute(
+        select(
+            models.Product.product_id, models.Product.name,
+            units, func.sum(daily.subtotal_paise), func.sum(daily.tax_paise), total
+        )
+        .join(models.Product, models.Product.id == daily.product_id)
+        .where(*filters)
+        .group_by(daily.product_id)
+        .order_by(desc(units if by == "units" else total), models.Product.product_id)
+        .limit(limit)
+    )
+    return [
+        schemas.TopProduct(
+            product_id=product_id,
+            name=name,
+            units=units,
+            subtotal=from_paise(subtotal),
+            total_tax=from_paise(tax),
+            total_amount=from_paise(total)
+        )
+        for product_id, name, units, subtotal, tax, total in rows
+    ]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Maintain the sales rollup tables")
+    parser.add_argument("command", choices=["rebuild"], help="rebuild: recompute every rollup from the bills")
+    parser.parse_args()
+    
+    from database import SessionLocal, init_db
+    
+    init_db()
+    started = time.perf_counter()
+    with SessionLocal() as db:
+        count = rebuild(db)
+    print(f"Rebuilt sales rollups from {count} bills in {time.perf_counter() - started:.1f}s")
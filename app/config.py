@@ -9,7 +9,79 @@ class Settings(BaseSettings):
     """Application settings"""
     
     # Database
-    DATABASE_URL: str = "sqlite:///./billing_system.db"
+    DATABASE_URL: str = "sqlite:///./billing.db"
+    # "sync" runs routes on a sync Session in the threadpool,
+    # "async" runs them on an aiosqlite AsyncSession
+    DB_MODE: str = "sync"
+    
+    # SQLite connection layer
+    SQLITE_POOL_SIZE: int = 5
+    SQLITE_MAX_OVERFLOW: int = 10
+    SQLITE_POOL_TIMEOUT: float = 30.0
+    SQLITE_JOURNAL_MODE: str = "WAL"
+    SQLITE_SYNCHRONOUS: str = "NORMAL"
+    SQLITE_BUSY_TIMEOUT_MS: int = 5000
+    SQLITE_MMAP_SIZE: int = 268435456  # 256 MiB
+    SQLITE_CACHE_SIZE: int = -65536  # negative means KiB, so 64 MiB
+    SQLITE_BUSY_RETRIES: int = 5
+    SQLITE_BUSY_BACKOFF: float = 0.05  # seconds, doubled on every retry
+    
+    # Group commit: one writer thread commits many bills per transaction
+    BILL_GROUP_COMMIT: bool = False
+    BILL_GROUP_COMMIT_BATCH_SIZE: int = 64
+    BILL_GROUP_COMMIT_MAX_DELAY_MS: float = 5.0
+    
+    # Product catalog cache: 0 keeps it until restart; set it with several
+    # workers so each process picks up the others' product changes
+    PRODUCT_CACHE_TTL_SECONDS: float = 0.0
+    
+    # Bill numbers: <prefix>-[<financial year>-]<zero-padded sequence>
+    BILL_NUMBER_PREFIX: str = "BILL"
+    BILL_NUMBER_WIDTH: int = 6
+    BILL_NUMBER_FY_START_MONTH: int = 0  # e.g. 4 restarts numbering every April; 0 never resets
+    BILL_NUMBER_BLOCK_SIZE: int = 50  # numbers each worker reserves at a time
+    
+    # Idempotency-Key replays for POST /bills
+    IDEMPOTENCY_TTL_SECONDS: float = 86400.0
+    IDEMPOTENCY_CACHE_SIZE: int = 10000
+    IDEMPOTENCY_PRUNE_INTERVAL_SECONDS: float = 300.0
+    
+    # Sales analytics: rollup buckets are local days and hours at this offset
+    # from UTC (330 for IST); run `python analytics.py rebuild` after changing it
+    ANALYTICS_UTC_OFFSET_MINUTES: int = 0
+    
+    # Request and SQL metrics at GET /metrics, plus a Server-Timing header
+    # with each response's DB time and query count
+    METRICS_ENABLED: bool = True
+    
+    # N+1 detector: log requests that run one statement template more than
+    # QUERY_DEBUG_REPEAT_THRESHOLD times
+    QUERY_DEBUG: bool = False
+    QUERY_DEBUG_REPEAT_THRESHOLD: int = 5
+    
+    # Encode GET /products, GET /bills and customer purchase history straight
+    # from rows to JSON (with orjson if installed), skipping response_model
+    # validation; the output is the same
+    FAST_JSON_RESPONSES: bool = True
+    
+    # Encoded GET /bills/{bill_id} responses kept in memory (0 turns the cache
+    # off), and the Cache-Control header sent with them
+    BILL_CACHE_MAX_BYTES: int = 33554432  # 32 MiB
+    BILL_CACHE_CONTROL: str = "public, max-age=31536000, immutable"
+    
+    # Priced carts POST /bills/quote remembers (0 prices every quote afresh)
+    QUOTE_CACHE_MAX_ENTRIES: int = 4096
+    
+    # Ranked product ids GET /products/search remembers per query (0 ranks
+    # every search afresh)
+    SEARCH_CACHE_MAX_ENTRIES: int = 4096
+    
+    # Compress JSON, text and CSV responses of at least COMPRESSION_MIN_BYTES
+    # with brotli (if installed) or gzip, as the client's Accept-Encoding allows
+    COMPRESSION_ENABLED: bool = True
+    COMPRESSION_MIN_BYTES: int = 1024
+    COMPRESSION_GZIP_LEVEL: int = 6
+    COMPRESSION_BROTLI_QUALITY: int = 5
     
     # Email Configuration
     SMTP_SERVER: str = "smtp.gmail.com"
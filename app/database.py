@@ -1,17 +1,12 @@
 """
 Database configuration and session management
 """
-from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker, declarative_base
-from sqlalchemy.pool import StaticPool
 from app.config import settings
+from app.sqlite import create_sqlite_engine
 
-# Create engine with SQLite
-engine = create_engine(
-    settings.DATABASE_URL,
-    connect_args={"check_same_thread": False},
-    poolclass=StaticPool,
-)
+# Create engine with SQLite (bounded pool, WAL and tuned pragmas)
+engine = create_sqlite_engine(settings.DATABASE_URL)
 
 # Create session factory
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
@@ -0,0 +1,172 @@
+"""
+SQLite connection layer shared by the sync and async engines
+"""
+import asyncio
+import time
+from datetime import date, datetime
+from typing import List
+
+from sqlalchemy import create_engine, event, inspect
+from sqlalchemy.engine import make_url
+from sqlalchemy.dialects.sqlite.base import SQLiteCompiler
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import StaticPool
+
+from app.config import settings
+
+# Largest value an INTEGER column holds; binding anything larger raises OverflowError
+SQLITE_MAX_INTEGER = 2 ** 63 - 1
+
+
+def is_memory_url(url: str) -> bool:
+    """Return True for in-memory databases, which cannot be shared across a pool"""
+    database = make_url(url).database
+    return not database or database == ":memory:"
+
+
+def apply_pragmas(dbapi_connection, connection_record):
+    """Tune every new SQLite connection as it is opened"""
+    # Stop pysqlite from issuing its own BEGIN/COMMIT so SAVEPOINTs nest
+    # correctly; begin_transaction() below emits BEGIN instead
+    dbapi_connection.isolation_level = None
+    cursor = dbapi_connection.cursor()
+    cursor.execute(f"PRAGMA journal_mode={settings.SQLITE_JOURNAL_MODE}")
+    cursor.execute(f"PRAGMA synchronous={settings.SQLITE_SYNCHRONOUS}")
+    cursor.execute(f"PRAGMA busy_timeout={int(settings.SQLITE_BUSY_TIMEOUT_MS)}")
+    cursor.execute(f"PRAGMA mmap_size={int(settings.SQLITE_MMAP_SIZE)}")
+    cursor.execute(f"PRAGMA cache_size={int(settings.SQLITE_CACHE_SIZE)}")
+    cursor.close()
+
+
+def begin_transaction(connection):
+    """Emit BEGIN ourselves, as pysqlite no longer does it implicitly"""
+    mode = connection.get_execution_options().get("sqlite_begin", "DEFERRED")
+    connection.exec_driver_sql(f"BEGIN {mode}")
+
+
+def begin_write(session):
+    """Open the session's transaction with BEGIN IMMEDIATE.
+    
+    A deferred transaction that reads before writing cannot upgrade its lock
+    once another writer has committed, and SQLite fails it with SQLITE_BUSY
+    without waiting. Taking the write lock up front makes it wait on
+    busy_timeout instead. Must be called before the session runs any query.
+    """
+    session.connection(execution_options={"sqlite_begin": "IMMEDIATE"})
+
+
+class HintingSQLiteCompiler(SQLiteCompiler):
+    """Renders with_hint() table hints such as "INDEXED BY ix_bills_total_amount",
+    which SQLAlchemy's SQLite compiler otherwise drops"""
+    
+    def get_from_hint_text(self, table, text):
+        return text
+
+
+def explain_query_plan(connection, statement) -> List[str]:
+    """Return the detail column of EXPLAIN QUERY PLAN for a statement, e.g. to catch full table scans.
+    
+    Bound values are passed as plain strings and numbers, which is all the
+    planner looks at.
+    """
+    compiled = statement.compile(dialect=connection.dialect, compile_kwargs={"render_postcompile": True})
+    params = compiled.construct_params()
+    values = tuple(
+        str(value) if isinstance(value, (date, datetime)) else value
+        for value in (params[name] for name in compiled.positiontup)
+    )
+    rows = connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {compiled.string}", values)
+    return [row[3] for row in rows]
+
+
+def _pool_args(url: str) -> dict:
+    if is_memory_url(url):
+        return {"poolclass": StaticPool}
+    return {
+        "pool_size": settings.SQLITE_POOL_SIZE,
+        "max_overflow": settings.SQLITE_MAX_OVERFLOW,
+        "pool_timeout": settings.SQLITE_POOL_TIMEOUT,
+    }
+
+
+def create_sqlite_engine(url: str, **kwargs):
+    """Create a sync engine with a bounded connection pool and tuned pragmas"""
+    engine = create_engine(
+        url,
+        connect_args={"check_same_thread": False},
+        **_pool_args(url),
+        **kwargs
+    )
+    engine.dialect.statement_compiler = HintingSQLiteCompiler
+    event.listen(engine, "connect", apply_pragmas)
+    event.listen(engine, "begin", begin_transaction)
+    return engine
+
+
+def create_async_sqlite_engine(url: str, **kwargs):
+    """Create an aiosqlite engine with the same pool bounds and pragmas"""
+    engine = create_async_engine(url, **_pool_args(url), **kwargs)
+    engine.sync_engine.dialect.statement_compiler = HintingSQLiteCompiler
+    event.listen(engine.sync_engine, "connect", apply_pragmas)
+    event.listen(engine.sync_engine, "begin", begin_transaction)
+    return engine
+
+
+def upgrade_schema(engine, metadata):
+    """Bring an existing database up to date with metadata after create_all.
+    
+    create_all only creates missing tables, so databases made by an older
+    version of the app would lack newer columns and indexes. Add them here;
+    new columns must be nullable, as SQLite cannot backfill them.
+    """
+    inspector = inspect(engine)
+    with engine.begin() as connection:
+        for table in metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing:
+                    column_type = column.type.compile(dialect=engine.dialect)
+                    connection.exec_driver_sql(
+                        f'ALTER TABLE "{table.name}" ADD COLUMN "{column.name}" {column_type}'
+                    )
+            for index in table.indexes:
+                index.create(connection, checkfirst=True)
+
+
+def is_busy_error(exc: Exception) -> bool:
+    """Return True if exc is SQLITE_BUSY / SQLITE_LOCKED surfacing through SQLAlchemy"""
+    if not isinstance(exc, OperationalError):
+        return False
+    message = str(exc.orig).lower()
+    return "database is locked" in message or "database is busy" in message or "database table is locked" in message
+
+
+def _backoff(attempt: int) -> float:
+    return settings.SQLITE_BUSY_BACKOFF * (2 ** attempt)
+
+
+def retry_on_busy(session, fn, *args, **kwargs):
+    """Call fn, rolling back and retrying with exponential backoff while SQLite is busy"""
+    for attempt in range(settings.SQLITE_BUSY_RETRIES + 1):
+        try:
+            return fn(*args, **kwargs)
+        except OperationalError as e:
+            if not is_busy_error(e) or attempt == settings.SQLITE_BUSY_RETRIES:
+                raise
+            session.rollback()
+            time.sleep(_backoff(attempt))
+
+
+async def retry_on_busy_async(session, fn, *args, **kwargs):
+    """Async variant of retry_on_busy for AsyncSession callers"""
+    for attempt in range(settings.SQLITE_BUSY_RETRIES + 1):
+        try:
+            return await fn(*args, **kwargs)
+        except OperationalError as e:
+            if not is_busy_error(e) or attempt == settings.SQLITE_BUSY_RETRIES:
+                raise
+            await session.rollback()
+            await asyncio.sleep(_backoff(attempt))
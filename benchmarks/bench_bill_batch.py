@@ -0,0 +1,96 @@
+"""
+Benchmark replaying queued bills one by one against POST /bills/batch.
+
+Runs against a throwaway SQLite database in a temporary directory, so the
+local billing.db is never touched.
+
+    python benchmarks/bench_bill_batch.py --bills 10000 --cart 3
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(tempfile.mkdtemp(prefix="billing-bench-"))
+
+from database import SessionLocal, init_db  # noqa: E402
+import crud  # noqa: E402
+import models  # noqa: E402
+import schemas  # noqa: E402
+
+PRODUCTS = 500
+
+
+def seed():
+    """Insert products with effectively unlimited stock"""
+    init_db()
+    db = SessionLocal()
+    db.add_all(
+        models.Denomination(value=value)
+        for value in [2000, 500, 200, 100, 50, 20, 10, 5, 2, 1]
+    )
+    db.add_all(
+        models.Product(
+            product_id=f"BENCH{i:05d}",
+            name=f"Bench product {i}",
+            available_stocks=10_000_000,
+            price_per_unit=10.0 + i,
+            tax_percentage=(5.0, 12.0, 18.0)[i % 3],
+        )
+        for i in range(PRODUCTS)
+    )
+    db.commit()
+    db.close()
+
+
+def make_bills(count, cart_size):
+    rng = random.Random(42)
+    return [
+        schemas.BillCreate(
+            customer_email=f"customer{rng.randrange(1000)}@example.com",
+            items=[
+                schemas.BillItemCreate(product_id=f"BENCH{rng.randrange(PRODUCTS):05d}", quantity=rng.randint(1, 3))
+                for _ in range(cart_size)
+            ],
+            paid_amount=10_000,
+        )
+        for _ in range(count)
+    ]
+
+
+def one_by_one(bills):
+    for bill in bills:
+        db = SessionLocal()
+        crud.create_bill(db, bill)
+        db.close()
+
+
+def batched(bills):
+    db = SessionLocal()
+    result = crud.create_bills_batch(db, bills)
+    db.close()
+    assert result.rejected == 0, result.results[:5]
+
+
+def run():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--bills", type=int, default=10_000)
+    parser.add_argument("--cart", type=int, default=3)
+    args = parser.parse_args()
+
+    seed()
+    bills = make_bills(args.bills, args.cart)
+    print(f"{'mode':>12} {'seconds':>10} {'bills/s':>10}")
+    for name, replay in (("one-by-one", one_by_one), ("batch", batched)):
+        started = time.perf_counter()
+        replay(bills)
+        elapsed = time.perf_counter() - started
+        print(f"{name:>12} {elapsed:>10.2f} {args.bills / elapsed:>10.0f}")
+
+
+if __name__ == "__main__":
+    run()
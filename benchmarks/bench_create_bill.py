@@ -0,0 +1,86 @@
+"""
+Benchmark bill creation latency against cart size.
+
+Runs against a throwaway SQLite database in a temporary directory, so the
+local billing.db is never touched.
+
+    python benchmarks/bench_create_bill.py --sizes 1 5 10 20 40 --runs 200
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(tempfile.mkdtemp(prefix="billing-bench-"))
+
+from database import Base, SessionLocal, engine  # noqa: E402
+import crud  # noqa: E402
+import models  # noqa: E402
+import schemas  # noqa: E402
+
+
+def seed(product_count):
+    """Insert products with effectively unlimited stock"""
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    db.add_all(
+        models.Denomination(value=value)
+        for value in [2000, 500, 200, 100, 50, 20, 10, 5, 2, 1]
+    )
+    db.add_all(
+        models.Product(
+            product_id=f"BENCH{i:05d}",
+            name=f"Bench product {i}",
+            available_stocks=10_000_000,
+            price_per_unit=10.0 + i,
+            tax_percentage=(5.0, 12.0, 18.0)[i % 3],
+        )
+        for i in range(product_count)
+    )
+    db.commit()
+    db.close()
+
+
+def bench(cart_size, runs):
+    """Return per-bill latencies in milliseconds for the given cart size"""
+    bill = schemas.BillCreate(
+        customer_email="bench@example.com",
+        items=[
+            schemas.BillItemCreate(product_id=f"BENCH{i:05d}", quantity=1)
+            for i in range(cart_size)
+        ],
+        paid_amount=10_000_000,
+    )
+    latencies = []
+    for _ in range(runs):
+        db = SessionLocal()
+        started = time.perf_counter()
+        crud.create_bill(db, bill)
+        latencies.append((time.perf_counter() - started) * 1000)
+        db.close()
+    return latencies
+
+
+def run():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1, 5, 10, 20, 40])
+    parser.add_argument("--runs", type=int, default=200)
+    args = parser.parse_args()
+
+    seed(max(args.sizes))
+    print(f"{'cart':>6} {'mean ms':>10} {'p50 ms':>10} {'p95 ms':>10}")
+    for size in args.sizes:
+        latencies = sorted(bench(size, args.runs))
+        p95 = latencies[int(len(latencies) * 0.95) - 1]
+        print(
+            f"{size:>6} {statistics.mean(latencies):>10.3f} "
+            f"{statistics.median(latencies):>10.3f} {p95:>10.3f}"
+        )
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,121 @@
+"""
+Benchmark the sync and async database modes side by side under concurrent load.
+
+Starts one uvicorn server per DB_MODE against a throwaway SQLite database,
+then drives GET /products and POST /bills from a pool of client threads.
+
+    python benchmarks/bench_db_modes.py --concurrency 32 --requests 2000
+"""
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def call(base_url, method, path, payload=None):
+    """Send one request and return its latency in milliseconds"""
+    data = json.dumps(payload).encode() if payload is not None else None
+    request = urllib.request.Request(
+        base_url + path, data=data, method=method,
+        headers={"Content-Type": "application/json"},
+    )
+    started = time.perf_counter()
+    try:
+        with urllib.request.urlopen(request) as response:
+            response.read()
+    except urllib.error.HTTPError as e:
+        e.read()
+    return (time.perf_counter() - started) * 1000
+
+
+def start_server(port, **settings):
+    """Start uvicorn on a fresh database with the given settings as environment variables"""
+    workdir = tempfile.mkdtemp(prefix="billing-bench-")
+    env = dict(os.environ, PYTHONPATH=ROOT, **settings)
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=workdir, env=env,
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    for _ in range(100):
+        try:
+            call(base_url, "GET", "/health")
+            return server, base_url
+        except OSError:
+            time.sleep(0.1)
+    server.terminate()
+    raise RuntimeError(f"uvicorn did not start with {settings}")
+
+
+def seed(base_url, product_count):
+    call(base_url, "POST", "/denominations", {"value": 1})
+    for i in range(product_count):
+        call(base_url, "POST", "/products", {
+            "product_id": f"BENCH{i:05d}",
+            "name": f"Bench product {i}",
+            "available_stocks": 10_000_000,
+            "price_per_unit": 10.0 + i,
+            "tax_percentage": 18.0,
+        })
+
+
+def drive(base_url, concurrency, requests, method, path, payload=None):
+    """Return (requests/sec, sorted latencies) for one endpoint"""
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        started = time.perf_counter()
+        latencies = list(pool.map(lambda _: call(base_url, method, path, payload), range(requests)))
+        elapsed = time.perf_counter() - started
+    return requests / elapsed, sorted(latencies)
+
+
+def run():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--products", type=int, default=100)
+    parser.add_argument("--modes", nargs="+", choices=["sync", "async"], default=["sync", "async"])
+    args = parser.parse_args()
+
+    bill = {
+        "customer_email": "bench@example.com",
+        "items": [{"product_id": f"BENCH{i:05d}", "quantity": 1} for i in range(5)],
+        "paid_amount": 10_000_000,
+    }
+    print(f"{'mode':>6} {'endpoint':>14} {'req/s':>10} {'p50 ms':>10} {'p95 ms':>10}")
+    for mode in args.modes:
+        server, base_url = start_server(free_port(), DB_MODE=mode)
+        try:
+            seed(base_url, args.products)
+            for label, method, path, payload in (
+                ("GET /products", "GET", "/products", None),
+                ("POST /bills", "POST", "/bills", bill),
+            ):
+                throughput, latencies = drive(base_url, args.concurrency, args.requests, method, path, payload)
+                p95 = latencies[int(len(latencies) * 0.95) - 1]
+                print(
+                    f"{mode:>6} {label:>14} {throughput:>10.1f} "
+                    f"{statistics.median(latencies):>10.3f} {p95:>10.3f}"
+                )
+        finally:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,51 @@
+"""
+Benchmark bills/sec with the group-commit writer on and off.
+
+Starts one uvicorn server per setting against a throwaway SQLite database
+and posts bills from a pool of client threads.
+
+    python benchmarks/bench_group_commit.py --concurrency 64 --requests 4000
+"""
+import argparse
+import statistics
+
+from bench_db_modes import drive, free_port, seed, start_server
+
+
+def run():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--requests", type=int, default=4000)
+    parser.add_argument("--products", type=int, default=100)
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--max-delay-ms", type=float, default=5.0)
+    args = parser.parse_args()
+
+    bill = {
+        "customer_email": "bench@example.com",
+        "items": [{"product_id": f"BENCH{i:05d}", "quantity": 1} for i in range(5)],
+        "paid_amount": 10_000_000,
+    }
+    print(f"{'group commit':>12} {'bills/s':>10} {'p50 ms':>10} {'p95 ms':>10}")
+    for enabled in ("false", "true"):
+        server, base_url = start_server(
+            free_port(),
+            BILL_GROUP_COMMIT=enabled,
+            BILL_GROUP_COMMIT_BATCH_SIZE=str(args.batch_size),
+            BILL_GROUP_COMMIT_MAX_DELAY_MS=str(args.max_delay_ms),
+        )
+        try:
+            seed(base_url, args.products)
+            throughput, latencies = drive(base_url, args.concurrency, args.requests, "POST", "/bills", bill)
+            p95 = latencies[int(len(latencies) * 0.95) - 1]
+            print(
+                f"{enabled:>12} {throughput:>10.1f} "
+                f"{statistics.median(latencies):>10.3f} {p95:>10.3f}"
+            )
+        finally:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,77 @@
+"""
+Benchmark streaming product imports (POST /products/import) on a large file.
+
+Runs against a throwaway SQLite database in a temporary directory, so the
+local billing.db is never touched. Imports --rows new products, then the
+same file again so every row takes the ON CONFLICT update path.
+
+    python benchmarks/bench_product_import.py --rows 1000000 --format csv
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(tempfile.mkdtemp(prefix="billing-bench-"))
+
+from database import SessionLocal, init_db  # noqa: E402
+import crud  # noqa: E402
+import imports  # noqa: E402
+
+PIECE_BYTES = 64 * 1024
+
+
+async def body(rows, format, price):
+    """Generate the upload in network-sized pieces"""
+    lines = []
+    if format == "csv":
+        lines.append("product_id,name,available_stocks,price_per_unit,tax_percentage\n")
+    size = 0
+    for i in range(rows):
+        if format == "csv":
+            line = f"SKU{i:07d},Supplier item {i},{i % 500},{price + i % 100},{(5, 12, 18)[i % 3]}\n"
+        else:
+            line = json.dumps({
+                "product_id": f"SKU{i:07d}", "name": f"Supplier item {i}", "available_stocks": i % 500,
+                "price_per_unit": price + i % 100, "tax_percentage": (5, 12, 18)[i % 3]
+            }) + "\n"
+        lines.append(line)
+        size += len(line)
+        if size >= PIECE_BYTES:
+            yield "".join(lines).encode()
+            lines, size = [], 0
+    if lines:
+        yield "".join(lines).encode()
+
+
+async def run_import(rows, format, price):
+    db = SessionLocal()
+    upserted = 0
+    async for chunk in imports.read_chunks(body(rows, format, price), format):
+        upserted += crud.import_products(db, chunk).upserted
+    db.close()
+    return upserted
+
+
+def run():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--format", choices=["csv", "ndjson"], default="csv")
+    args = parser.parse_args()
+
+    init_db()
+    print(f"{'pass':>8} {'rows':>10} {'seconds':>10} {'rows/s':>10}")
+    for name, price in (("insert", 10.0), ("update", 11.0)):
+        started = time.perf_counter()
+        upserted = asyncio.run(run_import(args.rows, args.format, price))
+        elapsed = time.perf_counter() - started
+        print(f"{name:>8} {upserted:>10} {elapsed:>10.2f} {upserted / elapsed:>10.0f}")
+
+
+if __name__ == "__main__":
+    run()
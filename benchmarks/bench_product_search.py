@@ -0,0 +1,94 @@
+"""
+Benchmark GET /products/search query latency on a large catalog.
+
+Bulk-loads products into a throwaway SQLite database (the FTS index is kept
+in sync by its triggers), then times typeahead queries of varying length,
+down to one- and two-letter prefixes that match a large part of the catalog.
+Each stream of queries runs twice: with the memo off, so every query ranks
+all its matches, and then with it on, where repeated queries are served
+from it as they would be while cashiers type.
+
+    python benchmarks/bench_product_search.py --products 1000000 --queries 2000
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(tempfile.mkdtemp(prefix="billing-bench-"))
+
+from database import SessionLocal, engine, init_db  # noqa: E402
+import crud  # noqa: E402
+import search  # noqa: E402
+from app.config import settings  # noqa: E402
+
+WORDS = [
+    "apple", "banana", "cable", "charger", "desk", "eggs", "flour", "glass", "hammer",
+    "ink", "jacket", "kettle", "laptop", "lamp", "mouse", "notebook", "oil", "pen",
+    "quilt", "rice", "soap", "table", "umbrella", "vase", "wallet", "yarn", "zipper",
+]
+
+
+def seed(product_count, chunk=1000):
+    """Insert products through the import path's multi-row statements"""
+    init_db()
+    rng = random.Random(42)
+    with engine.begin() as connection:
+        for start in range(0, product_count, chunk):
+            rows = range(start, min(start + chunk, product_count))
+            connection.exec_driver_sql(crud.product_upsert_sql(len(rows), skip_existing=True), tuple(
+                value
+                for i in rows
+                for value in (f"SKU{i:07d}", f"{rng.choice(WORDS)} {rng.choice(WORDS)} {i % 997}", 100, 10.0, 18.0)
+            ))
+
+
+def timed(db, queries, limit):
+    """p50 and p99 latency in ms of running queries in order"""
+    latencies = []
+    for query in queries:
+        t0 = time.perf_counter()
+        search.search_products(db, query, limit)
+        latencies.append((time.perf_counter() - t0) * 1000)
+    latencies.sort()
+    return statistics.median(latencies), latencies[int(len(latencies) * 0.99) - 1]
+
+
+def run():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--products", type=int, default=1_000_000)
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--limit", type=int, default=10)
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    seed(args.products)
+    print(f"seeded {args.products} products in {time.perf_counter() - started:.1f}s")
+
+    rng = random.Random(7)
+    db = SessionLocal()
+    print(f"{'query':>14} {'cold p50':>10} {'cold p99':>10} {'memo p50':>10} {'memo p99':>10} {'hits':>6}")
+    for label, make_query in (
+        ("sku prefix", lambda: f"SKU{rng.randrange(args.products):07d}"[:rng.randint(6, 10)]),
+        ("word prefix", lambda: rng.choice(WORDS)[:rng.randint(2, 5)]),
+        ("short prefix", lambda: rng.choice(WORDS)[:rng.randint(1, 2)]),
+        ("two words", lambda: f"{rng.choice(WORDS)} {rng.choice(WORDS)[:3]}"),
+    ):
+        queries = [make_query() for _ in range(args.queries)]
+        search.search_cache.max_entries = 0
+        cold = timed(db, queries, args.limit)
+        search.search_cache.max_entries = settings.SEARCH_CACHE_MAX_ENTRIES
+        hits = search.search_cache.hits
+        memo = timed(db, queries, args.limit)
+        hit_ratio = (search.search_cache.hits - hits) / len(queries)
+        print(f"{label:>14} {cold[0]:>10.3f} {cold[1]:>10.3f} {memo[0]:>10.3f} {memo[1]:>10.3f} {hit_ratio:>6.0%}")
+    db.close()
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,151 @@
+"""
+Benchmark the fast JSON path against response_model serialization, and check they match.
+
+Seeds a throwaway SQLite database with seed.py's generators, then:
+
+1. Fetches GET /products, GET /bills, GET /bills/search and GET
+   /customers/{email}/purchases (first and second pages, with and without
+   items) through TestClient
+   with FAST_JSON_RESPONSES off and on, and fails if any body differs.
+2. Times building and encoding --rows products and bills both ways. The
+   schema path is what the routes do with the setting off: ORM objects,
+   model_validate, then FastAPI validating the result against the
+   response_model again and encoding it. Bills are read in keyset pages of
+   --page-size, as GET /bills serves them.
+
+    python benchmarks/bench_serialization.py --rows 10000 100000
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from typing import List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(tempfile.mkdtemp(prefix="billing-bench-"))
+
+from fastapi.testclient import TestClient  # noqa: E402
+from pydantic import TypeAdapter  # noqa: E402
+
+from app.config import settings  # noqa: E402
+from catalog import catalog  # noqa: E402
+from database import SessionLocal, init_db  # noqa: E402
+import crud  # noqa: E402
+import main  # noqa: E402
+import models  # noqa: E402
+import schemas  # noqa: E402
+import seed  # noqa: E402
+import serialization  # noqa: E402
+
+PRODUCTS = TypeAdapter(List[schemas.ProductResponse])
+BILL_PAGE = TypeAdapter(schemas.BillPage)
+
+
+def response_model_json(adapter: TypeAdapter, content) -> bytes:
+    """What FastAPI does with a route's return value and its response_model"""
+    return adapter.dump_json(adapter.validate_python(content, from_attributes=True))
+
+
+def check_output(client: TestClient) -> int:
+    """Fetch each endpoint with the fast path off and on; returns the number that differ"""
+    with SessionLocal() as db:
+        email = db.scalar(models.Customer.__table__.select().with_only_columns(models.Customer.email)
+                          .order_by(models.Customer.bill_count.desc()).limit(1))
+    urls = ["/products"]
+    for path in ("/bills?", f"/customers/{email}/purchases?", "/bills/search?email=customer00000&"):
+        for params in ("limit=500", "limit=500&include_items=false", "limit=3"):
+            urls.append(path + params)
+            page = client.get(path + params).json()
+            cursor = page.get("next_cursor")
+            if cursor:
+                urls.append(f"{path}{params}&cursor={cursor}")
+
+    differences = 0
+    for url in urls:
+        bodies = []
+        for fast in (False, True):
+            settings.FAST_JSON_RESPONSES = fast
+            response = client.get(url)
+            bodies.append((response.status_code, response.headers["content-type"], response.content))
+        same = bodies[0] == bodies[1]
+        differences += not same
+        print(f"{'same' if same else 'DIFFERENT':<10} {len(bodies[1][2]):>10} bytes  GET {url}")
+    return differences
+
+
+def best_of(repeat: int, function) -> float:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+def walk_bills(rows: int, page_size: int, fast: bool) -> int:
+    """Build and encode rows bills, a page at a time; returns the bytes produced"""
+    size = 0
+    cursor = None
+    with SessionLocal() as db:
+        while rows > 0:
+            limit = min(page_size, rows)
+            if fast:
+                page = crud.page_bill_rows(db.query(models.Bill), limit, cursor, serialization.FULL_BILL)
+                size += len(serialization.dumps(page))
+                cursor = page["next_cursor"]
+            else:
+                page = crud.get_all_bills(db, limit, cursor, True)
+                size += len(response_model_json(BILL_PAGE, page))
+                cursor = page.next_cursor
+            db.expunge_all()
+            rows -= limit
+            if cursor is None:
+                break
+    return size
+
+
+def run():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, nargs="+", default=[10000, 100000])
+    parser.add_argument("--page-size", type=int, default=500)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    largest = max(args.rows)
+    rng = random.Random(42)
+    init_db()
+    with SessionLocal() as db:
+        seed.seed_defaults(db)
+        seed.generate_products(db, largest, rng, 10000)
+        seed.generate_bills(db, largest, max(1, largest // 20), 365, rng, 10000)
+
+    print(f"\nencoder: {'orjson' if serialization.orjson is not None else 'pydantic-core'}")
+    with TestClient(main.app) as client:
+        differences = check_output(client)
+
+    with SessionLocal() as db:
+        products = catalog.all(db)
+    print(f"\n{'rows':>8} {'what':<10} {'schema ms':>10} {'fast ms':>10} {'speedup':>8} {'MB':>8}")
+    for rows in args.rows:
+        subset = products[:rows]
+        slow = best_of(args.repeat, lambda: response_model_json(PRODUCTS, subset))
+        fast = best_of(args.repeat, lambda: serialization.products_json(subset))
+        size = len(serialization.products_json(subset)) / 1e6
+        print(f"{len(subset):>8} {'products':<10} {slow * 1000:>10.1f} {fast * 1000:>10.1f} {slow / fast:>7.1f}x {size:>8.2f}")
+
+        slow = best_of(args.repeat, lambda: walk_bills(rows, args.page_size, False))
+        fast = best_of(args.repeat, lambda: walk_bills(rows, args.page_size, True))
+        size = walk_bills(rows, args.page_size, True) / 1e6
+        print(f"{rows:>8} {'bills':<10} {slow * 1000:>10.1f} {fast * 1000:>10.1f} {slow / fast:>7.1f}x {size:>8.2f}")
+
+    if differences:
+        print(f"\n{differences} response(s) differ between the fast path and response_model serialization")
+        sys.exit(1)
+    print("\nEvery fast path response matches response_model serialization")
+
+
+if __name__ == "__main__":
+    run()
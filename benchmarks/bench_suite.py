@@ -0,0 +1,248 @@
+"""
+In-process load test of the main endpoints, saved as JSON to compare between commits.
+
+Seeds a throwaway SQLite database with seed.py's generators, or uses
+--database (for example one seeded at production scale with seed.py). Then
+drives each scenario through httpx's ASGI transport at every --concurrency
+level: that many clients sending requests back to back on the app's event
+loop, with no network in between. Carts and customers are drawn with
+seed.py's cart size and popularity distributions. Reports throughput and
+p50/p95/p99 latency, and writes them to --output with the commit, settings
+and data sizes. --compare prints the change against an earlier run.
+
+    python benchmarks/bench_suite.py --concurrency 1 8 32 --requests 1000 --output before.json
+    python benchmarks/bench_suite.py --concurrency 1 8 32 --requests 1000 --output after.json --compare before.json
+
+Settings such as DB_MODE and BILL_GROUP_COMMIT are read from the
+environment as usual. Needs httpx, as FastAPI's TestClient does.
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import platform
+import random
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+SCENARIOS = ("create_bill", "list_bills", "list_products", "customer_history", "bill_detail", "quote_cart")
+# Customers drawn for the history scenario, most active first
+HISTORY_CUSTOMERS = 10000
+# Bills drawn for the detail scenario, most recent first: receipts are mostly reopened soon after sale
+DETAIL_BILLS = 5000
+# Distinct carts the quote scenario re-prices, as a cashier adjusting a cart would
+QUOTE_CARTS = 500
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--database", help="existing SQLite file to run against instead of a seeded temporary one")
+    parser.add_argument("--products", type=int, default=10000, help="products to seed the temporary database with")
+    parser.add_argument("--bills", type=int, default=50000, help="bills to seed the temporary database with")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--requests", type=int, default=500, help="measured requests per scenario and concurrency")
+    parser.add_argument("--warmup", type=int, default=20, help="unmeasured requests before each scenario")
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--compare", help="results JSON of an earlier run to compare against")
+    parser.add_argument("--seed", type=int, default=42)
+    return parser.parse_args()
+
+
+def percentile(ordered, p: float) -> float:
+    """Nearest-rank percentile of sorted values"""
+    return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def build_scenarios(db, rng: random.Random) -> dict:
+    """Scenario name -> function returning the next (method, url, json body)"""
+    import models
+    import seed
+    from pricing import price_cart
+    from sqlalchemy import desc, select
+
+    products = seed.load_products(db)
+    weights = seed.popularity(len(products))
+    emails = db.scalars(
+        select(models.Customer.email).order_by(desc(models.Customer.bill_count)).limit(HISTORY_CUSTOMERS)
+    ).all() or ["bench@example.com"]
+    customer_weights = seed.popularity(len(emails), skew=0.8)
+    bill_ids = db.scalars(select(models.Bill.id).order_by(desc(models.Bill.id)).limit(DETAIL_BILLS)).all() or [1]
+    bill_weights = seed.popularity(len(bill_ids), skew=0.8)
+
+    def customer() -> str:
+        return rng.choices(emails, cum_weights=customer_weights)[0]
+
+    def priced_cart() -> dict:
+        cart = seed.random_cart(rng, products, weights)
+        total = price_cart(
+            (product.product_id, product.unit_price, product.tax_basis_points, quantity)
+            for product, quantity in cart.items()
+        ).total
+        return {
+            "items": [{"product_id": product.product_id, "quantity": quantity} for product, quantity in cart.items()],
+            "paid_amount": -(-total // seed.PAID_ROUNDING) * seed.PAID_ROUNDING / 100
+        }
+
+    def create_bill():
+        return "POST", "/bills", {"customer_email": customer(), **priced_cart()}
+
+    carts = [priced_cart() for _ in range(QUOTE_CARTS)]
+    cart_weights = seed.popularity(len(carts), skew=0.8)
+
+    return {
+        "create_bill": create_bill,
+        "list_bills": lambda: ("GET", "/bills?limit=50", None),
+        "list_products": lambda: ("GET", "/products", None),
+        "customer_history": lambda: ("GET", f"/customers/{customer()}/purchases?limit=50", None),
+        "bill_detail": lambda: ("GET", f"/bills/{rng.choices(bill_ids, cum_weights=bill_weights)[0]}", None),
+        "quote_cart": lambda: ("POST", "/bills/quote", rng.choices(carts, cum_weights=cart_weights)[0]),
+    }
+
+
+async def drive(client, next_request, concurrency: int, requests: int) -> dict:
+    """Send requests from concurrency clients; returns throughput and latency figures"""
+    latencies = []
+    errors = 0
+    remaining = requests
+
+    async def client_loop():
+        nonlocal remaining, errors
+        while remaining > 0:
+            remaining -= 1
+            method, url, body = next_request()
+            started = time.perf_counter()
+            response = await client.request(method, url, json=body)
+            latencies.append((time.perf_counter() - started) * 1000)
+            if response.status_code >= 400:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client_loop() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        "requests": requests,
+        "errors": errors,
+        "seconds": round(elapsed, 3),
+        "throughput_rps": round(requests / elapsed, 1),
+        "latency_ms": {
+            "mean": round(sum(latencies) / len(latencies), 3),
+            "p50": round(percentile(latencies, 50), 3),
+            "p95": round(percentile(latencies, 95), 3),
+            "p99": round(percentile(latencies, 99), 3),
+            "max": round(latencies[-1], 3),
+        },
+    }
+
+
+async def run_scenarios(args, scenarios: dict) -> list:
+    import httpx
+    import main
+
+    results = []
+    transport = httpx.ASGITransport(app=main.app)
+    async with main.lifespan(main.app), httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        print(f"{'scenario':<18} {'conc':>5} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'errors':>7}")
+        for name in args.scenarios:
+            await drive(client, scenarios[name], 1, args.warmup)
+            for concurrency in args.concurrency:
+                result = {"scenario": name, "concurrency": concurrency}
+                result.update(await drive(client, scenarios[name], concurrency, args.requests))
+                results.append(result)
+                latency = result["latency_ms"]
+                print(
+                    f"{name:<18} {concurrency:>5} {result['throughput_rps']:>9.1f} {latency['p50']:>9.2f} "
+                    f"{latency['p95']:>9.2f} {latency['p99']:>9.2f} {result['errors']:>7}"
+                )
+    return results
+
+
+def compare(results: list, path: str):
+    with open(path) as f:
+        previous = json.load(f)
+    before = {(r["scenario"], r["concurrency"]): r for r in previous["results"]}
+    print(f"\nCompared with {previous.get('commit', '?')} ({path})")
+    print(f"{'scenario':<18} {'conc':>5} {'req/s':>18} {'p95 ms':>20}")
+    for result in results:
+        old = before.get((result["scenario"], result["concurrency"]))
+        if old is None:
+            continue
+        throughput = (result["throughput_rps"] / old["throughput_rps"] - 1) * 100
+        p95 = (result["latency_ms"]["p95"] / old["latency_ms"]["p95"] - 1) * 100
+        print(
+            f"{result['scenario']:<18} {result['concurrency']:>5} "
+            f"{old['throughput_rps']:>7.1f} {throughput:>+8.1f}%  "
+            f"{old['latency_ms']['p95']:>9.2f} {p95:>+8.1f}%"
+        )
+
+
+def run():
+    args = parse_args()
+    path = os.path.abspath(args.database) if args.database else os.path.join(
+        tempfile.mkdtemp(prefix="billing-bench-"), "billing.db"
+    )
+    # Must be set before the app's modules read their settings
+    os.environ["DATABASE_URL"] = f"sqlite:///{path}"
+
+    import models
+    import seed
+    from app.config import settings
+    from database import SessionLocal, init_db
+    from sqlalchemy import func, select
+
+    rng = random.Random(args.seed)
+    init_db()
+    with SessionLocal() as db:
+        if not args.database:
+            seed.seed_defaults(db)
+            seed.generate_products(db, args.products, rng, 10000)
+            seed.generate_bills(db, args.bills, max(1, args.bills // 20), 365, rng, 10000)
+        dataset = {
+            name: db.scalar(select(func.count()).select_from(model))
+            for name, model in (("products", models.Product), ("bills", models.Bill), ("customers", models.Customer))
+        }
+        scenarios = build_scenarios(db, rng)
+
+    results = asyncio.run(run_scenarios(args, scenarios))
+    report = {
+        "commit": git_commit(),
+        "created_at": datetime.utcnow().isoformat(timespec="seconds") + "Z",
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "settings": {
+            name: getattr(settings, name)
+            for name in (
+                "DB_MODE", "BILL_GROUP_COMMIT", "METRICS_ENABLED", "QUERY_DEBUG", "SQLITE_SYNCHRONOUS",
+                "BILL_CACHE_MAX_BYTES", "QUOTE_CACHE_MAX_ENTRIES"
+            )
+        },
+        "dataset": dataset,
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nWrote {args.output}")
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    run()
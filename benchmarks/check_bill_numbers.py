@@ -0,0 +1,90 @@
+"""
+Check that bill numbers strictly increase when single and batch creates interleave.
+
+Seeds a throwaway SQLite database in a temporary directory (your local
+billing.db is never touched), then alternates POST /bills and POST
+/bills/batch (with some rejected bills in each batch) through TestClient.
+Single bills are numbered from the worker's reserved block and batches
+straight from the shared sequence, so the check fails, printing the
+numbers out of order, and exits 1 if any bill gets a number that is not
+higher than every bill created before it. Blocks are kept small (--block-size)
+so they run out during the run. Set BILL_GROUP_COMMIT=true to cover the
+group commit writer too.
+
+    python benchmarks/check_bill_numbers.py --rounds 50
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(tempfile.mkdtemp(prefix="billing-bench-"))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rounds", type=int, default=50, help="single bills, each followed by a batch")
+    parser.add_argument("--block-size", type=int, default=7, help="BILL_NUMBER_BLOCK_SIZE for the run")
+    parser.add_argument("--seed", type=int, default=42)
+    return parser.parse_args()
+
+
+def cart(rng: random.Random, valid: bool = True) -> dict:
+    return {
+        "customer_email": f"customer{rng.randrange(20)}@example.com",
+        "items": [{"product_id": f"P{rng.randrange(5)}" if valid else "MISSING", "quantity": 1}],
+        "paid_amount": 1000
+    }
+
+
+def run():
+    args = parse_args()
+    # Must be set before the app's modules read their settings
+    os.environ["BILL_NUMBER_BLOCK_SIZE"] = str(args.block_size)
+    from fastapi.testclient import TestClient
+    import main
+    from bill_numbers import bill_numbers
+    
+    rng = random.Random(args.seed)
+    created = []
+    with TestClient(main.app) as client:
+        for i in range(5):
+            client.post("/products", json={
+                "product_id": f"P{i}", "name": f"Item {i}", "available_stocks": 10 ** 9,
+                "price_per_unit": 10 + i, "tax_percentage": 18
+            })
+        for _ in range(args.rounds):
+            response = client.post("/bills", json=cart(rng))
+            response.raise_for_status()
+            created.append(("single", response.json()["bill_number"]))
+            batch = [cart(rng, valid=rng.random() > 0.2) for _ in range(rng.randint(1, 12))]
+            response = client.post("/bills/batch", json=batch)
+            response.raise_for_status()
+            created.extend(
+                ("batch", result["bill_number"]) for result in response.json()["results"] if result["status"] == "created"
+            )
+    
+    scope_length = len(bill_numbers.scope(bill_numbers.period()))
+    out_of_order = 0
+    highest = 0
+    for path, bill_number in created:
+        number = int(bill_number[scope_length:])
+        if number <= highest:
+            out_of_order += 1
+            print(f"{path:<7} {bill_number} after {bill_numbers.format(highest, bill_numbers.period())}")
+        highest = max(highest, number)
+    
+    singles = sum(path == "single" for path, _ in created)
+    print(f"{len(created)} bills ({singles} single, {len(created) - singles} in batches), "
+          f"numbers {created[0][1]} to {created[-1][1]}")
+    if out_of_order:
+        print(f"{out_of_order} bill(s) numbered lower than a bill created before them")
+        sys.exit(1)
+    print("Bill numbers strictly increase")
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,127 @@
+"""
+Check that every GET /bills/search filter combination is served from an index.
+
+Seeds a throwaway SQLite database in a temporary directory (your local
+billing.db is never touched), then runs EXPLAIN QUERY PLAN on the page query
+for every combination of filters, broad and narrow, with and without a
+cursor. Any full scan of bills or bill_items fails the check, except walking
+ix_bills_created_at in order, which the planner does on purpose when every
+filter is broad. Also reports how long each search takes.
+
+    python benchmarks/check_bill_search_plans.py --bills 50000
+"""
+import argparse
+import itertools
+import os
+import sys
+import tempfile
+import time
+from datetime import date
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(tempfile.mkdtemp(prefix="billing-bench-"))
+
+from sqlalchemy import String, cast, func, select  # noqa: E402
+
+from database import SessionLocal, init_db  # noqa: E402
+import bill_search  # noqa: E402
+import crud  # noqa: E402
+import models  # noqa: E402
+import schemas  # noqa: E402
+from app.sqlite import explain_query_plan  # noqa: E402
+
+ORDERED_WALK = f"SCAN bills USING INDEX {bill_search.CREATED_AT_INDEX}"
+
+# Each filter in a broad and a narrow form, for the data seeded below
+FILTERS = {
+    "date": [dict(start=date(2026, 1, 1), end=date(2026, 12, 31)), dict(start=date(2026, 3, 1), end=date(2026, 3, 1))],
+    "amount": [dict(min_amount=0), dict(min_amount=500, max_amount=500.5)],
+    "email": [dict(email_prefix="CUSTOMER1"), dict(email_prefix="customer42@")],
+    "product": [dict(product_id="P000"), dict(product_id="RARE")],
+}
+
+
+def seed(bills: int):
+    with SessionLocal() as db:
+        for product_id in [f"P{i:03d}" for i in range(200)] + ["RARE"]:
+            crud.create_product(db, schemas.ProductCreate(
+                product_id=product_id, name=f"Item {product_id}", available_stocks=10 ** 9,
+                price_per_unit=10 + len(product_id), tax_percentage=18
+            ))
+    batch = []
+    for j in range(bills):
+        items = [schemas.BillItemCreate(product_id="P000" if j % 2 else f"P{j % 199 + 1:03d}", quantity=1 + j % 50)]
+        if j % 5000 == 0:
+            items.append(schemas.BillItemCreate(product_id="RARE", quantity=1))
+        batch.append(schemas.BillCreate(
+            customer_email=f"customer{j % 2000}@example.com", items=items, paid_amount=10 ** 6
+        ))
+        if len(batch) == 10000 or j == bills - 1:
+            with SessionLocal() as db:
+                crud.create_bills_batch(db, batch)
+            batch = []
+    # Spread the bills over a year
+    with SessionLocal() as db:
+        db.execute(models.Bill.__table__.update().values(
+            created_at=func.strftime(
+                "%Y-%m-%d %H:%M:%f000", "2026-01-01", "+" + cast(models.Bill.id % 365, String) + " days"
+            )
+        ))
+        db.commit()
+
+
+def run():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--bills", type=int, default=50000)
+    args = parser.parse_args()
+
+    init_db()
+    seed(args.bills)
+
+    failures = 0
+    print(f"{'filters':<40} {'driver':<34} {'ms':>7}  plan")
+    with SessionLocal() as db:
+        cursor = crud.get_all_bills(db, 10, include_items=False).next_cursor
+        combinations = []
+        for size in range(len(FILTERS) + 1):
+            for names in itertools.combinations(FILTERS, size):
+                for forms in itertools.product(*(range(2) for _ in names)):
+                    combinations.append({name: form for name, form in zip(names, forms)})
+
+        for chosen in combinations:
+            for page_cursor in (None, cursor):
+                values = {}
+                for name, form in chosen.items():
+                    values.update(FILTERS[name][form])
+                filters = bill_search.BillFilters(**values)
+                label = " ".join(f"{name}:{'narrow' if form else 'broad'}" for name, form in chosen.items()) or "none"
+                if page_cursor:
+                    label += " +cursor"
+
+                hint, _ = bill_search.plan(db, filters)
+                query = crud.keyset_bills(bill_search.filtered_query(db, filters), 50, page_cursor)
+                plan = explain_query_plan(db.connection(), query.statement)
+                scans = [line for line in plan if line.startswith("SCAN") and line != ORDERED_WALK]
+
+                started = time.perf_counter()
+                bill_search.search_bills(db, filters, 50, page_cursor, include_items=True)
+                elapsed = (time.perf_counter() - started) * 1000
+
+                failures += bool(scans)
+                print(f"{label:<40} {hint:<34} {elapsed:>7.2f}  {'FULL SCAN ' if scans else ''}{' | '.join(plan)}")
+
+        # Line items for a page are loaded with bill_id IN (...)
+        items = explain_query_plan(
+            db.connection(), select(models.BillItem).where(models.BillItem.bill_id.in_([1, 2, 3]))
+        )
+        items_scan = any(line.startswith("SCAN") for line in items)
+        failures += items_scan
+        print(f"{'page items':<40} {'':<34} {'':>7}  {'FULL SCAN ' if items_scan else ''}{' | '.join(items)}")
+
+    print(f"\n{failures} plan(s) with full scans" if failures else "\nEvery combination uses an index")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    run()
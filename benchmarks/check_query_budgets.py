@@ -0,0 +1,125 @@
+"""
+Check that the main endpoints stay within their SQL statement budgets.
+
+Seeds a throwaway SQLite database in a temporary directory (your local
+billing.db is never touched) and calls each endpoint through TestClient
+twice: with a small and a large page, cart or batch. Both calls must run
+at most the endpoint's budget of statements, the large call must not run
+more statements than the small one, and no statement template may run
+more than once, which is what an N+1 pattern looks like. Transaction
+control statements are not counted. Prints every statement of a failing
+call and exits 1.
+
+    python benchmarks/check_query_budgets.py
+"""
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(tempfile.mkdtemp(prefix="billing-bench-"))
+
+from fastapi.testclient import TestClient  # noqa: E402
+
+from database import SessionLocal  # noqa: E402
+from query_budget import QueryBudgetExceeded, query_budget  # noqa: E402
+import crud  # noqa: E402
+import main  # noqa: E402
+import schemas  # noqa: E402
+
+PRODUCTS = 30
+BILLS = 600
+MAX_REPEATS = 1
+
+
+def cart(lines: int, offset: int = 0) -> dict:
+    return {
+        "customer_email": f"customer{offset % 7}@example.com",
+        "items": [{"product_id": f"P{(offset + k) % PRODUCTS:03d}", "quantity": 1} for k in range(lines)],
+        "paid_amount": 10 ** 6
+    }
+
+
+# (label, method, small request, large request, statement budget); requests
+# expect a 200 unless they give another status as "expect"
+CHECKS = [
+    ("GET /bills", "GET", dict(url="/bills?limit=5"), dict(url="/bills?limit=500"), 2),
+    ("GET /bills without items", "GET",
+     dict(url="/bills?limit=5&include_items=false"), dict(url="/bills?limit=500&include_items=false"), 1),
+    ("GET /bills/{bill_id}", "GET", dict(url="/bills/1"), dict(url="/bills/2"), 1),
+    ("GET /bills/search by email", "GET",
+     dict(url="/bills/search?email=customer3&limit=5"), dict(url="/bills/search?email=customer3&limit=500"), 3),
+    ("GET /bills/search by product", "GET",
+     dict(url="/bills/search?product_id=P007&limit=5"), dict(url="/bills/search?product_id=P007&limit=500"), 4),
+    ("GET /customers/{email}/purchases", "GET",
+     dict(url="/customers/customer2@example.com/purchases?limit=5"),
+     dict(url="/customers/customer2@example.com/purchases?limit=500"), 3),
+    ("POST /bills", "POST", dict(url="/bills", json=cart(1)), dict(url="/bills", json=cart(PRODUCTS)), 12),
+    ("POST /bills empty or negative cart", "POST",
+     dict(url="/bills", json={**cart(0), "items": []}, expect=422),
+     dict(url="/bills", json={**cart(0), "items": [{"product_id": "P001", "quantity": -3}]}, expect=422), 0),
+    ("POST /bills quantity over INTEGER", "POST",
+     dict(url="/bills", json={**cart(0), "items": [{"product_id": "P001", "quantity": 2 ** 64}]}, expect=400),
+     dict(url="/bills", json={**cart(0), "items": [{"product_id": "P001", "quantity": 2 ** 62}] * 2}, expect=400), 1),
+    ("POST /bills/quote", "POST", dict(url="/bills/quote", json=cart(1)), dict(url="/bills/quote", json=cart(PRODUCTS)), 1),
+    ("POST /bills/batch", "POST",
+     dict(url="/bills/batch", json=[cart(3, j) for j in range(5)]),
+     dict(url="/bills/batch", json=[cart(3, j) for j in range(200)]), 13),
+    ("GET /products", "GET", dict(url="/products"), dict(url="/products"), 1),
+    ("GET /products/search", "GET", dict(url="/products/search?q=item&limit=5"), dict(url="/products/search?q=item&limit=100"), 3),
+    ("GET /analytics/sales", "GET",
+     dict(url="/analytics/sales?granularity=day"), dict(url="/analytics/sales?granularity=hour"), 2),
+    ("GET /analytics/products/top", "GET",
+     dict(url="/analytics/products/top?limit=5"), dict(url="/analytics/products/top?limit=30"), 1),
+    ("GET /exports/bills", "GET", dict(url="/exports/bills?format=ndjson"), dict(url="/exports/bills?format=csv"), 2),
+]
+
+
+def seed(client: TestClient):
+    for i in range(PRODUCTS):
+        client.post("/products", json={
+            "product_id": f"P{i:03d}", "name": f"Item {i}", "available_stocks": 10 ** 9,
+            "price_per_unit": 10 + i, "tax_percentage": 18
+        })
+    with SessionLocal() as db:
+        crud.create_bills_batch(db, [schemas.BillCreate(**cart(3, j)) for j in range(BILLS)])
+
+
+def run():
+    client = TestClient(main.app)
+    failures = 0
+    with client:
+        seed(client)
+        print(f"{'endpoint':<36} {'small':>5} {'large':>5} {'budget':>6}")
+        for label, method, small, large, budget in CHECKS:
+            counts = []
+            problems = []
+            for request in (small, large):
+                request = dict(request)
+                expect = request.pop("expect", 200)
+                try:
+                    with query_budget(budget, MAX_REPEATS, label) as log:
+                        response = client.request(method, **request)
+                except QueryBudgetExceeded as e:
+                    problems.append(str(e))
+                    log = None
+                else:
+                    if response.status_code != expect:
+                        problems.append(f"{label} {request['url']} returned {response.status_code}: {response.text}")
+                counts.append(log.count if log else None)
+            if None not in counts and counts[1] > counts[0]:
+                problems.append(f"{label} ran {counts[1]} statements for the large request, {counts[0]} for the small one")
+            
+            failures += bool(problems)
+            shown = [str(count) if count is not None else "over" for count in counts]
+            print(f"{label:<36} {shown[0]:>5} {shown[1]:>5} {budget:>6}  {'FAIL' if problems else 'ok'}")
+            for problem in problems:
+                print("    " + problem.replace("\n", "\n    "))
+    
+    print(f"\n{failures} endpoint(s) over budget" if failures else "\nEvery endpoint is within budget")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,113 @@
+"""
+Cache of GET /bills/{bill_id} response bodies.
+
+A committed bill never changes, so its detail response is encoded once
+and kept as bytes in a bounded LRU keyed by bill id. POST /bills (with or
+without group commit) fills it with the bill it just created, built from
+the response and the catalog's products, so reopening a fresh receipt
+never touches the database. A miss reads the bill and its items as row
+tuples in one statement, the same SQL projection as fields=, instead of
+building ORM objects. Hits need no database session at all.
+
+Responses carry a strong ETag derived from the body and BILL_CACHE_CONTROL,
+`public, max-age=31536000, immutable` by default, so browsers and proxies
+reuse a receipt without asking again. Set it to `private, ...` to keep
+shared proxies from storing customer emails.
+
+The only part of a bill detail that can change is the name and product_id
+of its products. The catalog bumps naming_version whenever one changes or
+a product is deleted, and entries stored under an older version count as
+misses. Renames made by other workers are seen once this worker's catalog
+reloads (PRODUCT_CACHE_TTL_SECONDS). A browser that already cached a
+receipt keeps the name it first saw until its copy expires.
+
+Bodies are bounded by BILL_CACHE_MAX_BYTES, evicting the least recently
+read bills first; 0 turns the cache off. Hits, misses, entries and bytes
+are reported by GET /bills/cache/stats and in /metrics.
+"""
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+import metrics
+from app.config import settings
+from catalog import catalog
+
+bill_cache_requests = metrics.registry.add(metrics.Counter(
+    "bill_cache_requests_total", "GET /bills/{bill_id} lookups in the bill cache, by hit or miss", ("result",)
+))
+bill_cache_entries = metrics.registry.add(metrics.Gauge("bill_cache_entries", "Bills held in the bill cache"))
+bill_cache_bytes = metrics.registry.add(metrics.Gauge("bill_cache_bytes", "Size of the bill cache's response bodies"))
+
+
+def body_etag(body: bytes) -> str:
+    return f'"{hashlib.blake2b(body, digest_size=12).hexdigest()}"'
+
+
+class BillCache:
+    """LRU of encoded bill details by bill id, bounded by body size"""
+    
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # bill id -> (catalog naming_version when built, body, ETag), least recently read first
+        self._entries: "OrderedDict[int, Tuple[int, bytes, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def _drop(self, bill_id: int):
+        _, body, _ = self._entries.pop(bill_id)
+        self.bytes -= len(body)
+        bill_cache_entries.dec()
+        bill_cache_bytes.dec(amount=len(body))
+    
+    def get(self, bill_id: int) -> Optional[Tuple[bytes, str]]:
+        """The cached body and ETag of a bill, or None"""
+        with self._lock:
+            entry = self._entries.get(bill_id)
+            if entry is not None and entry[0] != catalog.naming_version:
+                self._drop(bill_id)
+                entry = None
+            if entry is None:
+                self.misses += 1
+            else:
+                self._entries.move_to_end(bill_id)
+                self.hits += 1
+        bill_cache_requests.inc(("miss",) if entry is None else ("hit",))
+        return None if entry is None else (entry[1], entry[2])
+    
+    def put(self, bill_id: int, body: bytes, naming_version: int) -> str:
+        """Cache a bill's body, built when the catalog was at naming_version; returns its ETag"""
+        etag = body_etag(body)
+        if len(body) > self.max_bytes:
+            return etag
+        with self._lock:
+            if bill_id in self._entries:
+                self._drop(bill_id)
+            self._entries[bill_id] = (naming_version, body, etag)
+            self.bytes += len(body)
+            bill_cache_entries.inc()
+            bill_cache_bytes.inc(amount=len(body))
+            while self.bytes > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+        return etag
+    
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else None,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "bytes": self.bytes,
+                "max_bytes": self.max_bytes,
+            }
+
+
+bill_cache = BillCache(max_bytes=settings.BILL_CACHE_MAX_BYTES)
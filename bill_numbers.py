@@ -0,0 +1,179 @@
+"""
+Bill number allocation.
+
+Numbers are handed out before a bill is inserted, so every bill is written
+once with its final number. They come from the bill_sequences table, one
+row per numbering scope (the prefix plus, when enabled, the financial
+year). Each worker process reserves a block of BILL_NUMBER_BLOCK_SIZE
+numbers at a time and serves bills from it in memory.
+
+Numbers are taken inside the caller's write transaction (after
+begin_write), and a new block is reserved on the caller's own connection:
+a second connection would wait on the write lock the caller holds, and in
+async mode goes through the async driver like the rest of the request
+rather than blocking the event loop. A block reserved by a transaction that
+rolls back is rolled back with it, so the worker drops it too.
+
+Blocks are taken from the shared sequence atomically, so numbers are never
+reused and each worker's numbers only ever increase; with several workers,
+bills created at about the same time may be numbered slightly out of
+order, and numbers left in a block when a worker stops or a bill is
+rejected are skipped. Set BILL_NUMBER_BLOCK_SIZE=1 for strictly increasing
+numbers across workers at the cost of one sequence write per bill.
+allocate_in() instead reserves exact counts inside the caller's own write
+transaction, for bulk inserts that already hold the lock. Those come from
+past the end of the worker's current block, so it drops that block: the
+next allocate() reserves a new one, and numbers keep increasing across
+both paths.
+"""
+import threading
+from datetime import date
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import event, select, text
+from sqlalchemy.orm import Session
+
+import models
+from app.config import settings
+from utils import generate_bill_number
+
+_RESERVE = text(
+    "INSERT INTO bill_sequences (scope, next_value) VALUES (:scope, :seed + :count) "
+    "ON CONFLICT (scope) DO UPDATE SET next_value = next_value + :count "
+    "RETURNING next_value"
+)
+# Highest number among bills whose bill_number is the scope followed by digits
+_HIGHEST = text(
+    "SELECT max(CAST(substr(bill_number, :suffix) AS INTEGER)) FROM bills "
+    "WHERE bill_number >= :scope AND bill_number < :scope_end "
+    "AND substr(bill_number, :suffix) NOT GLOB '*[^0-9]*'"
+)
+
+
+class BillNumberAllocator:
+    """Hands out bill numbers from per-process blocks of a shared sequence"""
+    
+    def __init__(
+        self,
+        prefix: str = "BILL",
+        width: int = 6,
+        fy_start_month: int = 0,
+        block_size: int = 50
+    ):
+        self.prefix = prefix
+        self.width = width
+        self.fy_start_month = fy_start_month
+        self.block_size = max(block_size, 1)
+        # scope -> [next unused, end of block (exclusive)]
+        self._blocks: Dict[str, List[int]] = {}
+        # Engines whose transactions are watched for blocks reserved and rolled back
+        self._engines = set()
+        self._lock = threading.Lock()
+    
+    def period(self, today: Optional[date] = None) -> Optional[str]:
+        """Financial year label such as "2026-27", or None when numbering never resets"""
+        if not self.fy_start_month:
+            return None
+        today = today or date.today()
+        start = today.year if today.month >= self.fy_start_month else today.year - 1
+        return f"{start}-{(start + 1) % 100:02d}"
+    
+    def format(self, number: int, period: Optional[str]) -> str:
+        return generate_bill_number(number, prefix=self.prefix, period=period, width=self.width)
+    
+    def scope(self, period: Optional[str]) -> str:
+        """Everything before the sequence number, e.g. "BILL-" or "BILL-2026-27-" """
+        return self.format(0, period)[:-self.width]
+    
+    def allocate(self, db: Session, count: int = 1) -> List[str]:
+        """Take count numbers from this process's block, reserving more as needed.
+        
+        Call in the caller's write transaction: a new block is reserved on its
+        connection, and kept only if that transaction commits.
+        """
+        period = self.period()
+        scope = self.scope(period)
+        numbers = []
+        while len(numbers) < count:
+            with self._lock:
+                block = self._blocks.get(scope)
+                if block is not None and block[0] < block[1]:
+                    take = min(count - len(numbers), block[1] - block[0])
+                    numbers.extend(range(block[0], block[0] + take))
+                    block[0] += take
+                    continue
+            # Reserved outside the lock, which must not be held across I/O on the event loop
+            connection = db.connection()
+            block = list(self._reserve_on(connection, scope, max(self.block_size, count - len(numbers))))
+            self._watch(connection.engine)
+            connection.info.setdefault(self, []).append((scope, block))
+            with self._lock:
+                self._blocks[scope] = block
+        return [self.format(number, period) for number in numbers]
+    
+    def allocate_in(self, db: Session, count: int) -> List[str]:
+        """Reserve exactly count numbers in the caller's write transaction.
+        
+        Drops this process's block in the scope, whose remaining numbers are
+        lower than these, so later allocate() calls continue above them.
+        """
+        if count <= 0:
+            return []
+        period = self.period()
+        scope = self.scope(period)
+        start, end = self._reserve_on(db.connection(), scope, count)
+        with self._lock:
+            self._blocks.pop(scope, None)
+        return [self.format(number, period) for number in range(start, end)]
+    
+    def _watch(self, engine):
+        with self._lock:
+            if engine in self._engines:
+                return
+            self._engines.add(engine)
+        event.listen(engine, "begin", self._forget)
+        event.listen(engine, "rollback", self._drop)
+    
+    def _forget(self, connection):
+        """A new transaction: blocks reserved by the connection's last one were committed"""
+        connection.info.pop(self, None)
+    
+    def _drop(self, connection):
+        """Drop blocks whose reservation this rollback undoes, unless already replaced"""
+        reserved = connection.info.pop(self, None)
+        if not reserved:
+            return
+        with self._lock:
+            for scope, block in reserved:
+                if self._blocks.get(scope) is block:
+                    del self._blocks[scope]
+    
+    def _reserve_on(self, connection, scope: str, count: int) -> Tuple[int, int]:
+        """Advance the scope's sequence by count and return the reserved [start, end)"""
+        seed = 1
+        exists = connection.execute(
+            select(models.BillSequence.next_value).where(models.BillSequence.scope == scope)
+        ).first()
+        if exists is None:
+            seed = self._seed(connection, scope)
+        end = connection.execute(_RESERVE, {"scope": scope, "seed": seed, "count": count}).scalar_one()
+        return end - count, end
+    
+    def _seed(self, connection, scope: str) -> int:
+        """Start a new scope after any bills already numbered in it, e.g. by older versions"""
+        # A range on the bill_number index rather than LIKE, which is case-insensitive
+        # and cannot use it; the range also holds longer scopes (e.g. "BILL-2026-27-"
+        # under "BILL-"), whose suffixes are not all digits
+        highest = connection.execute(_HIGHEST, {
+            "scope": scope,
+            "scope_end": scope[:-1] + chr(ord(scope[-1]) + 1),
+            "suffix": len(scope) + 1
+        }).scalar()
+        return (highest or 0) + 1
+
+bill_numbers = BillNumberAllocator(
+    prefix=settings.BILL_NUMBER_PREFIX,
+    width=settings.BILL_NUMBER_WIDTH,
+    fy_start_month=settings.BILL_NUMBER_FY_START_MONTH,
+    block_size=settings.BILL_NUMBER_BLOCK_SIZE
+)
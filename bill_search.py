@@ -0,0 +1,163 @@
+"""
+Multi-criteria bill search for support staff.
+
+Bills can be filtered by creation date, total amount, customer email
+prefix and whether they contain a product, newest first in keyset pages.
+Each filter has an index that can drive the query:
+
+    date range      ix_bills_created_at, which also gives the sort order
+    amount range    ix_bills_total_amount
+    email prefix    ix_bills_customer_email (NOCASE, so LIKE 'prefix%' can use it)
+    product         ix_bill_items_product_id_bill_id, then bills by rowid
+
+Without ANALYZE statistics SQLite often guesses wrong between them, so
+plan() counts each filter's matches in its index, up to PROBE_ROWS, drives
+the query from the most selective one and pins it with INDEXED BY. When
+every filter matches at least PROBE_ROWS bills, walking ix_bills_created_at
+in order and stopping after one page is cheaper than sorting the matches.
+"""
+from dataclasses import dataclass
+from datetime import date, datetime, time, timedelta
+from typing import List, Optional, Tuple
+
+from sqlalchemy import exists, func, select
+from sqlalchemy.orm import Query, Session
+
+import crud
+import models
+import schemas
+import serialization
+
+PROBE_ROWS = 1000
+
+CREATED_AT_INDEX = "ix_bills_created_at"
+AMOUNT_INDEX = "ix_bills_total_amount"
+EMAIL_INDEX = "ix_bills_customer_email"
+PRODUCT_INDEX = "ix_bill_items_product_id_bill_id"
+
+
+@dataclass(frozen=True)
+class BillFilters:
+    start: Optional[date] = None  # inclusive
+    end: Optional[date] = None  # inclusive
+    min_amount: Optional[float] = None
+    max_amount: Optional[float] = None
+    email_prefix: Optional[str] = None  # case-insensitive
+    product_id: Optional[str] = None
+
+
+@dataclass
+class Candidate:
+    index: str
+    clauses: list
+    probe: object  # a select of the rows this filter matches, read from its index
+    driving_clauses: Optional[list] = None  # replaces clauses when this index drives the query
+
+
+def like_prefix(prefix: str) -> str:
+    """LIKE pattern matching strings that start with prefix, escaping wildcards with a backslash"""
+    return prefix.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+
+
+def candidates(db: Session, filters: BillFilters) -> Optional[List[Candidate]]:
+    """The filters as candidate driving indexes; None if no bill can match"""
+    bills = models.Bill
+    found = []
+    
+    def on_bills(index: str, *clauses):
+        probe = select(bills.id).with_hint(bills, f"INDEXED BY {index}").where(*clauses)
+        found.append(Candidate(index, list(clauses), probe))
+    
+    if filters.start or filters.end:
+        clauses = []
+        if filters.start:
+            clauses.append(bills.created_at >= datetime.combine(filters.start, time.min))
+        if filters.end:
+            clauses.append(bills.created_at < datetime.combine(filters.end + timedelta(days=1), time.min))
+        on_bills(CREATED_AT_INDEX, *clauses)
+    
+    if filters.min_amount is not None or filters.max_amount is not None:
+        clauses = []
+        if filters.min_amount is not None:
+            clauses.append(bills.total_amount >= filters.min_amount)
+        if filters.max_amount is not None:
+            clauses.append(bills.total_amount <= filters.max_amount)
+        on_bills(AMOUNT_INDEX, *clauses)
+    
+    if filters.email_prefix:
+        on_bills(EMAIL_INDEX, bills.customer_email.like(like_prefix(filters.email_prefix), escape="\\"))
+    
+    if filters.product_id:
+        product_pk = db.scalar(select(models.Product.id).where(models.Product.product_id == filters.product_id))
+        if product_pk is None:
+            return None
+        items = select(models.BillItem.bill_id).where(models.BillItem.product_id == product_pk)
+        # As a secondary filter, one index lookup per bill beats building the list of all its bills
+        contains = exists().where(models.BillItem.product_id == product_pk, models.BillItem.bill_id == bills.id)
+        found.append(Candidate(PRODUCT_INDEX, [contains], items, driving_clauses=[bills.id.in_(items)]))
+    
+    return found
+
+
+def plan(db: Session, filters: BillFilters) -> Optional[Tuple[str, list]]:
+    """Pick the driving index; returns (bills table hint, where clauses), or None if no bill can match"""
+    found = candidates(db, filters)
+    if found is None:
+        return None
+    
+    driver = CREATED_AT_INDEX
+    if any(candidate.index != CREATED_AT_INDEX for candidate in found):
+        matches = {
+            candidate.index: db.scalar(select(func.count()).select_from(candidate.probe.limit(PROBE_ROWS).subquery()))
+            for candidate in found
+        }
+        best = min(matches, key=matches.get)
+        if matches[best] < PROBE_ROWS:
+            driver = best
+    
+    # Driven from bill_items, bills are then fetched by rowid, which NOT INDEXED still allows
+    hint = "NOT INDEXED" if driver == PRODUCT_INDEX else f"INDEXED BY {driver}"
+    clauses = []
+    for candidate in found:
+        if candidate.index == driver and candidate.driving_clauses:
+            clauses.extend(candidate.driving_clauses)
+        else:
+            clauses.extend(candidate.clauses)
+    return hint, clauses
+
+
+def filtered_query(db: Session, filters: BillFilters) -> Optional[Query]:
+    """Bills matching every filter, read through the planned index; None if no bill can match"""
+    planned = plan(db, filters)
+    if planned is None:
+        return None
+    hint, clauses = planned
+    return db.query(models.Bill).with_hint(models.Bill, hint).filter(*clauses)
+
+
+def search_bills(
+    db: Session,
+    filters: BillFilters,
+    limit: int,
+    cursor: Optional[str] = None,
+    include_items: bool = True
+) -> schemas.BillPage:
+    """Bills matching every given filter, newest first, one keyset page at a time"""
+    query = filtered_query(db, filters)
+    if query is None:
+        return schemas.BillPage(items=[], next_cursor=None)
+    return crud.page_bills(query, limit, cursor, include_items)
+
+
+def search_bills_json(
+    db: Session,
+    filters: BillFilters,
+    limit: int,
+    cursor: Optional[str] = None,
+    fields: serialization.BillFields = serialization.FULL_BILL
+) -> bytes:
+    """search_bills projected to fields and encoded straight to a JSON body"""
+    query = filtered_query(db, filters)
+    if query is None:
+        return serialization.dumps({"items": [], "next_cursor": None})
+    return serialization.dumps(crud.page_bill_rows(query, limit, cursor, fields))
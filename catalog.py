@@ -0,0 +1,282 @@
+"""
+Process-local product catalog cache.
+
+Holds every product as a ProductResponse keyed by product_id, loaded from
+the database on first use and kept current in place by the product routes
+and by bill stock decrements after they commit. Each worker process has its
+own copy; set PRODUCT_CACHE_TTL_SECONDS when running several workers so
+changes made by the others are picked up. create_bill takes stock, price
+and tax from the products table itself, so a stale cached count never
+oversells and a stale price is never billed. When the prices it reads
+differ from the cached ones, check_prices() expires the cache so this
+worker reloads it.
+
+Every change bumps a version counter and is recorded in a change log, which
+backs the ETag on GET /products and delta sync on GET /products/changes.
+Versions are qualified by a random epoch that changes whenever the catalog
+is rebuilt from scratch, so a token from a previous process or an
+invalidated catalog never matches. The encoded JSON of the whole catalog,
+and of up to MAX_CACHED_BODIES fields= projections of it, is cached for
+the fast path of GET /products and re-encoded on the first request after
+a change.
+"""
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+import models
+import schemas
+import serialization
+from app.config import settings
+
+# Encoded GET /products bodies kept, one per fields= projection
+MAX_CACHED_BODIES = 8
+
+
+class ProductCatalog:
+    """Cache of the products table with hit/miss stats, a version counter and a change log"""
+    
+    def __init__(self, ttl: float = 0.0):
+        self.ttl = ttl
+        self.epoch = uuid.uuid4().hex[:12]
+        self.version = 0
+        # Bumped when a product's name or product_id changes or it is deleted,
+        # which is all bill_cache's cached bills show of products
+        self.naming_version = 0
+        # Bumped when anything a quote shows changes: a product's name,
+        # price or tax, or its deletion; quotes.py keys its memo on it
+        self.pricing_version = 0
+        self.hits = 0
+        self.misses = 0
+        self._products: Dict[str, schemas.ProductResponse] = {}
+        # product_id -> (version of its latest change, deleted?), oldest change first
+        self._changes: "OrderedDict[str, Tuple[int, bool]]" = OrderedDict()
+        self._loaded_at: Optional[float] = None
+        # Set by expire() to reload on next access, as a TTL reload would
+        self._expired = False
+        # fields -> (token, encoded products) of the last snapshot_json() of that projection
+        self._bodies: Dict[Tuple[str, ...], Tuple[str, bytes]] = {}
+        self._lock = threading.RLock()
+    
+    @property
+    def token(self) -> str:
+        """Opaque version token clients pass back as ?since="""
+        return f"{self.epoch}-{self.version}"
+    
+    @property
+    def etag(self) -> str:
+        return f'"{self.token}"'
+    
+    def _touch(self, product_id: str, deleted: bool = False):
+        self.version += 1
+        self._changes[product_id] = (self.version, deleted)
+        self._changes.move_to_end(product_id)
+    
+    def _is_fresh(self) -> bool:
+        if self._loaded_at is None or self._expired:
+            return False
+        return not self.ttl or time.monotonic() - self._loaded_at < self.ttl
+    
+    def _ensure_loaded(self, db: Session):
+        if self._is_fresh():
+            self.hits += 1
+            return
+        with self._lock:
+            if self._is_fresh():
+                self.hits += 1
+                return
+            self.misses += 1
+            products = {
+                product.product_id: schemas.ProductResponse.model_validate(product)
+                for product in db.query(models.Product)
+            }
+            if self._loaded_at is None:
+                # First load: start a new epoch with an empty change log
+                self.epoch = uuid.uuid4().hex[:12]
+                self._changes.clear()
+                self.version += 1
+            else:
+                # TTL reload: record only what other processes changed
+                for product_id, product in products.items():
+                    previous = self._products.get(product_id)
+                    if previous != product:
+                        self._touch(product_id)
+                        self._note_change(previous, product)
+                for product_id in self._products.keys() - products.keys():
+                    self._touch(product_id, deleted=True)
+                    self.naming_version += 1
+                    self.pricing_version += 1
+            self._products = products
+            self._loaded_at = time.monotonic()
+            self._expired = False
+    
+    def all(self, db: Session) -> List[schemas.ProductResponse]:
+        self._ensure_loaded(db)
+        return list(self._products.values())
+    
+    def snapshot(self, db: Session) -> Tuple[List[schemas.ProductResponse], str]:
+        """Return all products together with the ETag that describes them"""
+        self._ensure_loaded(db)
+        with self._lock:
+            return list(self._products.values()), self.etag
+    
+    def snapshot_json(self, db: Session, fields: Tuple[str, ...] = serialization.PRODUCT_FIELDS) -> Tuple[bytes, str]:
+        """snapshot() projected to fields and encoded as a JSON body, with an ETag for that projection.
+        
+        Each projection is encoded once per catalog version.
+        """
+        self._ensure_loaded(db)
+        with self._lock:
+            token = self.token
+            etag = self.etag if fields == serialization.PRODUCT_FIELDS else f'"{token}.{"+".join(fields)}"'
+            cached = self._bodies.get(fields)
+            if cached is not None and cached[0] == token:
+                return cached[1], etag
+            products = list(self._products.values())
+        # Encode outside the lock so writers are not held up; a concurrent
+        # change only means this body is not cached
+        body = serialization.products_json(products, fields)
+        with self._lock:
+            if self.token == token:
+                if len(self._bodies) >= MAX_CACHED_BODIES and fields not in self._bodies:
+                    self._bodies.clear()
+                self._bodies[fields] = (token, body)
+        return body, etag
+    
+    def get(self, db: Session, product_id: str) -> Optional[schemas.ProductResponse]:
+        self._ensure_loaded(db)
+        return self._products.get(product_id)
+    
+    def get_many(self, db: Session, product_ids: Iterable[str]) -> Dict[str, schemas.ProductResponse]:
+        self._ensure_loaded(db)
+        products = self._products
+        return {pid: products[pid] for pid in product_ids if pid in products}
+    
+    def changes_since(self, db: Session, since: Optional[str]) -> schemas.ProductChanges:
+        """Return products changed after the since token, or everything if it is unusable"""
+        self._ensure_loaded(db)
+        with self._lock:
+            epoch, _, version = (since or "").partition("-")
+            if epoch != self.epoch or not version.isdigit() or int(version) > self.version:
+                return schemas.ProductChanges(
+                    version=self.token,
+                    full=True,
+                    products=list(self._products.values()),
+                    deleted=[]
+                )
+            
+            since_version = int(version)
+            products, deleted = [], []
+            for product_id, (changed_at, is_deleted) in reversed(self._changes.items()):
+                if changed_at <= since_version:
+                    break
+                if is_deleted:
+                    deleted.append(product_id)
+                elif product_id in self._products:
+                    products.append(self._products[product_id])
+            return schemas.ProductChanges(
+                version=self.token,
+                full=False,
+                products=products,
+                deleted=deleted
+            )
+    
+    def _note_change(self, previous: Optional[schemas.ProductResponse], product: schemas.ProductResponse):
+        """Bump naming_version and pricing_version for what changed between two versions of a product"""
+        if previous is None:
+            return
+        if previous.name != product.name:
+            self.naming_version += 1
+        if (previous.name, previous.price_per_unit, previous.tax_percentage) != (
+            product.name, product.price_per_unit, product.tax_percentage
+        ):
+            self.pricing_version += 1
+    
+    def _store(self, product: schemas.ProductResponse):
+        if self._loaded_at is None:
+            # The previous product is unknown, so assume it changed
+            self.naming_version += 1
+            self.pricing_version += 1
+        else:
+            self._note_change(self._products.get(product.product_id), product)
+            self._products[product.product_id] = product
+        self._touch(product.product_id)
+    
+    def put(self, product: schemas.ProductResponse):
+        """Insert or replace a product after its write has committed"""
+        with self._lock:
+            self._store(product)
+    
+    def put_many(self, products: Iterable[schemas.ProductResponse]):
+        """put() for a whole batch under one lock, e.g. a chunk of a bulk import"""
+        with self._lock:
+            for product in products:
+                self._store(product)
+    
+    def remove(self, product_id: str):
+        """Drop a product after its delete has committed, or under its old product_id after a rename"""
+        with self._lock:
+            self._products.pop(product_id, None)
+            self._touch(product_id, deleted=True)
+            self.naming_version += 1
+            self.pricing_version += 1
+    
+    def apply_sale(self, quantities: Dict[str, int]):
+        """Decrement cached stock after a bill has committed"""
+        with self._lock:
+            for product_id, quantity in quantities.items():
+                product = self._products.get(product_id)
+                if product is not None:
+                    self._products[product_id] = product.model_copy(
+                        update={"available_stocks": product.available_stocks - quantity}
+                    )
+                    self._touch(product_id)
+    
+    def expire(self):
+        """Reload on next access, recording what changed like a TTL reload does"""
+        with self._lock:
+            self._expired = True
+    
+    def check_prices(self, rows: Iterable):
+        """Expire the cache if products read from the table disagree with it on price or tax.
+        
+        rows carry product_id, price_per_unit and tax_percentage, as returned
+        by create_bill's stock UPDATE; a difference means another worker
+        changed the product since this one cached it.
+        """
+        if self._loaded_at is None or self._expired:
+            return
+        products = self._products
+        for row in rows:
+            cached = products.get(row.product_id)
+            if cached is None or (cached.price_per_unit, cached.tax_percentage) != (
+                row.price_per_unit, row.tax_percentage
+            ):
+                self.expire()
+                return
+    
+    def invalidate(self):
+        """Force a full reload (and a new epoch) on next access, e.g. after writes made outside the API"""
+        with self._lock:
+            self._loaded_at = None
+            self._products = {}
+            self._changes.clear()
+            self._bodies.clear()
+            self.naming_version += 1
+            self.pricing_version += 1
+    
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "size": len(self._products),
+            "version": self.version,
+            "epoch": self.epoch,
+        }
+
+
+catalog = ProductCatalog(ttl=settings.PRODUCT_CACHE_TTL_SECONDS)
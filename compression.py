@@ -0,0 +1,100 @@
+"""
+Negotiated compression of JSON, text and CSV responses.
+
+CompressionMiddleware compresses complete responses of at least
+COMPRESSION_MIN_BYTES with brotli, when the brotli package is installed and
+the client's Accept-Encoding allows br, or else with gzip. Smaller bodies
+are sent as they are: below about a kilobyte the headers and the CPU cost
+outweigh the saving. Streamed responses pass through untouched, including
+GET /exports/bills, which gzips itself chunk by chunk, as does anything
+that already has a Content-Encoding.
+
+Every response it could compress gets Vary: Accept-Encoding. Compressed
+responses get a weak ETag, as their bytes differ from the uncompressed
+representation; etag_matches() accepts it back in If-None-Match. Large
+bodies are compressed in the threadpool so the event loop keeps serving
+other requests.
+"""
+import gzip
+from typing import Optional
+
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers, MutableHeaders
+
+from app.config import settings
+from utils import accepts_encoding
+
+try:
+    import brotli
+except ImportError:  # optional: gzip only
+    brotli = None
+
+COMPRESSIBLE_TYPES = ("application/json", "application/x-ndjson", "text/")
+# Bodies at least this large are compressed off the event loop
+THREADPOOL_MIN_BYTES = 65536
+
+
+def negotiate(accept_encoding: Optional[str]) -> Optional[str]:
+    """The content coding to use for a request's Accept-Encoding: br, gzip or None"""
+    if brotli is not None and accepts_encoding(accept_encoding, "br"):
+        return "br"
+    if accepts_encoding(accept_encoding, "gzip"):
+        return "gzip"
+    return None
+
+
+def compress(coding: str, body: bytes) -> bytes:
+    if coding == "br":
+        return brotli.compress(body, quality=settings.COMPRESSION_BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=settings.COMPRESSION_GZIP_LEVEL, mtime=0)
+
+
+def is_compressible(headers: Headers) -> bool:
+    return headers.get("content-type", "").startswith(COMPRESSIBLE_TYPES) and "content-encoding" not in headers
+
+
+class CompressionMiddleware:
+    """ASGI middleware compressing complete responses the client accepts compressed"""
+    
+    def __init__(self, app, minimum_size: int = settings.COMPRESSION_MIN_BYTES):
+        self.app = app
+        self.minimum_size = minimum_size
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        
+        coding = negotiate(Headers(scope=scope).get("accept-encoding"))
+        # Start message held back until the first body message shows whether the response is complete
+        pending = None
+        
+        async def send_compressed(message):
+            nonlocal pending
+            if message["type"] == "http.response.start":
+                if is_compressible(Headers(raw=message["headers"])):
+                    headers = MutableHeaders(scope=message)
+                    if "accept-encoding" not in headers.get("vary", "").lower():
+                        headers.add_vary_header("Accept-Encoding")
+                    if coding is not None:
+                        pending = message
+                        return
+            elif message["type"] == "http.response.body" and pending is not None:
+                start, pending = pending, None
+                body = message.get("body", b"")
+                if not message.get("more_body", False) and len(body) >= self.minimum_size:
+                    if len(body) >= THREADPOOL_MIN_BYTES:
+                        body = await run_in_threadpool(compress, coding, body)
+                    else:
+                        body = compress(coding, body)
+                    headers = MutableHeaders(scope=start)
+                    headers["Content-Encoding"] = coding
+                    headers["Content-Length"] = str(len(body))
+                    etag = headers.get("etag")
+                    if etag and not etag.startswith("W/"):
+                        headers["ETag"] = f"W/{etag}"
+                    message = {**message, "body": body}
+                await send(start)
+            await send(message)
+        
+        await self.app(scope, receive, send_compressed)
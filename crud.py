@@ -0,0 +1,1007 @@
+"""
+Database operations behind the product, bill and customer routes.
+
+Every function takes a sync Session as its first argument and returns
+fully built response schemas, so it can run either in the threadpool or
+through AsyncSession.run_sync without lazy loads escaping the session.
+"""
+from fastapi import HTTPException, status
+from sqlalchemy import bindparam, case, desc, func, insert, select, tuple_, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, joinedload, make_transient_to_detached
+from sqlalchemy.orm.attributes import set_committed_value
+from collections import defaultdict
+from datetime import datetime
+from functools import lru_cache
+from pydantic import ValidationError
+from typing import Dict, List, Optional
+
+import analytics
+import customers
+import imports
+import models
+import schemas
+import serialization
+from app.sqlite import SQLITE_MAX_INTEGER, begin_write
+from bill_cache import bill_cache
+from bill_numbers import bill_numbers
+from catalog import catalog
+from drawer import change_maker
+from idempotency import idempotency_keys
+from pricing import from_paise, price_cart, to_basis_points, to_paise
+from quotes import quote_cache
+from utils import (
+    decode_cursor, denominations_to_json, encode_cursor
+)
+
+
+# Bills inserted per bulk INSERT round in create_bills_batch
+BATCH_CHUNK_SIZE = 1000
+# Rows per upsert statement in import_products (5 bound values each, well under
+# SQLite's 32766 variable limit)
+IMPORT_ROWS_PER_STATEMENT = 500
+
+# ==================== PRODUCTS ====================
+
+def create_product(db: Session, product: schemas.ProductCreate) -> schemas.ProductResponse:
+    """Create a new product"""
+    begin_write(db)
+    
+    # Check if product already exists
+    existing = db.query(models.Product).filter(
+        models.Product.product_id == product.product_id
+    ).first()
+    
+    if existing:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Product ID already exists"
+        )
+    
+    db_product = models.Product(**product.dict())
+    db.add(db_product)
+    db.commit()
+    db.refresh(db_product)
+    response = schemas.ProductResponse.model_validate(db_product)
+    catalog.put(response)
+    return response
+
+def get_all_products(db: Session) -> tuple[list[schemas.ProductResponse], str]:
+    """Get all products along with the catalog ETag"""
+    return catalog.snapshot(db)
+
+def get_all_products_json(db: Session, fields: tuple = serialization.PRODUCT_FIELDS) -> tuple[bytes, str]:
+    """get_all_products projected to fields and encoded as a JSON body, with its ETag"""
+    return catalog.snapshot_json(db, fields)
+
+def get_product_changes(db: Session, since: Optional[str]) -> schemas.ProductChanges:
+    """Get products changed since a catalog version token"""
+    return catalog.changes_since(db, since)
+
+def get_product(db: Session, product_id: str) -> schemas.ProductResponse:
+    """Get product by product_id"""
+    product = catalog.get(db, product_id)
+    
+    if not product:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Product not found"
+        )
+    return product
+
+def get_product_json(db: Session, product_id: str, fields: tuple) -> bytes:
+    """get_product projected to fields and encoded as a JSON body"""
+    return serialization.dumps(serialization.project(get_product(db, product_id), fields))
+
+def update_product(db: Session, product_id: str, product_update: schemas.ProductCreate) -> schemas.ProductResponse:
+    """Update a product"""
+    begin_write(db)
+    product = db.query(models.Product).filter(
+        models.Product.product_id == product_id
+    ).first()
+    
+    if not product:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Product not found"
+        )
+    
+    for key, value in product_update.dict().items():
+        setattr(product, key, value)
+    
+    db.commit()
+    db.refresh(product)
+    response = schemas.ProductResponse.model_validate(product)
+    if response.product_id != product_id:
+        catalog.remove(product_id)
+    catalog.put(response)
+    return response
+
+def delete_product(db: Session, product_id: str) -> dict:
+    """Delete a product"""
+    begin_write(db)
+    product = db.query(models.Product).filter(
+        models.Product.product_id == product_id
+    ).first()
+    
+    if not product:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Product not found"
+        )
+    
+    db.delete(product)
+    db.commit()
+    catalog.remove(product_id)
+    return {"message": "Product deleted successfully"}
+
+_PRODUCT_UPSERT_RETURNING = (
+    "id", "product_id", "name", "available_stocks", "price_per_unit", "tax_percentage", "created_at", "updated_at"
+)
+
+@lru_cache(maxsize=8)
+def product_upsert_sql(rows: int, skip_existing: bool = False) -> str:
+    """Multi-row upsert of products by product_id, for import_products and seed.py.
+    
+    Rows go in one VALUES list rather than an executemany: FTS5 flushes its
+    pending index changes at the end of every statement, so per-row
+    statements through the products_fts triggers cost several times more.
+    Timestamps are set by SQLite in SQLAlchemy's DateTime storage format.
+    With skip_existing, products already present are left alone and nothing
+    is returned; otherwise they are overwritten and every row comes back as
+    _PRODUCT_UPSERT_RETURNING.
+    """
+    now = "strftime('%Y-%m-%d %H:%M:%f000', 'now')"
+    values = ", ".join([f"(?, ?, ?, ?, ?, {now}, {now})"] * rows)
+    insert_sql = (
+        "INSERT INTO products (product_id, name, available_stocks, price_per_unit, tax_percentage, "
+        f"created_at, updated_at) VALUES {values} "
+    )
+    if skip_existing:
+        return insert_sql + "ON CONFLICT (product_id) DO NOTHING"
+    return insert_sql + (
+        "ON CONFLICT (product_id) DO UPDATE SET name = excluded.name, "
+        "available_stocks = excluded.available_stocks, price_per_unit = excluded.price_per_unit, "
+        "tax_percentage = excluded.tax_percentage, updated_at = excluded.updated_at "
+        f"RETURNING {', '.join(_PRODUCT_UPSERT_RETURNING)}"
+    )
+
+def import_products(db: Session, chunk: imports.RecordChunk) -> schemas.ProductImportResult:
+    """Validate one chunk of an import and upsert its valid rows by product_id in one transaction"""
+    products, errors = [], []
+    for row, value in imports.parse_chunk(chunk):
+        if isinstance(value, str):
+            errors.append(schemas.ProductImportError(row=row, detail=value))
+            continue
+        try:
+            products.append(schemas.ProductCreate.model_validate(value))
+        except ValidationError as e:
+            detail = "; ".join(
+                f"{'.'.join(str(part) for part in error['loc'])}: {error['msg']}" for error in e.errors()
+            )
+            errors.append(schemas.ProductImportError(row=row, detail=detail))
+    
+    if products:
+        begin_write(db)
+        connection = db.connection()
+        saved = []
+        try:
+            for start in range(0, len(products), IMPORT_ROWS_PER_STATEMENT):
+                batch = products[start:start + IMPORT_ROWS_PER_STATEMENT]
+                params = tuple(
+                    value for product in batch
+                    for value in (product.product_id, product.name, product.available_stocks,
+                                  product.price_per_unit, product.tax_percentage)
+                )
+                saved.extend(connection.exec_driver_sql(product_upsert_sql(len(batch)), params).all())
+            db.commit()
+        except IntegrityError as e:
+            db.rollback()
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail=f"Database integrity error: {e.orig}"
+            )
+        catalog.put_many(
+            schemas.ProductResponse.model_validate(dict(zip(_PRODUCT_UPSERT_RETURNING, row))) for row in saved
+        )
+    
+    return schemas.ProductImportResult(
+        received=len(products) + len(errors),
+        upserted=len(products),
+        failed=len(errors),
+        errors=errors
+    )
+
+# ==================== DRAWER ====================
+
+def get_drawer(db: Session) -> schemas.DrawerResponse:
+    """Get the cash drawer's note count for every denomination"""
+    denominations = db.query(models.Denomination).order_by(desc(models.Denomination.value)).all()
+    return schemas.DrawerResponse(
+        entries=[
+            schemas.DrawerEntry(denomination_value=d.value, count=d.drawer_count)
+            for d in denominations
+        ],
+        total_value=from_paise(sum(
+            to_paise(d.value) * d.drawer_count for d in denominations if d.drawer_count is not None
+        ))
+    )
+
+def set_drawer(db: Session, entries: List[schemas.DrawerEntry]) -> schemas.DrawerResponse:
+    """Set drawer counts after a cash count; a null count stops tracking that denomination"""
+    begin_write(db)
+    denominations = {to_paise(d.value): d for d in db.query(models.Denomination).all()}
+    
+    for entry in entries:
+        denomination = denominations.get(to_paise(entry.denomination_value))
+        if not denomination:
+            db.rollback()
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"Denomination {entry.denomination_value} not found"
+            )
+        denomination.drawer_count = entry.count
+    
+    db.flush()
+    response = get_drawer(db)
+    db.commit()
+    return response
+
+def drawer_notes(db: Session) -> Dict[int, models.Denomination]:
+    """Load denominations keyed by value in paise, refreshing counts already in the session"""
+    denominations = db.query(models.Denomination).populate_existing().all()
+    return {to_paise(d.value): d for d in denominations if d.value > 0}
+
+# The same few denomination values are converted on every quote
+denomination_paise = lru_cache(maxsize=64)(to_paise)
+
+def drawer_rows(db: Session) -> dict:
+    """drawer_notes() as plain rows, for working out change without writing it back.
+    
+    Rows carry value and drawer_count and are hashable, so tendered_notes
+    and make_change take them in place of Denomination objects, without the
+    cost of loading those.
+    """
+    rows = db.execute(select(models.Denomination.id, models.Denomination.value, models.Denomination.drawer_count))
+    return {denomination_paise(row.value): row for row in rows if row.value > 0}
+
+def tendered_notes(
+    by_paise: Dict[int, models.Denomination], notes: Optional[List[schemas.DenominationInput]], paid_paise: int
+) -> Dict[models.Denomination, int]:
+    """Match the notes handed over for a bill to denominations, checking they add up to the paid amount"""
+    if not notes:
+        return {}
+    
+    received = {}
+    for note in notes:
+        denomination = by_paise.get(to_paise(note.denomination_value))
+        if not denomination:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"Denomination {note.denomination_value} not found"
+            )
+        if note.count:
+            received[denomination] = received.get(denomination, 0) + note.count
+    
+    if sum(to_paise(d.value) * count for d, count in received.items()) != paid_paise:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Denominations received do not add up to the paid amount"
+        )
+    return received
+
+def make_change(
+    by_paise: Dict[int, models.Denomination], received: Dict[models.Denomination, int], balance_paise: int
+) -> Dict[models.Denomination, int]:
+    """Pick the fewest notes for a balance from the drawer, including the notes just tendered"""
+    drawer = {
+        value: None if d.drawer_count is None else d.drawer_count + received.get(d, 0)
+        for value, d in by_paise.items()
+    }
+    change, short = change_maker.make_change(balance_paise, drawer)
+    
+    if short and any(count is not None for count in drawer.values()):
+        # Refuse only when the drawer's contents, not the denominations themselves, leave the balance short
+        _, unavoidable = change_maker.make_change(balance_paise, dict.fromkeys(drawer))
+        if short > unavoidable:
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail=f"Cash drawer cannot make change for {from_paise(balance_paise)}"
+            )
+    
+    return {by_paise[value]: count for value, count in change.items()}
+
+def update_drawer(
+    db: Session, received: Dict[models.Denomination, int], returned: Dict[models.Denomination, int]
+) -> None:
+    """Apply a bill's tendered and returned notes to the tracked drawer counts"""
+    net = dict(received)
+    for denomination, count in returned.items():
+        net[denomination] = net.get(denomination, 0) - count
+    
+    for denomination, delta in net.items():
+        if denomination.drawer_count is None or delta == 0:
+            continue
+        result = db.execute(
+            update(models.Denomination)
+            .where(
+                models.Denomination.id == denomination.id,
+                models.Denomination.drawer_count + delta >= 0
+            )
+            .values(drawer_count=models.Denomination.drawer_count + delta)
+            .execution_options(synchronize_session=False)
+        )
+        if result.rowcount != 1:
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail=f"Cash drawer has too few {denomination.value} notes"
+            )
+
+# ==================== BILLS ====================
+
+def merge_cart(bill_data: schemas.BillCreate) -> dict:
+    """Merge duplicate lines for the same product, keeping cart order"""
+    quantities = {}
+    for item in bill_data.items:
+        quantities[item.product_id] = quantities.get(item.product_id, 0) + item.quantity
+    return quantities
+
+def stage_bill(db: Session, bill_data: schemas.BillCreate, bill_number: str) -> models.Bill:
+    """Validate a cart and flush its bill, items and stock decrements without committing.
+    
+    Raises HTTPException when the cart is rejected; the caller owns the
+    transaction and must roll it back (or the enclosing savepoint).
+    """
+    quantities = merge_cart(bill_data)
+    
+    # Decrement stock first, with one guarded update so concurrent bills cannot
+    # oversell. RETURNING gives each product's price and tax as committed, so a
+    # change made through another worker is billed even while this worker's
+    # catalog still caches the old one. A quantity too large to bind cannot be in
+    # stock, so it is left out and reported with the other missing lines. An empty
+    # cart (rejected by BillCreate, but not by callers building one directly) has
+    # nothing to decrement, and CASE needs at least one WHEN
+    decrements = {product_id: quantity for product_id, quantity in quantities.items() if quantity <= SQLITE_MAX_INTEGER}
+    products = {}
+    if decrements:
+        quantity = case(decrements, value=models.Product.product_id)
+        products = {row.product_id: row for row in db.execute(
+            update(models.Product)
+            .where(models.Product.product_id.in_(decrements), models.Product.available_stocks >= quantity)
+            .values(available_stocks=models.Product.available_stocks - quantity)
+            .returning(
+                models.Product.id, models.Product.product_id,
+                models.Product.price_per_unit, models.Product.tax_percentage
+            )
+            .execution_options(synchronize_session=False)
+        )}
+    
+    # A line missing from RETURNING is an unknown product or has too little stock
+    missing = [product_id for product_id in quantities if product_id not in products]
+    if missing:
+        existing = set(db.scalars(select(models.Product.product_id).where(models.Product.product_id.in_(missing))))
+        unknown = [product_id for product_id in missing if product_id not in existing]
+        if unknown:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"Product {unknown[0]} not found"
+            )
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Insufficient stock for product {missing[0]}"
+        )
+    catalog.check_prices(products.values())
+    
+    # Price the whole cart in integer paise
+    priced = price_cart(
+        (
+            product_id,
+            to_paise(products[product_id].price_per_unit),
+            to_basis_points(products[product_id].tax_percentage),
+            quantity
+        )
+        for product_id, quantity in quantities.items()
+    )
+    paid_paise = to_paise(bill_data.paid_amount)
+    
+    # Validate paid amount
+    if paid_paise < priced.total:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Paid amount is less than total amount"
+        )
+    
+    balance_paise = paid_paise - priced.total
+    
+    bill_items_data = [
+        {
+            "product": products[line.product_id],
+            "quantity": line.quantity,
+            "unit_price": from_paise(line.unit_price),
+            "tax_percentage": products[line.product_id].tax_percentage,
+            "item_subtotal": from_paise(line.subtotal),
+            "item_tax": from_paise(line.tax),
+            "item_total": from_paise(line.total)
+        }
+        for line in priced.lines
+    ]
+    
+    # Make change from what is actually in the drawer
+    notes = drawer_notes(db)
+    received = tendered_notes(notes, bill_data.denominations_received, paid_paise)
+    returned = make_change(notes, received, balance_paise)
+    balance_denoms_json = denominations_to_json({d.value: count for d, count in returned.items()})
+    
+    created_at = datetime.utcnow()
+    db_bill = models.Bill(
+        bill_number=bill_number,
+        customer_email=bill_data.customer_email,
+        subtotal=from_paise(priced.subtotal),
+        total_tax=from_paise(priced.tax),
+        total_amount=from_paise(priced.total),
+        paid_amount=from_paise(paid_paise),
+        balance_amount=from_paise(balance_paise),
+        balance_denominations=balance_denoms_json,
+        customer_id=customers.record_purchase(db, bill_data.customer_email, created_at, priced.total),
+        created_at=created_at,
+        denominations_used=[
+            models.DenominationUsed(denomination_id=d.id, kind=kind, count=count)
+            for kind, used in (("received", received), ("returned", returned))
+            for d, count in used.items()
+        ]
+    )
+    db.add(db_bill)
+    db.flush()
+    
+    # Items go in as one multi-row INSERT, with SQLite assigning their ids. The ORM
+    # would send an INSERT ... RETURNING per line, as SQLite cannot return rows
+    # from an executemany in parameter order; RETURNING's own order is not
+    # guaranteed either, so ids are matched back by product (one line per product)
+    item_rows = [
+        {
+            "bill_id": db_bill.id,
+            "product_id": item_data["product"].id,
+            "quantity": item_data["quantity"],
+            "unit_price": item_data["unit_price"],
+            "tax_percentage": item_data["tax_percentage"],
+            "item_subtotal": item_data["item_subtotal"],
+            "item_tax": item_data["item_tax"],
+            "item_total": item_data["item_total"]
+        }
+        for item_data in bill_items_data
+    ]
+    item_ids = {row.product_id: row.id for row in db.execute(
+        insert(models.BillItem).values(item_rows).returning(models.BillItem.id, models.BillItem.product_id)
+    )}
+    # Loaded into the bill as persisted rows, so the response is built without reloading
+    items = []
+    for item_row in item_rows:
+        item = models.BillItem(id=item_ids[item_row["product_id"]], **item_row)
+        make_transient_to_detached(item)
+        db.add(item)
+        items.append(item)
+    set_committed_value(db_bill, "bill_items", items)
+    
+    update_drawer(db, received, returned)
+    analytics.record_bill(
+        db, created_at, priced, {product_id: product.id for product_id, product in products.items()}
+    )
+    
+    db.flush()
+    return db_bill
+
+def create_bill(
+    db: Session, bill_data: schemas.BillCreate, idempotency_key: Optional[str] = None
+) -> schemas.BillResponse:
+    """Create a new bill, or return the stored response for a repeated Idempotency-Key"""
+    begin_write(db)
+    try:
+        if idempotency_key:
+            replay = idempotency_keys.lookup(db, idempotency_key, bill_data)
+            if replay is not None:
+                db.rollback()
+                idempotency_keys.remember(idempotency_key, bill_data, replay)
+                return replay
+        
+        # Only once the key has missed, so replays do not use up numbers
+        bill_number = bill_numbers.allocate(db)[0]
+        db_bill = stage_bill(db, bill_data, bill_number)
+        response = schemas.BillResponse.model_validate(db_bill)
+        if idempotency_key:
+            idempotency_keys.record(db, idempotency_key, bill_data, response)
+        db.commit()
+        catalog.apply_sale(merge_cart(bill_data))
+        cache_created_bill(db, bill_data, response)
+        if idempotency_key:
+            idempotency_keys.remember(idempotency_key, bill_data, response)
+        return response
+    
+    except HTTPException:
+        db.rollback()
+        raise
+    
+    except IntegrityError as e:
+        db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"Database integrity error: {e.orig}"
+        )
+
+def cache_created_bill(db: Session, bill_data: schemas.BillCreate, bill: schemas.BillResponse):
+    """Put a just committed bill's detail in bill_cache, naming its products from the catalog.
+    
+    Items are in cart order, as stage_bill created them.
+    """
+    naming_version = catalog.naming_version
+    quantities = merge_cart(bill_data)
+    products = catalog.get_many(db, quantities)
+    if len(products) != len(bill.bill_items):
+        # A product was renamed or deleted since the bill was staged; the first read fills it
+        return
+    content = bill.model_dump()
+    for item, product_id in zip(content["bill_items"], quantities):
+        product = products[product_id]
+        item["product"] = {"name": product.name, "product_id": product.product_id}
+    bill_cache.put(bill.id, serialization.dumps(content), naming_version)
+
+def quote_bill(db: Session, quote: schemas.BillQuoteRequest) -> schemas.BillQuoteResponse:
+    """Price a cart and suggest change the way create_bill would, without writing anything.
+    
+    Prices come from the catalog and are memoized per cart by quote_cache;
+    stock is checked against the catalog's count. With a paid_amount, the
+    balance is worked out too, and when it is not negative, the notes to
+    hand back from the drawer as it stands.
+    """
+    quantities = merge_cart(quote)
+    # Read before the products, so a price change in between cannot be memoized under the new version
+    pricing_version = catalog.pricing_version
+    products = catalog.get_many(db, quantities)
+    for product_id, quantity in quantities.items():
+        product = products.get(product_id)
+        if not product:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"Product {product_id} not found"
+            )
+        if product.available_stocks < quantity:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Insufficient stock for product {product_id}"
+            )
+    
+    cart = quote_cache.price(quantities, products, pricing_version)
+    response = schemas.BillQuoteResponse(
+        cart_hash=cart.cart_hash,
+        items=[cart.items[product_id] for product_id in quantities],
+        subtotal=from_paise(cart.priced.subtotal),
+        total_tax=from_paise(cart.priced.tax),
+        total_amount=from_paise(cart.priced.total),
+        tax_slabs=cart.tax_slabs
+    )
+    if quote.paid_amount is None:
+        return response
+    
+    paid_paise = to_paise(quote.paid_amount)
+    balance_paise = paid_paise - cart.priced.total
+    response.paid_amount = from_paise(paid_paise)
+    response.balance_amount = from_paise(balance_paise)
+    notes = drawer_rows(db)
+    received = tendered_notes(notes, quote.denominations_received, paid_paise)
+    if balance_paise >= 0:
+        returned = make_change(notes, received, balance_paise)
+        response.balance_denominations = denominations_to_json({d.value: count for d, count in returned.items()})
+    return response
+
+def create_bills_batch(db: Session, bills: List[schemas.BillCreate]) -> schemas.BillBatchResponse:
+    """Create many bills in one transaction, rejecting invalid ones individually.
+    
+    The write lock is held throughout, so stock and drawer counts are read
+    once and tracked in memory: every accepted bill is applied to them before
+    the next one is validated, exactly as if the bills were sent one by one.
+    Rows are written with bulk INSERTs in chunks of BATCH_CHUNK_SIZE bills and
+    stock is decremented once per product.
+    """
+    begin_write(db)
+    try:
+        product_ids = list({item.product_id for bill_data in bills for item in bill_data.items})
+        products = {}
+        # One query unless the batch references more products than SQLite allows bound parameters
+        for start in range(0, len(product_ids), 10000):
+            rows = db.execute(
+                select(
+                    models.Product.id, models.Product.product_id, models.Product.price_per_unit,
+                    models.Product.tax_percentage, models.Product.available_stocks
+                ).where(models.Product.product_id.in_(product_ids[start:start + 10000]))
+            )
+            products.update((row.product_id, row) for row in rows)
+        stock = {product_id: row.available_stocks for product_id, row in products.items()}
+        rates = {
+            product_id: (to_paise(row.price_per_unit), to_basis_points(row.tax_percentage))
+            for product_id, row in products.items()
+        }
+        product_pks = {product_id: row.id for product_id, row in products.items()}
+        
+        notes = drawer_notes(db)
+        # Ids are assigned here so items can reference their bill without reading ids back;
+        # safe under the write lock
+        next_id = (db.scalar(select(func.max(models.Bill.id))) or 0) + 1
+        created_at = datetime.utcnow()
+        
+        results = []
+        sold = {}
+        numbered = {}
+        sales = analytics.SalesTally()
+        bill_rows, item_rows, note_rows = [], [], []
+        
+        for index, bill_data in enumerate(bills):
+            quantities = merge_cart(bill_data)
+            try:
+                lines = []
+                for product_id, quantity in quantities.items():
+                    product = products.get(product_id)
+                    if not product:
+                        raise HTTPException(
+                            status_code=status.HTTP_404_NOT_FOUND,
+                            detail=f"Product {product_id} not found"
+                        )
+                    if stock[product_id] < quantity:
+                        raise HTTPException(
+                            status_code=status.HTTP_400_BAD_REQUEST,
+                            detail=f"Insufficient stock for product {product_id}"
+                        )
+                    lines.append((product_id, *rates[product_id], quantity))
+                
+                priced = price_cart(lines)
+                paid_paise = to_paise(bill_data.paid_amount)
+                if paid_paise < priced.total:
+                    raise HTTPException(
+                        status_code=status.HTTP_400_BAD_REQUEST,
+                        detail="Paid amount is less than total amount"
+                    )
+                
+                received = tendered_notes(notes, bill_data.denominations_received, paid_paise)
+                returned = make_change(notes, received, paid_paise - priced.total)
+            
+            except HTTPException as e:
+                results.append(schemas.BillBatchResult(index=index, status="rejected", detail=e.detail))
+                continue
+            
+            for product_id, quantity in quantities.items():
+                stock[product_id] -= quantity
+                sold[product_id] = sold.get(product_id, 0) + quantity
+            
+            # Tracked drawer counts are written back when the session flushes
+            for denomination, count in received.items():
+                if denomination.drawer_count is not None:
+                    denomination.drawer_count += count
+            for denomination, count in returned.items():
+                if denomination.drawer_count is not None:
+                    denomination.drawer_count -= count
+            
+            sales.add_priced(created_at, priced, product_pks)
+            
+            bill_id = next_id
+            next_id += 1
+            bill_rows.append({
+                "id": bill_id,
+                "customer_email": bill_data.customer_email,
+                "subtotal": from_paise(priced.subtotal),
+                "total_tax": from_paise(priced.tax),
+                "total_amount": from_paise(priced.total),
+                "paid_amount": from_paise(paid_paise),
+                "balance_amount": from_paise(paid_paise - priced.total),
+                "balance_denominations": denominations_to_json({d.value: count for d, count in returned.items()}),
+                "created_at": created_at
+            })
+            item_rows.extend(
+                {
+                    "bill_id": bill_id,
+                    "product_id": products[line.product_id].id,
+                    "quantity": line.quantity,
+                    "unit_price": from_paise(line.unit_price),
+                    "tax_percentage": products[line.product_id].tax_percentage,
+                    "item_subtotal": from_paise(line.subtotal),
+                    "item_tax": from_paise(line.tax),
+                    "item_total": from_paise(line.total)
+                }
+                for line in priced.lines
+            )
+            note_rows.extend(
+                {"bill_id": bill_id, "denomination_id": d.id, "kind": kind, "count": count}
+                for kind, used in (("received", received), ("returned", returned))
+                for d, count in used.items()
+            )
+            results.append(schemas.BillBatchResult(index=index, status="created", bill_id=bill_id))
+            
+            if len(bill_rows) >= BATCH_CHUNK_SIZE:
+                numbered.update(insert_bill_rows(db, bill_rows, item_rows, note_rows))
+                bill_rows, item_rows, note_rows = [], [], []
+        
+        numbered.update(insert_bill_rows(db, bill_rows, item_rows, note_rows))
+        
+        # One guarded decrement per product for the whole batch
+        if sold:
+            product_table = models.Product.__table__
+            result = db.execute(
+                product_table.update()
+                .where(
+                    product_table.c.id == bindparam("pk"),
+                    product_table.c.available_stocks >= bindparam("quantity")
+                )
+                .values(available_stocks=product_table.c.available_stocks - bindparam("quantity")),
+                [{"pk": products[product_id].id, "quantity": quantity} for product_id, quantity in sold.items()]
+            )
+            if result.rowcount != len(sold):
+                raise HTTPException(
+                    status_code=status.HTTP_409_CONFLICT,
+                    detail="Stock changed while the batch was being written"
+                )
+        
+        sales.write(db)
+        db.commit()
+    
+    except HTTPException:
+        db.rollback()
+        raise
+    
+    except IntegrityError as e:
+        db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"Database integrity error: {e.orig}"
+        )
+    
+    catalog.apply_sale(sold)
+    for result in results:
+        if result.status == "created":
+            result.bill_number = numbered[result.bill_id]
+    created = len(numbered)
+    return schemas.BillBatchResponse(created=created, rejected=len(results) - created, results=results)
+
+def insert_bill_rows(
+    db: Session, bill_rows: List[dict], item_rows: List[dict], note_rows: List[dict]
+) -> Dict[int, str]:
+    """Number and bulk insert prepared bill, bill item and denomination rows.
+    
+    Numbers are reserved in the caller's transaction, so a batch leaves no gaps.
+    Returns the bill numbers by bill id.
+    """
+    for row, bill_number in zip(bill_rows, bill_numbers.allocate_in(db, len(bill_rows))):
+        row["bill_number"] = bill_number
+    customer_ids = customers.record_purchases(
+        db, ((row["customer_email"], row["created_at"], to_paise(row["total_amount"])) for row in bill_rows)
+    )
+    for row in bill_rows:
+        row["customer_id"] = customer_ids[customers.normalize_email(row["customer_email"])]
+    
+    for model, rows in (
+        (models.Bill, bill_rows),
+        (models.BillItem, item_rows),
+        (models.DenominationUsed, note_rows)
+    ):
+        if rows:
+            db.execute(insert(model.__table__), rows)
+    return {row["id"]: row["bill_number"] for row in bill_rows}
+
+def get_bill(db: Session, bill_id: int) -> schemas.BillDetailResponse:
+    """Get bill by ID"""
+    bill = db.query(models.Bill).options(joinedload(models.Bill.bill_items).joinedload(models.BillItem.product)).filter(models.Bill.id == bill_id).first()
+    
+    if not bill:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Bill not found"
+        )
+    return schemas.BillDetailResponse.model_validate(bill)
+
+def keyset_bills(query, limit: int, cursor: Optional[str]):
+    """Order a bills query newest first and limit it to the page after cursor, plus one row"""
+    query = query.order_by(desc(models.Bill.created_at), desc(models.Bill.id))
+    
+    if cursor:
+        try:
+            cursor_created_at, cursor_id = decode_cursor(cursor)
+        except ValueError:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Invalid cursor"
+            )
+        query = query.filter(
+            tuple_(models.Bill.created_at, models.Bill.id) < tuple_(cursor_created_at, cursor_id)
+        )
+    # One extra row tells whether another page follows
+    return query.limit(limit + 1)
+
+def load_bill_items(db: Session, bills: List[models.Bill]):
+    """Load the items of all bills with one query.
+    
+    Like selectinload, but for exactly these bills: selectinload would also
+    load the look-ahead row of a page and split pages over 500 bills into
+    several queries.
+    """
+    items = defaultdict(list)
+    for item in db.scalars(
+        select(models.BillItem)
+        .where(models.BillItem.bill_id.in_([bill.id for bill in bills]))
+        .order_by(models.BillItem.id)
+    ):
+        items[item.bill_id].append(item)
+    for bill in bills:
+        set_committed_value(bill, "bill_items", items[bill.id])
+
+def keyset_page(query, limit: int, cursor: Optional[str]) -> tuple[list, Optional[str]]:
+    """Fetch one keyset page of a bills query (of Bill objects or of rows with id and created_at)
+    and the cursor of the page after it, if any"""
+    bills = keyset_bills(query, limit, cursor).all()
+    next_cursor = None
+    if len(bills) > limit:
+        bills = bills[:limit]
+        next_cursor = encode_cursor(bills[-1].created_at, bills[-1].id)
+    return bills, next_cursor
+
+def page_bills(query, limit: int, cursor: Optional[str], include_items: bool) -> schemas.BillPage:
+    """One keyset page of a bills query, newest first"""
+    bills, next_cursor = keyset_page(query, limit, cursor)
+    if include_items and bills:
+        load_bill_items(query.session, bills)
+    
+    item_schema = schemas.BillResponse if include_items else schemas.BillSummaryResponse
+    return schemas.BillPage(
+        items=[item_schema.model_validate(bill) for bill in bills],
+        next_cursor=next_cursor
+    )
+
+def get_all_bills(
+    db: Session,
+    limit: int,
+    cursor: Optional[str] = None,
+    include_items: bool = True
+) -> schemas.BillPage:
+    """Get bills, newest first, one keyset page at a time"""
+    return page_bills(db.query(models.Bill), limit, cursor, include_items)
+
+def _item_dict(values, names: tuple, with_product: bool) -> dict:
+    item = dict(zip(names, values))
+    if with_product:
+        item["product"] = {"name": values[-2], "product_id": values[-1]}
+    return item
+
+def bill_item_dicts(db: Session, bill_ids: List[int], fields: tuple) -> Dict[int, List[dict]]:
+    """Items of the given bills projected to fields, by bill id.
+    
+    The product field (BILL_DETAIL_ITEM_FIELDS) joins the product for its
+    name and product_id.
+    """
+    names = tuple(name for name in fields if name != "product")
+    query = (
+        select(models.BillItem.bill_id, *(getattr(models.BillItem, name) for name in names))
+        .where(models.BillItem.bill_id.in_(bill_ids))
+        .order_by(models.BillItem.id)
+    )
+    with_product = "product" in fields
+    if with_product:
+        query = query.join(models.Product, models.Product.id == models.BillItem.product_id).add_columns(
+            models.Product.name, models.Product.product_id
+        )
+    
+    items = defaultdict(list)
+    for bill_id, *row in db.execute(query):
+        items[bill_id].append(_item_dict(row, names, with_product))
+    return items
+
+def page_bill_rows(query, limit: int, cursor: Optional[str], fields: serialization.BillFields) -> dict:
+    """page_bills for the fast JSON path: a BillPage-shaped dict of just the requested fields,
+    selected as row tuples"""
+    rows, next_cursor = keyset_page(query.with_entities(*serialization.bill_columns(fields)), limit, cursor)
+    bills = serialization.bill_dicts(rows, fields)
+    if fields.items and rows:
+        items = bill_item_dicts(query.session, [row.id for row in rows], fields.items)
+        for row, bill in zip(rows, bills):
+            bill["bill_items"] = items[row.id]
+    return {"items": bills, "next_cursor": next_cursor}
+
+def get_all_bills_json(
+    db: Session,
+    limit: int,
+    cursor: Optional[str] = None,
+    fields: serialization.BillFields = serialization.FULL_BILL
+) -> bytes:
+    """get_all_bills encoded straight to a JSON body"""
+    return serialization.dumps(page_bill_rows(db.query(models.Bill), limit, cursor, fields))
+
+def get_bill_json(db: Session, bill_id: int, fields: serialization.BillFields) -> bytes:
+    """get_bill projected to fields and encoded straight to a JSON body.
+    
+    Items are outer joined, so a bill is read with one statement like
+    get_bill's joinedload, but without building any objects.
+    """
+    columns = serialization.bill_columns(fields)
+    names = tuple(name for name in fields.items if name != "product")
+    with_product = "product" in fields.items
+    query = select(*columns).where(models.Bill.id == bill_id)
+    if fields.items:
+        query = query.outerjoin(models.BillItem, models.BillItem.bill_id == models.Bill.id).add_columns(
+            models.BillItem.id, *(getattr(models.BillItem, name) for name in names)
+        ).order_by(models.BillItem.id)
+    if with_product:
+        query = query.outerjoin(models.Product, models.Product.id == models.BillItem.product_id).add_columns(
+            models.Product.name, models.Product.product_id
+        )
+    rows = db.execute(query).all()
+    
+    if not rows:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Bill not found"
+        )
+    bill = serialization.bill_dicts(rows[:1], fields)[0]
+    if fields.items:
+        # Item columns follow the bill's and its items' ids; a bill without items has one row of NULLs
+        start = len(columns) + 1
+        bill["bill_items"] = [
+            _item_dict(row[start:], names, with_product) for row in rows if row[start - 1] is not None
+        ]
+    return serialization.dumps(bill)
+
+def get_bill_detail_json(db: Session, bill_id: int) -> tuple[bytes, str]:
+    """get_bill as a JSON body and its ETag, read as rows and added to bill_cache"""
+    naming_version = catalog.naming_version
+    body = get_bill_json(db, bill_id, serialization.BILL_DETAIL)
+    return body, bill_cache.put(bill_id, body, naming_version)
+
+def find_customer(db: Session, customer_email: str) -> models.Customer:
+    """Get a customer by email, in any case and with surrounding spaces, or 404"""
+    customer = db.query(models.Customer).filter(
+        models.Customer.email == customers.normalize_email(customer_email)
+    ).first()
+    
+    if not customer:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="No purchases found for this customer"
+        )
+    return customer
+
+def get_customer_purchases(
+    db: Session,
+    customer_email: str,
+    limit: int,
+    cursor: Optional[str] = None,
+    include_items: bool = True
+) -> schemas.CustomerPurchaseHistory:
+    """Get a customer's lifetime summary and one page of their bills, newest first"""
+    customer = find_customer(db, customer_email)
+    page = page_bills(
+        db.query(models.Bill).filter(models.Bill.customer_id == customer.id), limit, cursor, include_items
+    )
+    return schemas.CustomerPurchaseHistory(
+        customer_email=customer.email,
+        total_purchases=customer.bill_count,
+        total_spent=from_paise(customer.total_spent_paise),
+        first_purchase_at=customer.first_purchase_at,
+        last_purchase_at=customer.last_purchase_at,
+        bills=page.items,
+        next_cursor=page.next_cursor
+    )
+
+def get_customer_purchases_json(
+    db: Session,
+    customer_email: str,
+    limit: int,
+    cursor: Optional[str] = None,
+    fields: serialization.BillFields = serialization.FULL_BILL
+) -> bytes:
+    """get_customer_purchases encoded straight to a JSON body"""
+    customer = find_customer(db, customer_email)
+    page = page_bill_rows(
+        db.query(models.Bill).filter(models.Bill.customer_id == customer.id), limit, cursor, fields
+    )
+    return serialization.dumps({
+        "customer_email": customer.email,
+        "total_purchases": customer.bill_count,
+        "total_spent": from_paise(customer.total_spent_paise),
+        "first_purchase_at": customer.first_purchase_at,
+        "last_purchase_at": customer.last_purchase_at,
+        "bills": page["items"],
+        "next_cursor": page["next_cursor"]
+    })
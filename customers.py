@@ -0,0 +1,110 @@
+"""
+Customer dimension behind purchase history.
+
+Each bill is linked to a customers row keyed by normalized email. The row
+holds the customer's bill count, lifetime spend and first and last
+purchase, so summaries cost one primary-key read however many bills a
+customer has. The rows are kept current by an upsert in the transaction
+that creates each bill. Databases from before the table existed are
+backfilled on startup.
+"""
+from datetime import datetime
+from functools import lru_cache
+from typing import Dict, Iterable, Tuple
+
+from sqlalchemy import func, select, update
+from sqlalchemy.dialects import sqlite
+from sqlalchemy.orm import Session
+
+import models
+from app.sqlite import begin_write
+from pricing import to_paise
+
+BACKFILL_CHUNK_SIZE = 5000
+
+
+def normalize_email(email: str) -> str:
+    return email.strip().lower()
+
+
+def _upsert():
+    table = models.Customer.__table__
+    statement = sqlite.insert(table)
+    excluded = statement.excluded
+    upsert = statement.on_conflict_do_update(
+        index_elements=["email"],
+        set_={
+            "bill_count": table.c.bill_count + excluded.bill_count,
+            "total_spent_paise": table.c.total_spent_paise + excluded.total_spent_paise,
+            # Two-argument min()/max() are scalar functions in SQLite
+            "first_purchase_at": func.min(table.c.first_purchase_at, excluded.first_purchase_at),
+            "last_purchase_at": func.max(table.c.last_purchase_at, excluded.last_purchase_at)
+        }
+    )
+    # Rows come back keyed by email, so RETURNING order does not matter; asking
+    # for parameter order would make SQLAlchemy send one row per statement
+    return upsert.returning(table.c.email, table.c.id)
+
+
+_UPSERT = _upsert()
+
+
+def record_purchases(db: Session, purchases: Iterable[Tuple[str, datetime, int]]) -> Dict[str, int]:
+    """Add (email, created_at, total paise) bills to their customers in db's transaction.
+    
+    Creates customers seen for the first time and returns customer ids by
+    normalized email.
+    """
+    totals = {}
+    for email, created_at, total in purchases:
+        email = normalize_email(email)
+        current = totals.get(email)
+        if current is None:
+            totals[email] = [1, total, created_at, created_at]
+        else:
+            current[0] += 1
+            current[1] += total
+            current[2] = min(current[2], created_at)
+            current[3] = max(current[3], created_at)
+    if not totals:
+        return {}
+    
+    rows = db.execute(_UPSERT, [
+        {
+            "email": email,
+            "bill_count": count,
+            "total_spent_paise": total,
+            "first_purchase_at": first,
+            "last_purchase_at": last
+        }
+        for email, (count, total, first, last) in totals.items()
+    ])
+    return dict(rows.all())
+
+
+def record_purchase(db: Session, email: str, created_at: datetime, total: int) -> int:
+    """record_purchases() for one bill; returns its customer id"""
+    return record_purchases(db, [(email, created_at, total)])[normalize_email(email)]
+
+
+def backfill_customers(engine):
+    """Link bills that predate the customers table to their customers, a chunk per transaction"""
+    bills = models.Bill.__table__
+    paise = lru_cache(maxsize=65536)(to_paise)
+    with Session(engine) as db:
+        while True:
+            begin_write(db)
+            rows = db.execute(
+                select(bills.c.id, bills.c.customer_email, bills.c.created_at, bills.c.total_amount)
+                .where(bills.c.customer_id.is_(None))
+                .limit(BACKFILL_CHUNK_SIZE)
+            ).all()
+            if not rows:
+                db.rollback()
+                return
+            ids = record_purchases(db, ((email, created_at, paise(total)) for _, email, created_at, total in rows))
+            db.execute(
+                update(models.Bill).execution_options(synchronize_session=False),
+                [{"id": bill_id, "customer_id": ids[normalize_email(email)]} for bill_id, email, _, _ in rows]
+            )
+            db.commit()
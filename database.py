@@ -1,22 +1,82 @@
-from sqlalchemy import create_engine
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
 from sqlalchemy.orm import sessionmaker, declarative_base
-from sqlalchemy.pool import StaticPool
-       
-DATABASE_URL = "sqlite:///./billing.db"
-
-engine = create_engine(
-    DATABASE_URL,
-    connect_args={"check_same_thread": False},
-    poolclass=StaticPool,
-    echo=False
+from app.config import settings
+from app.sqlite import (
+    create_async_sqlite_engine, create_sqlite_engine, retry_on_busy, retry_on_busy_async, upgrade_schema
 )
+from metrics import instrument_engine
+from query_budget import watch_engine
+
+DATABASE_URL = settings.DATABASE_URL
+ASYNC_DATABASE_URL = DATABASE_URL.replace("sqlite://", "sqlite+aiosqlite://", 1)
+
+engine = create_sqlite_engine(DATABASE_URL, echo=False)
+
+async_engine = create_async_sqlite_engine(ASYNC_DATABASE_URL, echo=False)
+
+if settings.METRICS_ENABLED:
+    instrument_engine(engine)
+    instrument_engine(async_engine.sync_engine)
+watch_engine(engine)
+watch_engine(async_engine.sync_engine)
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+AsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession, autoflush=False)
 Base = declarative_base()
 
+def init_db():
+    """Create missing tables and add columns and indexes older databases lack"""
+    from analytics import init_sales_rollups
+    from customers import backfill_customers
+    from search import init_product_search
+    
+    Base.metadata.create_all(bind=engine)
+    upgrade_schema(engine, Base.metadata)
+    init_product_search(engine)
+    init_sales_rollups(engine)
+    backfill_customers(engine)
+
 def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
         db.close()
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+class SyncDatabase:
+    """Runs crud functions on a sync Session in the threadpool, retrying while SQLite is busy"""
+    
+    def __init__(self, session):
+        self.session = session
+    
+    async def run(self, fn, *args, **kwargs):
+        return await run_in_threadpool(retry_on_busy, self.session, fn, self.session, *args, **kwargs)
+
+
+class AsyncDatabase:
+    """Runs crud functions on an AsyncSession without blocking the event loop, retrying while SQLite is busy"""
+    
+    def __init__(self, session):
+        self.session = session
+    
+    async def run(self, fn, *args, **kwargs):
+        return await retry_on_busy_async(self.session, self.session.run_sync, fn, *args, **kwargs)
+
+
+async def get_database():
+    """Yield a database runner for the mode selected by settings.DB_MODE"""
+    if settings.DB_MODE == "async":
+        async with AsyncSessionLocal() as db:
+            yield AsyncDatabase(db)
+    else:
+        db = SessionLocal()
+        try:
+            yield SyncDatabase(db)
+        finally:
+            await run_in_threadpool(db.close)
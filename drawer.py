@@ -0,0 +1,184 @@
+"""
+Cash drawer inventory and bounded change-making.
+
+The drawer holds a count per denomination (Denomination.drawer_count; NULL
+means the drawer is not tracked and notes are treated as unlimited). Change
+is computed by ChangeMaker, which minimizes the number of notes handed back
+given what is actually in the drawer:
+
+- Amounts are scaled to units of the gcd of the denominations; anything
+  below one unit cannot be returned and is reported as the remainder.
+- If every denomination has enough notes and the set is canonical, greedy
+  is optimal and used directly.
+- Otherwise a bounded DP (sliding-window minimum per residue class, O(n*A))
+  finds the largest returnable amount with the fewest notes. Very large
+  amounts are first reduced greedily with the biggest notes.
+
+Results are memoized by amount and by min(count, amount // value) for each
+denomination: a cached answer is reused until the drawer composition crosses
+the point where it could change that answer.
+"""
+import threading
+from collections import OrderedDict, deque
+from functools import reduce
+from math import gcd
+from typing import Dict, List, Optional, Tuple
+
+INF = float("inf")
+
+# Change below this many units is solved exactly; above it the excess is
+# first paid out greedily with the largest notes
+DP_MAX_UNITS = 20_000
+
+
+def is_canonical(values: List[int]) -> bool:
+    """Return True if greedy change is always optimal for these (unbounded) values"""
+    values = sorted(values)
+    if values[0] != 1:
+        # Without a unit note greedy can strand amounts other combinations reach
+        return False
+    if len(values) < 3:
+        return True
+    # A counterexample, if any, is below the sum of the two largest values
+    limit = values[-1] + values[-2]
+    best = [0] + [INF] * limit
+    for amount in range(1, limit + 1):
+        best[amount] = min((best[amount - v] + 1 for v in values if v <= amount), default=INF)
+    for amount in range(1, limit + 1):
+        remaining, notes = amount, 0
+        for v in reversed(values):
+            count, remaining = divmod(remaining, v)
+            notes += count
+        if remaining == 0 and notes > best[amount]:
+            return False
+    return True
+
+
+def _greedy(amount: int, values: List[int], counts: List[Optional[int]]) -> Tuple[List[int], int]:
+    """Greedy change in units; values descending, None counts are unlimited"""
+    used = []
+    for value, count in zip(values, counts):
+        take = amount // value
+        if count is not None:
+            take = min(take, count)
+        used.append(take)
+        amount -= take * value
+    return used, amount
+
+
+def _bounded_dp(amount: int, values: List[int], counts: List[int]) -> Tuple[List[int], int]:
+    """Fewest notes for the largest payable amount <= amount, within counts"""
+    stages = [[0] + [INF] * amount]
+    for value, count in zip(values, counts):
+        prev = stages[-1]
+        best = [INF] * (amount + 1)
+        for residue in range(min(value, amount + 1)):
+            # best[r + k*value] = min over j in [k-count, k] of prev[r + j*value] - j, plus k
+            window = deque()
+            for k, position in enumerate(range(residue, amount + 1, value)):
+                candidate = prev[position] - k
+                while window and window[-1][1] >= candidate:
+                    window.pop()
+                window.append((k, candidate))
+                if window[0][0] < k - count:
+                    window.popleft()
+                best[position] = window[0][1] + k
+        stages.append(best)
+    
+    final = stages[-1]
+    reached = next(a for a in range(amount, -1, -1) if final[a] < INF)
+    
+    # Walk the stages backwards to recover how many of each note were used
+    used = [0] * len(values)
+    position = reached
+    for i in range(len(values) - 1, -1, -1):
+        prev = stages[i]
+        for j in range(min(counts[i], position // values[i]) + 1):
+            if prev[position - j * values[i]] + j == stages[i + 1][position]:
+                used[i] = j
+                position -= j * values[i]
+                break
+    return used, amount - reached
+
+
+class ChangeMaker:
+    """Bounded change solver with a memo of recent answers"""
+    
+    def __init__(self, max_entries: int = 4096):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._memo: "OrderedDict[tuple, Tuple[Dict[int, int], int]]" = OrderedDict()
+        self._canonical: Dict[Tuple[int, ...], bool] = {}
+        self._lock = threading.Lock()
+    
+    def make_change(self, amount: int, drawer: Dict[int, Optional[int]]) -> Tuple[Dict[int, int], int]:
+        """Return ({value: notes}, unpaid remainder) for amount, all in paise.
+        
+        drawer maps each denomination value in paise to the notes available,
+        or None when that denomination is not counted.
+        """
+        values = sorted((value for value in drawer if value > 0), reverse=True)
+        if amount <= 0 or not values:
+            return {}, max(amount, 0)
+        
+        unit = reduce(gcd, values)
+        units = amount // unit
+        scaled = [value // unit for value in values]
+        # Only counts up to what this amount could use affect the answer
+        capped = [
+            units // v if drawer[value] is None else min(drawer[value], units // v)
+            for value, v in zip(values, scaled)
+        ]
+        key = (amount, tuple(values), tuple(capped))
+        
+        with self._lock:
+            cached = self._memo.get(key)
+            if cached is not None:
+                self._memo.move_to_end(key)
+                self.hits += 1
+                return dict(cached[0]), cached[1]
+        
+        self.misses += 1
+        used, left = self._solve(units, scaled, capped)
+        change = {value: count for value, count in zip(values, used) if count}
+        result = (change, left * unit + amount % unit)
+        
+        with self._lock:
+            self._memo[key] = result
+            if len(self._memo) > self.max_entries:
+                self._memo.popitem(last=False)
+        return dict(change), result[1]
+    
+    def _solve(self, units: int, values: List[int], counts: List[int]) -> Tuple[List[int], int]:
+        plentiful = all(count == units // value for value, count in zip(values, counts))
+        if plentiful and self._is_canonical(values):
+            return _greedy(units, values, counts)
+        
+        # Pay out the bulk of a very large amount greedily, then solve the rest exactly
+        prepaid = [0] * len(values)
+        if units > DP_MAX_UNITS:
+            excess = units - DP_MAX_UNITS // 2
+            for i, (value, count) in enumerate(zip(values, counts)):
+                take = min(count, excess // value)
+                prepaid[i] = take
+                excess -= take * value
+                units -= take * value
+            if units > DP_MAX_UNITS:
+                used, left = _greedy(units, values, [c - p for c, p in zip(counts, prepaid)])
+                return [u + p for u, p in zip(used, prepaid)], left
+        
+        used, left = _bounded_dp(units, values, [c - p for c, p in zip(counts, prepaid)])
+        return [u + p for u, p in zip(used, prepaid)], left
+    
+    def _is_canonical(self, values: List[int]) -> bool:
+        key = tuple(values)
+        if key not in self._canonical:
+            self._canonical[key] = is_canonical(values)
+        return self._canonical[key]
+    
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "size": len(self._memo)}
+
+
+change_maker = ChangeMaker()
@@ -0,0 +1,171 @@
+"""
+Group-commit writer for bill creation.
+
+A single background thread owns one Session (and so one SQLite write
+connection) and drains bill requests from a queue. Each bill is staged in
+its own SAVEPOINT so a rejected cart only rolls back itself, and the whole
+batch shares one COMMIT, trading a few milliseconds of latency for one
+fsync per batch instead of one per bill. Each bill is staged in a copy of
+the submitting request's context, so per-request instrumentation such as
+the Server-Timing query count still sees its statements.
+"""
+import asyncio
+import contextvars
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Optional
+
+from fastapi import HTTPException, status
+from sqlalchemy.exc import IntegrityError
+
+import crud
+import schemas
+from catalog import catalog
+from idempotency import idempotency_keys
+from app.sqlite import begin_write, retry_on_busy
+from bill_numbers import bill_numbers
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+class BillWriter:
+    """Batches bill inserts from many requests into shared transactions"""
+    
+    def __init__(self, session_factory, batch_size: int = 64, max_delay_ms: float = 5.0):
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+        self.max_delay = max_delay_ms / 1000
+        self._queue = queue.Queue()
+        self._thread = None
+    
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+    
+    def start(self):
+        if self.running:
+            return
+        self._thread = threading.Thread(target=self._run, name="bill-writer", daemon=True)
+        self._thread.start()
+    
+    def stop(self):
+        """Flush whatever is queued, then stop the writer thread"""
+        if not self.running:
+            return
+        self._queue.put(_STOP)
+        self._thread.join()
+        self._thread = None
+    
+    def submit(self, bill_data: schemas.BillCreate, idempotency_key: Optional[str] = None) -> Future:
+        """Queue a bill; the future resolves to its BillResponse or HTTPException"""
+        future = Future()
+        self._queue.put((bill_data, idempotency_key, future, contextvars.copy_context()))
+        return future
+    
+    async def create_bill(
+        self, bill_data: schemas.BillCreate, idempotency_key: Optional[str] = None
+    ) -> schemas.BillResponse:
+        return await asyncio.wrap_future(self.submit(bill_data, idempotency_key))
+    
+    def _run(self):
+        db = self.session_factory()
+        try:
+            stopping = False
+            while not stopping:
+                first = self._queue.get()
+                if first is _STOP:
+                    break
+                
+                # Collect more bills until the batch is full or the deadline passes
+                batch = [first]
+                deadline = time.monotonic() + self.max_delay
+                while len(batch) < self.batch_size:
+                    timeout = deadline - time.monotonic()
+                    if timeout <= 0:
+                        break
+                    try:
+                        entry = self._queue.get(timeout=timeout)
+                    except queue.Empty:
+                        break
+                    if entry is _STOP:
+                        stopping = True
+                        break
+                    batch.append(entry)
+                
+                self._commit_batch(db, batch)
+        finally:
+            db.close()
+    
+    def _commit_batch(self, db, batch):
+        try:
+            outcomes = retry_on_busy(db, self._write_batch, db, batch)
+        except Exception as e:
+            db.rollback()
+            logger.exception("Bill batch of %d failed to commit", len(batch))
+            for _, _, future, _ in batch:
+                future.set_exception(e)
+            return
+        
+        try:
+            for (bill_data, idempotency_key, future, _), (response, error, replayed) in zip(batch, outcomes):
+                if error is not None:
+                    future.set_exception(error)
+                    continue
+                if not replayed:
+                    catalog.apply_sale(crud.merge_cart(bill_data))
+                    crud.cache_created_bill(db, bill_data, response)
+                if idempotency_key:
+                    idempotency_keys.remember(idempotency_key, bill_data, response)
+                future.set_result(response)
+        finally:
+            # A catalog reload while caching opens a read transaction on the writer's
+            # session; left open, it pins an old WAL snapshot and the next batch's
+            # begin_write could not take BEGIN IMMEDIATE
+            db.rollback()
+    
+    def _write_batch(self, db, batch):
+        """Stage every bill in its own savepoint, then commit the batch once"""
+        begin_write(db)
+        outcomes = [
+            context.run(self._stage, db, bill_data, idempotency_key)
+            for bill_data, idempotency_key, _, context in batch
+        ]
+        db.commit()
+        return outcomes
+    
+    def _stage(self, db, bill_data, idempotency_key):
+        """Stage one bill in a savepoint; returns (response, error, replayed)"""
+        # Earlier bills in this batch are flushed, so a repeated key is found here too
+        if idempotency_key:
+            try:
+                replay = idempotency_keys.lookup(db, idempotency_key, bill_data)
+            except HTTPException as e:
+                return None, e, False
+            if replay is not None:
+                return replay, None, True
+        
+        # Numbered only once the key has missed, and outside the savepoint, so a
+        # rejected bill cannot roll back a block reservation
+        bill_number = bill_numbers.allocate(db)[0]
+        savepoint = db.begin_nested()
+        try:
+            db_bill = crud.stage_bill(db, bill_data, bill_number)
+            response = schemas.BillResponse.model_validate(db_bill)
+            if idempotency_key:
+                idempotency_keys.record(db, idempotency_key, bill_data, response)
+            savepoint.commit()
+            return response, None, False
+        except HTTPException as e:
+            savepoint.rollback()
+            return None, e, False
+        except IntegrityError as e:
+            savepoint.rollback()
+            return None, HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail=f"Database integrity error: {e.orig}"
+            ), False
@@ -0,0 +1,130 @@
+"""
+Idempotency keys for bill creation.
+
+A bill created with an Idempotency-Key header stores its response in the
+idempotency_keys table in the same transaction as the bill, so a key maps
+to exactly one committed bill or to nothing at all. Retries find the
+stored response and never touch products or bills again.
+
+Recent keys are also held in a bounded in-process LRU so most replays are
+answered before any database work; keys created by other workers are still
+found in the table, which is checked under the write lock. Entries expire
+after IDEMPOTENCY_TTL_SECONDS, and expired rows are pruned at most once per
+IDEMPOTENCY_PRUNE_INTERVAL_SECONDS inside a write that is happening anyway.
+
+Only created bills are stored: a rejected cart changes nothing, so
+retrying it simply validates it again.
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Optional, Tuple
+
+from fastapi import HTTPException, status
+from sqlalchemy import delete
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.orm import Session
+
+import models
+import schemas
+from app.config import settings
+
+
+def fingerprint(bill_data: schemas.BillCreate) -> str:
+    """Short digest of a request body, to catch a key reused for a different bill"""
+    return hashlib.sha256(bill_data.model_dump_json().encode()).hexdigest()[:32]
+
+
+class IdempotencyStore:
+    """Stored bill responses by Idempotency-Key, with an LRU in front of the table"""
+    
+    def __init__(self, ttl: float, max_entries: int, prune_interval: float):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.prune_interval = prune_interval
+        self.hits = 0
+        self.misses = 0
+        # key -> (expires at, monotonic; request fingerprint; stored response)
+        self._entries: "OrderedDict[str, Tuple[float, str, schemas.BillResponse]]" = OrderedDict()
+        self._last_prune = 0.0
+        self._lock = threading.Lock()
+    
+    def _check(self, key: str, expected: str, stored: str):
+        if stored != expected:
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail=f"Idempotency-Key {key} was already used for a different request"
+            )
+    
+    def cached(self, key: str, bill_data: schemas.BillCreate) -> Optional[schemas.BillResponse]:
+        """Return the stored response from memory only; cheap enough for every request"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            if entry[0] < time.monotonic():
+                del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        self._check(key, fingerprint(bill_data), entry[1])
+        return entry[2]
+    
+    def lookup(self, db: Session, key: str, bill_data: schemas.BillCreate) -> Optional[schemas.BillResponse]:
+        """Return the stored response from memory or the table; call under the write lock.
+        
+        A row found here may belong to the caller's own uncommitted work, so it
+        is not cached; callers remember() responses once they have committed.
+        """
+        response = self.cached(key, bill_data)
+        if response is not None:
+            return response
+        
+        row = db.get(models.IdempotencyKey, key)
+        if row is None or row.created_at < datetime.utcnow() - timedelta(seconds=self.ttl):
+            return None
+        self._check(key, fingerprint(bill_data), row.request_hash)
+        return schemas.BillResponse.model_validate_json(row.response)
+    
+    def record(self, db: Session, key: str, bill_data: schemas.BillCreate, response: schemas.BillResponse):
+        """Store a response in the caller's transaction, replacing an expired entry for the key"""
+        now = datetime.utcnow()
+        values = {
+            "request_hash": fingerprint(bill_data),
+            "response": response.model_dump_json(),
+            "created_at": now
+        }
+        db.execute(
+            insert(models.IdempotencyKey)
+            .values(key=key, **values)
+            .on_conflict_do_update(index_elements=["key"], set_=values)
+        )
+        
+        if time.monotonic() - self._last_prune >= self.prune_interval:
+            self._last_prune = time.monotonic()
+            db.execute(
+                delete(models.IdempotencyKey)
+                .where(models.IdempotencyKey.created_at < now - timedelta(seconds=self.ttl))
+            )
+    
+    def remember(self, key: str, bill_data: schemas.BillCreate, response: schemas.BillResponse):
+        """Cache a committed response in memory"""
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, fingerprint(bill_data), response)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+    
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "size": len(self._entries)}
+
+
+idempotency_keys = IdempotencyStore(
+    ttl=settings.IDEMPOTENCY_TTL_SECONDS,
+    max_entries=settings.IDEMPOTENCY_CACHE_SIZE,
+    prune_interval=settings.IDEMPOTENCY_PRUNE_INTERVAL_SECONDS
+)
@@ -0,0 +1,106 @@
+"""
+Streaming product imports.
+
+The request body is decoded incrementally and split into chunks of
+CHUNK_ROWS records, so memory use does not depend on the file size. CSV
+records may span lines inside quoted fields; a record is complete once it
+holds an even number of quote characters. Each chunk is parsed, validated
+and upserted in its own transaction by crud.import_products, and per-row
+errors are reported without stopping the rest of the file.
+"""
+import codecs
+import csv
+import json
+from dataclasses import dataclass, field
+from typing import AsyncIterator, List, Optional, Tuple, Union
+
+CHUNK_ROWS = 5000
+# Per-row errors returned in the response; the rest are only counted
+MAX_REPORTED_ERRORS = 1000
+
+
+@dataclass
+class RecordChunk:
+    format: str
+    header: Optional[List[str]]
+    first_row: int  # 1-based number of the first data row in records
+    records: List[str] = field(default_factory=list)
+
+
+async def read_chunks(
+    stream: AsyncIterator[bytes], format: str, chunk_size: int = CHUNK_ROWS
+) -> AsyncIterator[RecordChunk]:
+    """Split a CSV or NDJSON byte stream into chunks of raw records.
+    
+    Raises UnicodeDecodeError if the body is not UTF-8.
+    """
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    header = None
+    chunk = RecordChunk(format, None, 1)
+    pending = ""
+    record, quotes = [], 0
+    
+    def add(line: str) -> bool:
+        """Feed one line; return True when a chunk is full"""
+        nonlocal header, quotes
+        if format == "ndjson":
+            if line.strip():
+                chunk.records.append(line)
+        else:
+            record.append(line)
+            quotes += line.count('"')
+            if quotes % 2:
+                return False  # inside a quoted field that continues on the next line
+            text = "\n".join(record)
+            record.clear()
+            quotes = 0
+            if not text.strip():
+                return False
+            if header is None:
+                header = [name.strip() for name in next(csv.reader([text]))]
+                chunk.header = header
+            else:
+                chunk.records.append(text)
+        return len(chunk.records) >= chunk_size
+    
+    async for data in stream:
+        lines = (pending + decoder.decode(data)).split("\n")
+        pending = lines.pop()
+        for line in lines:
+            if add(line):
+                yield chunk
+                chunk = RecordChunk(format, header, chunk.first_row + len(chunk.records))
+    
+    for line in (pending + decoder.decode(b"", final=True)).split("\n"):
+        if add(line):
+            yield chunk
+            chunk = RecordChunk(format, header, chunk.first_row + len(chunk.records))
+    if record:
+        # Unterminated quote at end of file; let the CSV parser make what it can of it
+        chunk.records.append("\n".join(record))
+    if chunk.records:
+        yield chunk
+
+
+def parse_chunk(chunk: RecordChunk) -> List[Tuple[int, Union[dict, str]]]:
+    """Return (row number, field dict or error message) for every record in the chunk"""
+    rows = []
+    for row, text in enumerate(chunk.records, start=chunk.first_row):
+        if chunk.format == "ndjson":
+            try:
+                value = json.loads(text)
+            except ValueError as e:
+                rows.append((row, f"Invalid JSON: {e}"))
+                continue
+            rows.append((row, value if isinstance(value, dict) else "Expected a JSON object"))
+        else:
+            try:
+                values = next(csv.reader([text]))
+            except csv.Error as e:
+                rows.append((row, f"Invalid CSV: {e}"))
+                continue
+            if len(values) != len(chunk.header):
+                rows.append((row, f"Expected {len(chunk.header)} columns, got {len(values)}"))
+                continue
+            rows.append((row, dict(zip(chunk.header, values))))
+    return rows
@@ -1,20 +1,50 @@
-from fastapi import FastAPI, Depends, HTTPException, status
-from sqlalchemy.orm import Session, joinedload
+from fastapi import FastAPI, Depends, Header, HTTPException, Query, Request, Response, status
+from sqlalchemy.orm import Session
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy import desc
-from datetime import datetime
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from contextlib import asynccontextmanager
+from datetime import date
+from typing import Optional, Union
+import analytics
+import bill_search
+import compression
+import crud
+import exports
+import imports
+import metrics
+import query_budget
 import models
 import schemas
-from database import engine, get_db, Base
-from utils import calculate_balance_denominations, denominations_to_json, generate_bill_number
+import search
+import serialization
+from app.config import settings
+from database import get_db, get_database, init_db, AsyncDatabase, SyncDatabase, SessionLocal
+from bill_cache import bill_cache
+from catalog import catalog
+from group_commit import BillWriter
+from idempotency import idempotency_keys
+from quotes import quote_cache
+from utils import accepts_encoding, etag_matches
 
-import uuid
-from sqlalchemy.exc import IntegrityError
+Database = Union[SyncDatabase, AsyncDatabase]
 
 # Create tables
-Base.metadata.create_all(bind=engine)
+init_db()
 
-app = FastAPI(title="Billing System API", version="1.0.0")
+bill_writer = BillWriter(
+    SessionLocal,
+    batch_size=settings.BILL_GROUP_COMMIT_BATCH_SIZE,
+    max_delay_ms=settings.BILL_GROUP_COMMIT_MAX_DELAY_MS
+)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if settings.BILL_GROUP_COMMIT:
+        bill_writer.start()
+    yield
+    bill_writer.stop()
+
+app = FastAPI(title="Billing System API", version="1.0.0", lifespan=lifespan)
 
 # Add CORS middleware
 # This is necessary to allow the frontend (running on a different port)
@@ -25,87 +55,152 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "Server-Timing"],
 )
 
+if settings.QUERY_DEBUG:
+    app.add_middleware(query_budget.QueryDebugMiddleware)
+
+if settings.COMPRESSION_ENABLED:
+    app.add_middleware(compression.CompressionMiddleware)
+
+# Added last so it wraps CORS too, times the whole request and counts compressed bytes
+if settings.METRICS_ENABLED:
+    app.add_middleware(metrics.MetricsMiddleware)
+
+def bill_fields(
+    fields: Optional[str],
+    include_items: bool = True,
+    item_fields: tuple = serialization.BILL_ITEM_FIELDS
+) -> serialization.BillFields:
+    """The bill fields a request asked for with fields=, or everything include_items allows"""
+    if fields is None:
+        return serialization.FULL_BILL if include_items else serialization.BILL_SUMMARY
+    try:
+        return serialization.parse_bill_fields(fields, item_fields)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+def product_fields(fields: Optional[str]) -> tuple:
+    if fields is None:
+        return serialization.PRODUCT_FIELDS
+    try:
+        return serialization.parse_product_fields(fields)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+FIELDS_DESCRIPTION = (
+    "Comma-separated fields to return, e.g. id,bill_number,total_amount. "
+    "bill_items returns every item field, bill_items.<field> just that one. Replaces include_items."
+)
+
+def check_date_range(start: Optional[date], end: Optional[date]):
+    if start and end and start > end:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="from must not be after to"
+        )
+
 
 # ==================== PRODUCTS ====================
 
 @app.post("/products", response_model=schemas.ProductResponse)
-def create_product(product: schemas.ProductCreate, db: Session = Depends(get_db)):
+async def create_product(product: schemas.ProductCreate, db: Database = Depends(get_database)):
     """Create a new product"""
-    # Check if product already exists
-    existing = db.query(models.Product).filter(
-        models.Product.product_id == product.product_id
-    ).first()
+    return await db.run(crud.create_product, product)
+
+@app.get("/products", response_model=list[schemas.ProductResponse])
+async def get_all_products(
+    request: Request,
+    response: Response,
+    fields: Optional[str] = Query(None, description="Comma-separated fields to return, e.g. product_id,name"),
+    db: Database = Depends(get_database)
+):
+    """Get all products, answering 304 when the client's ETag is current"""
+    fast = fields is not None or settings.FAST_JSON_RESPONSES
+    if fast:
+        body, etag = await db.run(crud.get_all_products_json, product_fields(fields))
+    else:
+        products, etag = await db.run(crud.get_all_products)
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if fast:
+        return Response(body, media_type=serialization.JSON_MEDIA_TYPE, headers=headers)
+    response.headers.update(headers)
+    return products
+
+@app.post("/products/import", response_model=schemas.ProductImportResult)
+async def import_products(
+    request: Request,
+    format: Optional[str] = Query(None, pattern="^(csv|ndjson)$"),
+    db: Database = Depends(get_database)
+):
+    """Upsert products from a streamed CSV or NDJSON body, reporting per-row errors"""
+    if format is None:
+        content_type = request.headers.get("content-type", "")
+        format = "ndjson" if "ndjson" in content_type or "jsonl" in content_type else "csv"
     
-    if existing:
+    result = schemas.ProductImportResult(received=0, upserted=0, failed=0, errors=[])
+    try:
+        async for chunk in imports.read_chunks(request.stream(), format):
+            part = await db.run(crud.import_products, chunk)
+            result.received += part.received
+            result.upserted += part.upserted
+            result.failed += part.failed
+            result.errors.extend(part.errors[:imports.MAX_REPORTED_ERRORS - len(result.errors)])
+    except UnicodeDecodeError:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Product ID already exists"
+            detail=f"Import body is not valid UTF-8; {result.upserted} rows before the error were imported"
         )
-    
-    db_product = models.Product(**product.dict())
-    db.add(db_product)
-    db.commit()
-    db.refresh(db_product)
-    return db_product
+    return result
 
-@app.get("/products", response_model=list[schemas.ProductResponse])
-def get_all_products(db: Session = Depends(get_db)):
-    """Get all products"""
-    products = db.query(models.Product).all()
-    return products
+@app.get("/products/changes", response_model=schemas.ProductChanges)
+async def get_product_changes(since: Optional[str] = None, db: Database = Depends(get_database)):
+    """Get products inserted, updated or deleted since a catalog version"""
+    return await db.run(crud.get_product_changes, since)
+
+@app.get("/products/search", response_model=list[schemas.ProductResponse])
+async def search_products(
+    q: str = Query(..., min_length=1),
+    limit: int = Query(10, ge=1, le=100),
+    db: Database = Depends(get_database)
+):
+    """Search products by product_id or name prefix for typeahead"""
+    return await db.run(search.search_products, q, limit)
+
+@app.get("/products/search/stats")
+def get_search_cache_stats():
+    """Get hit ratio and size of the ranked hit memo behind GET /products/search"""
+    return search.search_cache.stats()
 
 @app.get("/products/{product_id}", response_model=schemas.ProductResponse)
-def get_product(product_id: str, db: Session = Depends(get_db)):
+async def get_product(
+    product_id: str,
+    fields: Optional[str] = Query(None, description="Comma-separated fields to return, e.g. product_id,name"),
+    db: Database = Depends(get_database)
+):
     """Get product by product_id"""
-    product = db.query(models.Product).filter(
-        models.Product.product_id == product_id
-    ).first()
-    
-    if not product:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Product not found"
-        )
-    return product
+    if fields is not None:
+        body = await db.run(crud.get_product_json, product_id, product_fields(fields))
+        return Response(body, media_type=serialization.JSON_MEDIA_TYPE)
+    return await db.run(crud.get_product, product_id)
 
 @app.put("/products/{product_id}", response_model=schemas.ProductResponse)
-def update_product(product_id: str, product_update: schemas.ProductCreate, db: Session = Depends(get_db)):
+async def update_product(product_id: str, product_update: schemas.ProductCreate, db: Database = Depends(get_database)):
     """Update a product"""
-    product = db.query(models.Product).filter(
-        models.Product.product_id == product_id
-    ).first()
-    
-    if not product:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Product not found"
-        )
-    
-    for key, value in product_update.dict().items():
-        setattr(product, key, value)
-    
-    db.commit()
-    db.refresh(product)
-    return product
+    return await db.run(crud.update_product, product_id, product_update)
 
 @app.delete("/products/{product_id}")
-def delete_product(product_id: str, db: Session = Depends(get_db)):
+async def delete_product(product_id: str, db: Database = Depends(get_database)):
     """Delete a product"""
-    product = db.query(models.Product).filter(
-        models.Product.product_id == product_id
-    ).first()
-    
-    if not product:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Product not found"
-        )
-    
-    db.delete(product)
-    db.commit()
-    return {"message": "Product deleted successfully"}
+    return await db.run(crud.delete_product, product_id)
+
+@app.get("/catalog/stats")
+def get_catalog_stats():
+    """Get product catalog cache statistics"""
+    return catalog.stats()
 
 # ==================== DENOMINATIONS ====================
 
@@ -134,151 +229,195 @@ def get_all_denominations(db: Session = Depends(get_db)):
     denominations = db.query(models.Denomination).all()
     return denominations
 
+# ==================== DRAWER ====================
+
+@app.get("/drawer", response_model=schemas.DrawerResponse)
+async def get_drawer(db: Database = Depends(get_database)):
+    """Get the cash drawer's note counts"""
+    return await db.run(crud.get_drawer)
+
+@app.put("/drawer", response_model=schemas.DrawerResponse)
+async def set_drawer(entries: list[schemas.DrawerEntry], db: Database = Depends(get_database)):
+    """Set cash drawer note counts"""
+    return await db.run(crud.set_drawer, entries)
+
 # ==================== BILLS ====================
 
 @app.post("/bills", response_model=schemas.BillResponse)
-def create_bill(bill_data: schemas.BillCreate, db: Session = Depends(get_db)):
-    """Create a new bill"""
-    
-    # Validate and fetch products
-    bill_items_data = []
-    subtotal = 0
-    total_tax = 0
-    
-    for item in bill_data.items:
-        product = db.query(models.Product).filter(
-            models.Product.product_id == item.product_id
-        ).first()
-        
-        if not product:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail=f"Product {item.product_id} not found"
-            )
-        
-        if product.available_stocks < item.quantity:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"Insufficient stock for product {item.product_id}"
-            )
-        
-        item_subtotal = product.price_per_unit * item.quantity
-        item_tax = item_subtotal * (product.tax_percentage / 100)
-        item_total = item_subtotal + item_tax
-        
-        bill_items_data.append({
-            "product": product,
-            "quantity": item.quantity,
-            "unit_price": product.price_per_unit,
-            "tax_percentage": product.tax_percentage,
-            "item_subtotal": item_subtotal,
-            "item_tax": item_tax,
-            "item_total": item_total
-        })
-        
-        subtotal += item_subtotal
-        total_tax += item_tax
-    
-    total_amount = subtotal + total_tax
-    
-    # Validate paid amount
-    if bill_data.paid_amount < total_amount:
+async def create_bill(
+    bill_data: schemas.BillCreate,
+    idempotency_key: Optional[str] = Header(None, max_length=255),
+    db: Database = Depends(get_database)
+):
+    """Create a new bill; retries with the same Idempotency-Key get the original response"""
+    if idempotency_key:
+        replay = idempotency_keys.cached(idempotency_key, bill_data)
+        if replay is not None:
+            return replay
+    if bill_writer.running:
+        return await bill_writer.create_bill(bill_data, idempotency_key)
+    return await db.run(crud.create_bill, bill_data, idempotency_key)
+
+@app.post("/bills/batch", response_model=schemas.BillBatchResponse)
+async def create_bills_batch(bills: list[schemas.BillCreate], db: Database = Depends(get_database)):
+    """Create many bills at once, e.g. when an offline till syncs"""
+    return await db.run(crud.create_bills_batch, bills)
+
+@app.post("/bills/quote", response_model=schemas.BillQuoteResponse)
+async def quote_bill(quote: schemas.BillQuoteRequest, db: Database = Depends(get_database)):
+    """Price a cart, with its tax by slab and the change for paid_amount, without creating a bill"""
+    return await db.run(crud.quote_bill, quote)
+
+@app.get("/bills/search", response_model=schemas.BillPage)
+async def search_bills(
+    start: Optional[date] = Query(None, alias="from"),
+    end: Optional[date] = Query(None, alias="to"),
+    min_amount: Optional[float] = Query(None, ge=0),
+    max_amount: Optional[float] = Query(None, ge=0),
+    email: Optional[str] = Query(None, min_length=1, max_length=255),
+    product_id: Optional[str] = Query(None, min_length=1, max_length=50),
+    limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[str] = None,
+    include_items: bool = True,
+    fields: Optional[str] = Query(None, description=FIELDS_DESCRIPTION),
+    db: Database = Depends(get_database)
+):
+    """Find bills by date range, total amount range, customer email prefix and contained product"""
+    check_date_range(start, end)
+    if min_amount is not None and max_amount is not None and min_amount > max_amount:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Paid amount is less than total amount"
+            detail="min_amount must not be more than max_amount"
         )
+    filters = bill_search.BillFilters(start, end, min_amount, max_amount, email, product_id)
+    if fields is not None or settings.FAST_JSON_RESPONSES:
+        projection = bill_fields(fields, include_items)
+        body = await db.run(bill_search.search_bills_json, filters, limit, cursor, projection)
+        return Response(body, media_type=serialization.JSON_MEDIA_TYPE)
+    return await db.run(bill_search.search_bills, filters, limit, cursor, include_items)
+
+@app.get("/bills/cache/stats")
+def get_bill_cache_stats():
+    """Get bill cache hit ratio and memory statistics"""
+    return bill_cache.stats()
+
+@app.get("/bills/quote/stats")
+def get_quote_cache_stats():
+    """Get hit ratio and size of the priced cart memo behind POST /bills/quote"""
+    return quote_cache.stats()
+
+@app.get("/bills/{bill_id}", response_model=schemas.BillDetailResponse)
+async def get_bill(
+    request: Request,
+    bill_id: int,
+    fields: Optional[str] = Query(
+        None, description="Comma-separated fields to return; bill_items.product adds each item's product"
+    ),
+    db: Database = Depends(get_database)
+):
+    """Get bill by ID, from the bill cache when possible; bills never change, so clients may cache them too"""
+    if fields is not None:
+        projection = bill_fields(fields, item_fields=serialization.BILL_DETAIL_ITEM_FIELDS)
+        body = await db.run(crud.get_bill_json, bill_id, projection)
+        return Response(body, media_type=serialization.JSON_MEDIA_TYPE)
     
-    balance_amount = bill_data.paid_amount - total_amount
+    cached = bill_cache.get(bill_id)
+    body, etag = cached if cached is not None else await db.run(crud.get_bill_detail_json, bill_id)
+    headers = {"ETag": etag, "Cache-Control": settings.BILL_CACHE_CONTROL}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(body, media_type=serialization.JSON_MEDIA_TYPE, headers=headers)
+
+@app.get("/bills", response_model=schemas.BillPage)
+async def get_all_bills(
+    limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[str] = None,
+    include_items: bool = True,
+    fields: Optional[str] = Query(None, description=FIELDS_DESCRIPTION),
+    db: Database = Depends(get_database)
+):
+    """Get bills, newest first, one keyset page at a time"""
+    if fields is not None or settings.FAST_JSON_RESPONSES:
+        body = await db.run(crud.get_all_bills_json, limit, cursor, bill_fields(fields, include_items))
+        return Response(body, media_type=serialization.JSON_MEDIA_TYPE)
+    return await db.run(crud.get_all_bills, limit, cursor, include_items)
+
+# ==================== EXPORTS ====================
+
+@app.get("/exports/bills")
+async def export_bills(
+    request: Request,
+    start: Optional[date] = Query(None, alias="from"),
+    end: Optional[date] = Query(None, alias="to"),
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    include_items: bool = False
+):
+    """Stream bills created between two dates (inclusive) as NDJSON or CSV"""
+    check_date_range(start, end)
     
-    # Calculate balance denominations
-    denominations = db.query(models.Denomination).all()
-    denom_values = [d.value for d in denominations]
-    balance_denoms = calculate_balance_denominations(balance_amount, denom_values)
-    balance_denoms_json = denominations_to_json(balance_denoms)
+    gzip = accepts_encoding(request.headers.get("accept-encoding"), "gzip")
+    headers = {
+        "Content-Disposition": f'attachment; filename="bills.{format}"',
+        "Vary": "Accept-Encoding"
+    }
+    if gzip:
+        headers["Content-Encoding"] = "gzip"
     
-    # Create bill
-    db_bill = models.Bill(
-        bill_number=f"TEMP-{uuid.uuid4()}",  # Temporary unique bill number
-        customer_email=bill_data.customer_email,
-        subtotal=subtotal,
-        total_tax=total_tax,
-        total_amount=total_amount,
-        paid_amount=bill_data.paid_amount,
-        balance_amount=balance_amount,
-        balance_denominations=balance_denoms_json
+    return StreamingResponse(
+        exports.stream_bills(start, end, format, include_items, gzip),
+        media_type="text/csv; charset=utf-8" if format == "csv" else "application/x-ndjson",
+        headers=headers
     )
-    
-    try:
-        db.add(db_bill)
-        db.flush() # Flushes to get the ID for the bill number
-
-        # Update bill number to its final value
-        db_bill.bill_number = generate_bill_number(db_bill.id)
-        
-        # Create bill items and update stock
-        for item_data in bill_items_data:
-            db_bill_item = models.BillItem(
-                bill_id=db_bill.id,
-                product_id=item_data["product"].id,
-                quantity=item_data["quantity"],
-                unit_price=item_data["unit_price"],
-                tax_percentage=item_data["tax_percentage"],
-                item_subtotal=item_data["item_subtotal"],
-                item_tax=item_data["item_tax"],
-                item_total=item_data["item_total"]
-            )
-            db.add(db_bill_item)
-            
-            # Update product stock
-            item_data["product"].available_stocks -= item_data["quantity"]
-        
-        db.commit()
-        db.refresh(db_bill)
-        return db_bill
-
-    except IntegrityError as e:
-        db.rollback()
-        raise HTTPException(
-            status_code=status.HTTP_409_CONFLICT,
-            detail=f"Database integrity error: {e.orig}"
-        )
 
-@app.get("/bills/{bill_id}", response_model=schemas.BillDetailResponse)
-def get_bill(bill_id: int, db: Session = Depends(get_db)):
-    """Get bill by ID"""
-    bill = db.query(models.Bill).options(joinedload(models.Bill.bill_items).joinedload(models.BillItem.product)).filter(models.Bill.id == bill_id).first()
-    
-    if not bill:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Bill not found"
-        )
-    return bill
+# ==================== ANALYTICS ====================
+
+@app.get("/analytics/sales", response_model=schemas.SalesReport)
+async def get_sales(
+    start: Optional[date] = Query(None, alias="from"),
+    end: Optional[date] = Query(None, alias="to"),
+    granularity: str = Query("day", pattern="^(hour|day)$"),
+    db: Database = Depends(get_database)
+):
+    """Bill count, units, revenue and tax per slab for each hour or day between two dates (inclusive)"""
+    check_date_range(start, end)
+    return await db.run(analytics.sales_report, granularity, start, end)
+
+@app.get("/analytics/products/top", response_model=list[schemas.TopProduct])
+async def get_top_products(
+    start: Optional[date] = Query(None, alias="from"),
+    end: Optional[date] = Query(None, alias="to"),
+    by: str = Query("revenue", pattern="^(revenue|units)$"),
+    limit: int = Query(10, ge=1, le=100),
+    db: Database = Depends(get_database)
+):
+    """Best-selling products between two dates (inclusive) by revenue or units"""
+    check_date_range(start, end)
+    return await db.run(analytics.top_products, start, end, by, limit)
 
-@app.get("/bills", response_model=list[schemas.BillResponse])
-def get_all_bills(db: Session = Depends(get_db)):
-    """Get all bills"""
-    bills = db.query(models.Bill).order_by(desc(models.Bill.created_at)).all()
-    return bills
+# ==================== CUSTOMERS ====================
 
 @app.get("/customers/{customer_email}/purchases", response_model=schemas.CustomerPurchaseHistory)
-def get_customer_purchases(customer_email: str, db: Session = Depends(get_db)):
-    """Get all purchases by a customer"""
-    bills = db.query(models.Bill).filter(
-        models.Bill.customer_email == customer_email
-    ).order_by(desc(models.Bill.created_at)).all()
-    
-    if not bills:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="No purchases found for this customer"
-        )
-    
-    return {
-        "customer_email": customer_email,
-        "total_purchases": len(bills),
-        "bills": bills
-    }
+async def get_customer_purchases(
+    customer_email: str,
+    limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[str] = None,
+    include_items: bool = True,
+    fields: Optional[str] = Query(None, description=FIELDS_DESCRIPTION + " Applies to the bills."),
+    db: Database = Depends(get_database)
+):
+    """Get a customer's lifetime summary and their bills, newest first, one keyset page at a time"""
+    if fields is not None or settings.FAST_JSON_RESPONSES:
+        projection = bill_fields(fields, include_items)
+        body = await db.run(crud.get_customer_purchases_json, customer_email, limit, cursor, projection)
+        return Response(body, media_type=serialization.JSON_MEDIA_TYPE)
+    return await db.run(crud.get_customer_purchases, customer_email, limit, cursor, include_items)
+
+# ==================== METRICS ====================
+
+@app.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+def get_metrics():
+    """Request and SQL metrics in Prometheus text format"""
+    return PlainTextResponse(metrics.registry.render(), media_type=metrics.CONTENT_TYPE)
 
 # ==================== HEALTH CHECK ====================
 
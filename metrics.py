@@ -0,0 +1,263 @@
+"""
+Request and SQL instrumentation, exposed in Prometheus text format at GET /metrics.
+
+MetricsMiddleware records, per method and route template (/bills/{bill_id}
+rather than /bills/42, so the number of series stays bounded), request
+counts by status, latency and response size histograms, and the number of
+requests in flight.
+
+instrument_engine() hooks before/after_cursor_execute on an engine and adds
+each query's count and time to the request that ran it. The running
+request's QueryStats sit in a context variable, which both the threadpool
+(DB_MODE=sync) and run_sync (DB_MODE=async) carry over. Per request totals
+are recorded as histograms per route and sent back in a Server-Timing
+header, e.g. `db;dur=1.84;desc="7 queries", app;dur=6.02`. The header goes
+out with the status line, so a streamed response only reports the queries
+run before its first chunk. Queries outside any request, such as the group
+commit writer's transactions and startup backfills, are counted under
+source="background".
+"""
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import event
+from starlette.datastructures import MutableHeaders
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+SECONDS_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BYTES_BUCKETS = (100, 1000, 10000, 100000, 1000000, 10000000)
+QUERIES_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+UNMATCHED_ROUTE = "unmatched"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    """A named family of series keyed by label values"""
+    
+    kind = ""
+    
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()
+    
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+    
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}", *self.samples()]
+
+
+class Counter(Metric):
+    kind = "counter"
+    
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        super().__init__(name, help, labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+    
+    def inc(self, labels: Tuple[str, ...] = (), amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+    
+    def samples(self) -> List[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        return [f"{self.name}{_labels(self.label_names, key)} {_number(value)}" for key, value in values]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+    
+    def dec(self, labels: Tuple[str, ...] = (), amount: float = 1):
+        self.inc(labels, -amount)
+
+
+class Histogram(Metric):
+    kind = "histogram"
+    
+    def __init__(self, name: str, help: str, labels: Sequence[str], buckets: Sequence[float]):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+        # labels -> [count per bucket (the last one is +Inf), sum]
+        self._series: Dict[Tuple[str, ...], list] = {}
+    
+    def observe(self, labels: Tuple[str, ...], value: float):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0]
+            series[0][index] += 1
+            series[1] += value
+    
+    def samples(self) -> List[str]:
+        with self._lock:
+            series = sorted((key, list(counts), total) for key, (counts, total) in self._series.items())
+        lines = []
+        for key, counts, total in series:
+            cumulative = 0
+            for bound, count in zip((*self.buckets, "+Inf"), counts):
+                cumulative += count
+                le = f'le="{bound if bound == "+Inf" else _number(bound)}"'
+                lines.append(f"{self.name}_bucket{_labels(self.label_names, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.label_names, key)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(self.label_names, key)} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: List[Metric] = []
+    
+    def add(self, metric):
+        self.metrics.append(metric)
+        return metric
+    
+    def render(self) -> str:
+        return "\n".join(line for metric in self.metrics for line in metric.render()) + "\n"
+
+
+registry = Registry()
+
+requests_total = registry.add(Counter(
+    "http_requests_total", "HTTP requests by method, route and status code", ("method", "route", "status")
+))
+request_duration = registry.add(Histogram(
+    "http_request_duration_seconds", "Time from receiving a request to sending its last byte",
+    ("method", "route"), SECONDS_BUCKETS
+))
+response_size = registry.add(Histogram(
+    "http_response_size_bytes", "Response body size", ("method", "route"), BYTES_BUCKETS
+))
+requests_in_flight = registry.add(Gauge("http_requests_in_flight", "Requests currently being served"))
+request_db_queries = registry.add(Histogram(
+    "http_request_db_queries", "SQL statements executed per request", ("method", "route"), QUERIES_BUCKETS
+))
+request_db_duration = registry.add(Histogram(
+    "http_request_db_duration_seconds", "Time spent executing SQL per request", ("method", "route"), SECONDS_BUCKETS
+))
+db_queries_total = registry.add(Counter(
+    "db_queries_total", "SQL statements executed, by requests or in the background", ("source",)
+))
+db_duration_total = registry.add(Counter(
+    "db_query_duration_seconds_total", "Time spent executing SQL, by requests or in the background", ("source",)
+))
+
+
+class QueryStats:
+    """SQL statements run on behalf of one request and the time they took"""
+    
+    __slots__ = ("queries", "seconds")
+    
+    def __init__(self):
+        self.queries = 0
+        self.seconds = 0.0
+
+
+_request_queries: ContextVar[Optional[QueryStats]] = ContextVar("request_queries", default=None)
+
+
+def current_query_stats() -> Optional[QueryStats]:
+    """Query stats of the request being served, or None outside a request"""
+    return _request_queries.get()
+
+
+# ==================== SQL HOOKS ====================
+
+def _before_cursor_execute(connection, cursor, statement, parameters, context, executemany):
+    context._metrics_started = time.perf_counter()
+
+
+def _after_cursor_execute(connection, cursor, statement, parameters, context, executemany):
+    started = getattr(context, "_metrics_started", None)
+    if started is None:
+        return
+    elapsed = time.perf_counter() - started
+    stats = _request_queries.get()
+    if stats is None:
+        db_queries_total.inc(("background",))
+        db_duration_total.inc(("background",), elapsed)
+    else:
+        # One request's queries run one at a time, so no lock is needed
+        stats.queries += 1
+        stats.seconds += elapsed
+
+
+def instrument_engine(engine):
+    """Count and time every statement a sync engine (or an async engine's sync_engine) executes"""
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+
+# ==================== MIDDLEWARE ====================
+
+def server_timing(stats: QueryStats, elapsed: float) -> str:
+    return f'db;dur={stats.seconds * 1000:.2f};desc="{stats.queries} queries", app;dur={elapsed * 1000:.2f}'
+
+
+def route_label(scope) -> str:
+    """The matched route's path template, for labelling metrics by route"""
+    route = scope.get("route")
+    return getattr(route, "path", UNMATCHED_ROUTE) if route is not None else UNMATCHED_ROUTE
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording request metrics and adding the Server-Timing header"""
+    
+    def __init__(self, app):
+        self.app = app
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        
+        started = time.perf_counter()
+        stats = QueryStats()
+        token = _request_queries.set(stats)
+        status_code = 500
+        size = 0
+        
+        async def send_with_timing(message):
+            nonlocal status_code, size
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                MutableHeaders(scope=message).append("Server-Timing", server_timing(stats, time.perf_counter() - started))
+            elif message["type"] == "http.response.body":
+                size += len(message.get("body", b""))
+            await send(message)
+        
+        requests_in_flight.inc()
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _request_queries.reset(token)
+            requests_in_flight.dec()
+            labels = (scope["method"], route_label(scope))
+            requests_total.inc((*labels, str(status_code)))
+            request_duration.observe(labels, time.perf_counter() - started)
+            response_size.observe(labels, size)
+            request_db_queries.observe(labels, stats.queries)
+            request_db_duration.observe(labels, stats.seconds)
+            db_queries_total.inc(("request",), stats.queries)
+            db_duration_total.inc(("request",), stats.seconds)
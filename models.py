@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Text
+from sqlalchemy import Column, Integer, String, Float, Date, DateTime, ForeignKey, Index, Text, collate
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from database import Base
@@ -13,30 +13,55 @@ class Product(Base):
     price_per_unit = Column(Float, nullable=False)
     tax_percentage = Column(Float, nullable=False)
     created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     bill_items = relationship("BillItem", back_populates="product")
 
+class Customer(Base):
+    __tablename__ = "customers"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    email = Column(String(255), unique=True, nullable=False)  # stripped and lowercased
+    bill_count = Column(Integer, nullable=False)
+    total_spent_paise = Column(Integer, nullable=False)
+    first_purchase_at = Column(DateTime, nullable=False)
+    last_purchase_at = Column(DateTime, nullable=False)
+    
+    bills = relationship("Bill", back_populates="customer")
+
 class Bill(Base):
     __tablename__ = "bills"
+    # Purchase history pages; SQLite appends the rowid, so this also serves (customer_id, created_at, id) keysets
+    __table_args__ = (Index("ix_bills_customer_id_created_at", "customer_id", "created_at"),)
     
     id = Column(Integer, primary_key=True, index=True)
     bill_number = Column(String(50), unique=True, nullable=False)
     customer_email = Column(String(255), nullable=False)
+    # Nullable only so older databases can add the column; set on every bill once backfilled
+    customer_id = Column(Integer, ForeignKey("customers.id"), nullable=True)
     subtotal = Column(Float, nullable=False)
     total_tax = Column(Float, nullable=False)
-    total_amount = Column(Float, nullable=False)
+    total_amount = Column(Float, nullable=False, index=True)
     paid_amount = Column(Float, nullable=False)
     balance_amount = Column(Float, nullable=False)
     balance_denominations = Column(Text, nullable=True)
-    created_at = Column(DateTime, default=datetime.utcnow)
+    # SQLite appends the rowid (id) to every index, so this also serves (created_at, id) keyset scans
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
     
+    customer = relationship("Customer", back_populates="bills")
     bill_items = relationship("BillItem", back_populates="bill")
+    denominations_used = relationship("DenominationUsed", back_populates="bill")
+
+# NOCASE so case-insensitive LIKE 'prefix%' searches can range-scan it
+Index("ix_bills_customer_email", collate(Bill.customer_email, "NOCASE"))
 
 class BillItem(Base):
     __tablename__ = "bill_items"
+    # "Bills containing product X", answered from the index alone
+    __table_args__ = (Index("ix_bill_items_product_id_bill_id", "product_id", "bill_id"),)
     
     id = Column(Integer, primary_key=True, index=True)
-    bill_id = Column(Integer, ForeignKey("bills.id"), nullable=False)
+    bill_id = Column(Integer, ForeignKey("bills.id"), nullable=False, index=True)
     product_id = Column(Integer, ForeignKey("products.id"), nullable=False)
     quantity = Column(Integer, nullable=False)
     unit_price = Column(Float, nullable=False)
@@ -53,4 +78,68 @@ class Denomination(Base):
     
     id = Column(Integer, primary_key=True, index=True)
     value = Column(Float, nullable=False, unique=True)
+    # Notes currently in the cash drawer; NULL means this value is not counted
+    drawer_count = Column(Integer, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
+
+class DenominationUsed(Base):
+    __tablename__ = "denominations_used"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    bill_id = Column(Integer, ForeignKey("bills.id"), nullable=False, index=True)
+    denomination_id = Column(Integer, ForeignKey("denominations.id"), nullable=False)
+    kind = Column(String(10), nullable=False)  # "received" or "returned"
+    count = Column(Integer, nullable=False)
+    
+    bill = relationship("Bill", back_populates="denominations_used")
+    denomination = relationship("Denomination")
+
+class BillSequence(Base):
+    __tablename__ = "bill_sequences"
+    __table_args__ = {"sqlite_with_rowid": False}
+    
+    scope = Column(String(100), primary_key=True)  # bill number prefix, e.g. "BILL-" or "BILL-2026-27-"
+    next_value = Column(Integer, nullable=False)
+
+class IdempotencyKey(Base):
+    __tablename__ = "idempotency_keys"
+    # Looked up by key only, so store rows in the primary key b-tree
+    __table_args__ = {"sqlite_with_rowid": False}
+    
+    key = Column(String(255), primary_key=True)
+    request_hash = Column(String(32), nullable=False)
+    response = Column(Text, nullable=False)
+    created_at = Column(DateTime, nullable=False, index=True)
+
+class SalesRollup(Base):
+    __tablename__ = "sales_rollups"
+    __table_args__ = {"sqlite_with_rowid": False}
+    
+    granularity = Column(String(4), primary_key=True)  # "hour" or "day"
+    period_start = Column(DateTime, primary_key=True)  # local time, see ANALYTICS_UTC_OFFSET_MINUTES
+    bill_count = Column(Integer, nullable=False)
+    units = Column(Integer, nullable=False)
+    subtotal_paise = Column(Integer, nullable=False)
+    tax_paise = Column(Integer, nullable=False)
+    total_paise = Column(Integer, nullable=False)
+
+class TaxSlabRollup(Base):
+    __tablename__ = "tax_slab_rollups"
+    __table_args__ = {"sqlite_with_rowid": False}
+    
+    granularity = Column(String(4), primary_key=True)
+    period_start = Column(DateTime, primary_key=True)
+    tax_basis_points = Column(Integer, primary_key=True)  # 1800 for an 18% slab
+    taxable_paise = Column(Integer, nullable=False)
+    tax_paise = Column(Integer, nullable=False)
+
+class ProductSalesDaily(Base):
+    __tablename__ = "product_sales_daily"
+    __table_args__ = {"sqlite_with_rowid": False}
+    
+    day = Column(Date, primary_key=True)
+    product_id = Column(Integer, ForeignKey("products.id"), primary_key=True)
+    units = Column(Integer, nullable=False)
+    subtotal_paise = Column(Integer, nullable=False)
+    tax_paise = Column(Integer, nullable=False)
+    total_paise = Column(Integer, nullable=False)
@@ -0,0 +1,86 @@
+"""
+Integer minor-unit (paise) pricing engine.
+
+All bill arithmetic happens on integers so results are exact and byte-for-byte
+reproducible. Rounding rules:
+
+- Prices and payments are converted to paise once, rounding half up.
+- Tax is computed and rounded half up per line, on the line subtotal.
+- Bill subtotal, tax and total are plain sums of the rounded line amounts,
+  so the bill always equals the sum of its lines.
+"""
+from dataclasses import dataclass
+from decimal import ROUND_HALF_UP, Decimal
+from typing import Dict, Iterable, List, Tuple
+
+PAISE_PER_RUPEE = 100
+BASIS_POINTS = 10_000  # tax rates are held in hundredths of a percent
+
+
+def to_paise(amount: float) -> int:
+    """Convert a rupee amount to paise, rounding half up"""
+    return int((Decimal(str(amount)) * PAISE_PER_RUPEE).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+
+def from_paise(paise: int) -> float:
+    """Convert paise back to rupees for the API's float fields"""
+    return paise / PAISE_PER_RUPEE
+
+
+def to_basis_points(tax_percentage: float) -> int:
+    """Convert a tax percentage such as 18.0 or 12.5 to basis points"""
+    return int((Decimal(str(tax_percentage)) * 100).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+
+def apply_rate(paise: int, basis_points: int) -> int:
+    """Return paise * rate, rounded half up on non-negative amounts"""
+    return (paise * basis_points * 2 + BASIS_POINTS) // (2 * BASIS_POINTS)
+
+
+@dataclass(frozen=True)
+class PricedLine:
+    product_id: str
+    quantity: int
+    unit_price: int
+    tax_basis_points: int
+    subtotal: int
+    tax: int
+    total: int
+
+
+@dataclass(frozen=True)
+class PricedBill:
+    lines: Tuple[PricedLine, ...]
+    subtotal: int
+    tax: int
+    total: int
+    tax_by_slab: Dict[int, int]  # basis points -> tax in paise
+
+
+def price_cart(lines: Iterable[Tuple[str, int, int, int]]) -> PricedBill:
+    """Price (product_id, unit_price_paise, tax_basis_points, quantity) lines in one pass"""
+    priced: List[PricedLine] = []
+    subtotal = tax = 0
+    tax_by_slab: Dict[int, int] = {}
+    for product_id, unit_price, basis_points, quantity in lines:
+        line_subtotal = unit_price * quantity
+        line_tax = apply_rate(line_subtotal, basis_points)
+        priced.append(PricedLine(
+            product_id=product_id,
+            quantity=quantity,
+            unit_price=unit_price,
+            tax_basis_points=basis_points,
+            subtotal=line_subtotal,
+            tax=line_tax,
+            total=line_subtotal + line_tax
+        ))
+        subtotal += line_subtotal
+        tax += line_tax
+        tax_by_slab[basis_points] = tax_by_slab.get(basis_points, 0) + line_tax
+    return PricedBill(
+        lines=tuple(priced),
+        subtotal=subtotal,
+        tax=tax,
+        total=subtotal + tax,
+        tax_by_slab=tax_by_slab
+    )
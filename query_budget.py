@@ -0,0 +1,166 @@
+"""
+N+1 query detection and query budgets.
+
+Statements are recorded by an after_cursor_execute hook (watch_engine) as
+templates: SQL with placeholders, and with expanded IN lists and multi-row
+VALUES collapsed, so the same query for a different page size or cart
+counts as one template. Transaction control (BEGIN, SAVEPOINT, ...) is
+not counted. A template that runs many times in one request is the
+signature of an N+1 pattern, such as loading a product per cart line or
+lazy loading bill_items per bill.
+
+Two ways to use it:
+
+* QUERY_DEBUG=true adds QueryDebugMiddleware, which logs a warning and
+  counts http_requests_repeated_queries_total in /metrics for every request
+  that runs one template more than QUERY_DEBUG_REPEAT_THRESHOLD times.
+* query_budget() asserts a block of code (for example a TestClient call)
+  stays within a statement budget, raising QueryBudgetExceeded with every
+  statement it ran otherwise. benchmarks/check_query_budgets.py declares
+  budgets for the main endpoints this way. It records statements from every
+  thread, because TestClient serves requests from its own event loop
+  thread, so only run one request at a time inside it.
+"""
+import logging
+import re
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator, List, Optional, Tuple
+
+from sqlalchemy import event
+
+import metrics
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+_PLACEHOLDER_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_REPEATED_GROUP = re.compile(r"(\([^()]*\))(?:\s*,\s*\1)+")
+_WHITESPACE = re.compile(r"\s+")
+_TRANSACTION_CONTROL = ("BEGIN", "COMMIT", "END", "ROLLBACK", "SAVEPOINT", "RELEASE")
+
+
+def statement_template(statement: str) -> str:
+    """Normalize SQL so executions differing only in IN list or VALUES length compare equal"""
+    statement = _WHITESPACE.sub(" ", statement).strip()
+    statement = _PLACEHOLDER_LIST.sub("(?, ...)", statement)
+    return _REPEATED_GROUP.sub(r"\1, ...", statement)
+
+
+class QueryLog:
+    """Statements executed while recording, counted per template"""
+    
+    def __init__(self):
+        self.templates: Counter = Counter()
+        self._lock = threading.Lock()
+    
+    @property
+    def count(self) -> int:
+        return sum(self.templates.values())
+    
+    def add(self, statement: str):
+        if statement.lstrip()[:9].upper().startswith(_TRANSACTION_CONTROL):
+            return
+        template = statement_template(statement)
+        with self._lock:
+            self.templates[template] += 1
+    
+    def repeated(self, threshold: int) -> List[Tuple[str, int]]:
+        """Templates executed more than threshold times, most repeated first"""
+        return [(template, n) for template, n in self.templates.most_common() if n > threshold]
+    
+    def report(self) -> str:
+        return "\n".join(f"{n:>5} x {template}" for template, n in self.templates.most_common())
+
+
+# Logs recording every thread's statements (query_budget), and the current request's (debug mode)
+_global_logs: Tuple[QueryLog, ...] = ()
+_global_lock = threading.Lock()
+_request_log: ContextVar[Optional[QueryLog]] = ContextVar("request_query_log", default=None)
+
+
+def _after_cursor_execute(connection, cursor, statement, parameters, context, executemany):
+    for log in _global_logs:
+        log.add(statement)
+    request_log = _request_log.get()
+    if request_log is not None:
+        request_log.add(statement)
+
+
+def watch_engine(engine):
+    """Feed every statement a sync engine (or an async engine's sync_engine) executes to the active logs"""
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+
+@contextmanager
+def record_queries() -> Iterator[QueryLog]:
+    """Record the statements executed by any thread until the block exits"""
+    global _global_logs
+    log = QueryLog()
+    with _global_lock:
+        _global_logs = _global_logs + (log,)
+    try:
+        yield log
+    finally:
+        with _global_lock:
+            _global_logs = tuple(active for active in _global_logs if active is not log)
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+@contextmanager
+def query_budget(max_queries: int, max_repeats: Optional[int] = None, label: str = "block") -> Iterator[QueryLog]:
+    """Fail with QueryBudgetExceeded if the block executes more than max_queries statements,
+    or any one template more than max_repeats times"""
+    with record_queries() as log:
+        yield log
+    problems = []
+    if log.count > max_queries:
+        problems.append(f"ran {log.count} statements, budget is {max_queries}")
+    if max_repeats is not None:
+        for template, n in log.repeated(max_repeats):
+            problems.append(f"repeated {n} times (at most {max_repeats}): {template}")
+    if problems:
+        raise QueryBudgetExceeded(f"{label} " + "; ".join(problems) + "\n" + log.report())
+
+
+# ==================== DEBUG MODE ====================
+
+repeated_query_requests = metrics.registry.add(metrics.Counter(
+    "http_requests_repeated_queries_total",
+    "Requests that ran one statement template more than QUERY_DEBUG_REPEAT_THRESHOLD times (QUERY_DEBUG only)",
+    ("method", "route")
+))
+
+
+class QueryDebugMiddleware:
+    """ASGI middleware logging requests that look like N+1 query patterns"""
+    
+    def __init__(self, app, threshold: int = settings.QUERY_DEBUG_REPEAT_THRESHOLD):
+        self.app = app
+        self.threshold = threshold
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        
+        log = QueryLog()
+        token = _request_log.set(log)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _request_log.reset(token)
+            repeated = log.repeated(self.threshold)
+            if repeated:
+                route = metrics.route_label(scope)
+                repeated_query_requests.inc((scope["method"], route))
+                for template, n in repeated:
+                    logger.warning(
+                        "Possible N+1: %s %s ran %d statements, this one %d times: %s",
+                        scope["method"], route, log.count, n, template
+                    )
@@ -0,0 +1,143 @@
+"""
+Memoized cart pricing for POST /bills/quote.
+
+Cashiers change a cart many times before taking payment, and the same
+carts come back again and again. A quote prices the cart with the same
+pricing engine as create_bill, from the in-memory catalog, and keeps the
+result in a bounded LRU keyed by the canonical cart: its lines merged by
+product and sorted by product_id, so the order items were added in and
+repeated lines for one product do not matter. The key also carries the
+catalog's pricing_version, which changes whenever a product's name, price
+or tax changes or a product is deleted, so a stale price is never served.
+
+Only the cart's pricing is memoized. Stock and the change to hand back
+depend on the moment, so crud.quote_bill checks them on every request
+(change through the drawer's own memo). cart_hash, a digest of the
+canonical cart, is returned with every quote so clients can tell two
+carts are the same without comparing them.
+"""
+import hashlib
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, List, Tuple
+
+import metrics
+import schemas
+import serialization
+from app.config import settings
+from pricing import BASIS_POINTS, PricedBill, from_paise, price_cart, to_basis_points, to_paise
+
+quote_requests = metrics.registry.add(metrics.Counter(
+    "bill_quote_requests_total", "POST /bills/quote cart pricings, by memo hit or miss", ("result",)
+))
+
+Cart = Tuple[Tuple[str, int], ...]
+
+
+def canonical_cart(quantities: Dict[str, int]) -> Cart:
+    """A merged cart's (product_id, quantity) lines in product_id order"""
+    return tuple(sorted(quantities.items()))
+
+
+def cart_hash(cart: Cart) -> str:
+    return hashlib.blake2b(serialization.dumps(cart), digest_size=16).hexdigest()
+
+
+@dataclass(frozen=True)
+class PricedCart:
+    cart_hash: str
+    priced: PricedBill
+    # product_id -> priced line, for returning lines in the order of the cart at hand
+    items: Dict[str, schemas.BillQuoteItem]
+    tax_slabs: List[schemas.TaxSlabSales]
+
+
+def build(cart: Cart, products: Dict[str, schemas.ProductResponse]) -> PricedCart:
+    """Price a canonical cart whose products have all been found in the catalog"""
+    priced = price_cart(
+        (
+            product_id,
+            to_paise(products[product_id].price_per_unit),
+            to_basis_points(products[product_id].tax_percentage),
+            quantity
+        )
+        for product_id, quantity in cart
+    )
+    taxable: Dict[int, int] = {}
+    for line in priced.lines:
+        taxable[line.tax_basis_points] = taxable.get(line.tax_basis_points, 0) + line.subtotal
+    return PricedCart(
+        cart_hash=cart_hash(cart),
+        priced=priced,
+        items={
+            line.product_id: schemas.BillQuoteItem(
+                product_id=line.product_id,
+                name=products[line.product_id].name,
+                quantity=line.quantity,
+                unit_price=from_paise(line.unit_price),
+                tax_percentage=products[line.product_id].tax_percentage,
+                item_subtotal=from_paise(line.subtotal),
+                item_tax=from_paise(line.tax),
+                item_total=from_paise(line.total)
+            )
+            for line in priced.lines
+        },
+        tax_slabs=[
+            schemas.TaxSlabSales(
+                tax_percentage=basis_points * 100 / BASIS_POINTS,
+                taxable_amount=from_paise(taxable[basis_points]),
+                tax=from_paise(tax)
+            )
+            for basis_points, tax in sorted(priced.tax_by_slab.items())
+        ]
+    )
+
+
+class QuoteCache:
+    """LRU of priced carts by (catalog pricing_version, canonical cart)"""
+    
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[Tuple[int, Cart], PricedCart]" = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def price(
+        self, quantities: Dict[str, int], products: Dict[str, schemas.ProductResponse], pricing_version: int
+    ) -> PricedCart:
+        """Price a merged cart, given its products as the catalog held them at pricing_version"""
+        key = (pricing_version, canonical_cart(quantities))
+        with self._lock:
+            cached = self._entries.get(key)
+            if cached is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+        if cached is not None:
+            quote_requests.inc(("hit",))
+            return cached
+        
+        quote_requests.inc(("miss",))
+        priced = build(key[1], products)
+        with self._lock:
+            self.misses += 1
+            if self.max_entries > 0:
+                self._entries[key] = priced
+                if len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return priced
+    
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else None,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+            }
+
+
+quote_cache = QuoteCache(max_entries=settings.QUOTE_CACHE_MAX_ENTRIES)
@@ -1,5 +1,5 @@
-from pydantic import BaseModel, EmailStr
-from typing import Optional, List
+from pydantic import BaseModel, EmailStr, Field
+from typing import Optional, List, Union
 from datetime import datetime
 
 # Product Schemas
@@ -13,14 +13,31 @@ class ProductCreate(BaseModel):
 class ProductResponse(ProductCreate):
     id: int
     created_at: datetime
+    updated_at: Optional[datetime] = None
     
     class Config:
         from_attributes = True
 
+class ProductImportError(BaseModel):
+    row: int
+    detail: str
+
+class ProductImportResult(BaseModel):
+    received: int
+    upserted: int
+    failed: int
+    errors: List[ProductImportError]
+
+class ProductChanges(BaseModel):
+    version: str
+    full: bool
+    products: List[ProductResponse]
+    deleted: List[str]
+
 # Bill Item Schemas
 class BillItemCreate(BaseModel):
     product_id: str
-    quantity: int
+    quantity: int = Field(..., gt=0)
 
 class BillItemResponse(BaseModel):
     id: int
@@ -35,12 +52,17 @@ class BillItemResponse(BaseModel):
         from_attributes = True
 
 # Bill Schemas
+class DenominationInput(BaseModel):
+    denomination_value: float = Field(..., gt=0)
+    count: int = Field(..., ge=0)
+
 class BillCreate(BaseModel):
     customer_email: EmailStr
-    items: List[BillItemCreate]
+    items: List[BillItemCreate] = Field(..., min_length=1)
     paid_amount: float
+    denominations_received: Optional[List[DenominationInput]] = None
 
-class BillResponse(BaseModel):
+class BillSummaryResponse(BaseModel):
     id: int
     bill_number: str
     customer_email: str
@@ -51,11 +73,29 @@ class BillResponse(BaseModel):
     balance_amount: float
     balance_denominations: Optional[str]
     created_at: datetime
-    bill_items: List[BillItemResponse]
     
     class Config:
         from_attributes = True
 
+class BillResponse(BillSummaryResponse):
+    bill_items: List[BillItemResponse]
+
+class BillBatchResult(BaseModel):
+    index: int
+    status: str  # "created" or "rejected"
+    bill_id: Optional[int] = None
+    bill_number: Optional[str] = None
+    detail: Optional[str] = None
+
+class BillBatchResponse(BaseModel):
+    created: int
+    rejected: int
+    results: List[BillBatchResult]
+
+class BillPage(BaseModel):
+    items: List[Union[BillResponse, BillSummaryResponse]]
+    next_cursor: Optional[str]
+
 
 class ProductInfo(BaseModel):
     name: str
@@ -76,7 +116,11 @@ class BillDetailResponse(BillResponse):
 class CustomerPurchaseHistory(BaseModel):
     customer_email: str
     total_purchases: int
-    bills: List[BillResponse]
+    total_spent: float
+    first_purchase_at: datetime
+    last_purchase_at: datetime
+    bills: List[Union[BillResponse, BillSummaryResponse]]
+    next_cursor: Optional[str]
 
 # Denomination Schemas
 class DenominationCreate(BaseModel):
@@ -88,3 +132,66 @@ class DenominationResponse(DenominationCreate):
     
     class Config:
         from_attributes = True
+
+# Drawer Schemas
+class DrawerEntry(BaseModel):
+    denomination_value: float
+    count: Optional[int] = Field(None, ge=0)
+
+class DrawerResponse(BaseModel):
+    entries: List[DrawerEntry]
+    total_value: float
+
+# Analytics Schemas
+class TaxSlabSales(BaseModel):
+    tax_percentage: float
+    taxable_amount: float
+    tax: float
+
+class SalesBucket(BaseModel):
+    period_start: datetime
+    bill_count: int
+    units: int
+    subtotal: float
+    total_tax: float
+    total_amount: float
+    tax_slabs: List[TaxSlabSales]
+
+class SalesReport(BaseModel):
+    granularity: str
+    buckets: List[SalesBucket]
+
+class TopProduct(BaseModel):
+    product_id: str
+    name: str
+    units: int
+    subtotal: float
+    total_tax: float
+    total_amount: float
+
+# Quote Schemas
+class BillQuoteRequest(BaseModel):
+    items: List[BillItemCreate] = Field(..., min_length=1)
+    paid_amount: Optional[float] = None
+    denominations_received: Optional[List[DenominationInput]] = None
+
+class BillQuoteItem(BaseModel):
+    product_id: str
+    name: str
+    quantity: int
+    unit_price: float
+    tax_percentage: float
+    item_subtotal: float
+    item_tax: float
+    item_total: float
+
+class BillQuoteResponse(BaseModel):
+    cart_hash: str
+    items: List[BillQuoteItem]
+    subtotal: float
+    total_tax: float
+    total_amount: float
+    tax_slabs: List[TaxSlabSales]
+    paid_amount: Optional[float] = None
+    balance_amount: Optional[float] = None
+    balance_denominations: Optional[str] = None
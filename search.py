@@ -0,0 +1,184 @@
+"""
+Full-text product search backed by an SQLite FTS5 index.
+
+products_fts is an external-content FTS5 table over products.product_id and
+products.name, kept in sync by triggers so every write path (the API, bulk
+imports, other workers) updates it in the same transaction. Prefix indexes
+keep typeahead queries fast on large catalogs.
+
+Hits are ranked by bm25 over every match, which costs O(matches): a one- or
+two-letter prefix can match most of the catalog. So the ranked product ids
+of each query are memoized in a bounded LRU, keyed by products_fts_version,
+a counter the same triggers bump whenever a product is added, deleted, or
+has its product_id or name changed, the only changes that can reorder hits.
+As the counter lives in the database, other workers' changes invalidate
+the memo too. Stock and prices change with every sale, so the rows
+themselves are always read fresh, by id.
+"""
+import re
+import threading
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+import metrics
+import models
+import schemas
+from app.config import settings
+
+search_requests = metrics.registry.add(metrics.Counter(
+    "product_search_requests_total", "GET /products/search rankings, by memo hit or miss", ("result",)
+))
+
+# Run once, when the index is created
+_INDEX_DDL = [
+    """
+    CREATE VIRTUAL TABLE products_fts USING fts5(
+        product_id, name,
+        content='products', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2',
+        prefix='1 2 3'
+    )
+    """,
+    # Weight product_id matches above name matches in the built-in rank column
+    "INSERT INTO products_fts(products_fts, rank) VALUES ('rank', 'bm25(10.0, 1.0)')",
+]
+
+# Run on every start, so databases made by older versions pick up the version
+# counter and the current triggers
+_SYNC_DDL = [
+    """
+    CREATE TABLE IF NOT EXISTS products_fts_version (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        version INTEGER NOT NULL
+    )
+    """,
+    "INSERT OR IGNORE INTO products_fts_version (id, version) VALUES (1, 0)",
+    "DROP TRIGGER IF EXISTS products_fts_insert",
+    """
+    CREATE TRIGGER products_fts_insert AFTER INSERT ON products BEGIN
+        INSERT INTO products_fts(rowid, product_id, name) VALUES (new.id, new.product_id, new.name);
+        UPDATE products_fts_version SET version = version + 1;
+    END
+    """,
+    "DROP TRIGGER IF EXISTS products_fts_delete",
+    """
+    CREATE TRIGGER products_fts_delete AFTER DELETE ON products BEGIN
+        INSERT INTO products_fts(products_fts, rowid, product_id, name)
+        VALUES ('delete', old.id, old.product_id, old.name);
+        UPDATE products_fts_version SET version = version + 1;
+    END
+    """,
+    # Without the WHEN guard, upserts that leave the name unchanged still rewrite
+    # the index, and FTS5 flushes its pending changes once per statement
+    "DROP TRIGGER IF EXISTS products_fts_update",
+    """
+    CREATE TRIGGER products_fts_update AFTER UPDATE OF product_id, name ON products
+    WHEN old.product_id IS NOT new.product_id OR old.name IS NOT new.name BEGIN
+        INSERT INTO products_fts(products_fts, rowid, product_id, name)
+        VALUES ('delete', old.id, old.product_id, old.name);
+        INSERT INTO products_fts(rowid, product_id, name) VALUES (new.id, new.product_id, new.name);
+        UPDATE products_fts_version SET version = version + 1;
+    END
+    """,
+]
+
+_VERSION = text("SELECT version FROM products_fts_version")
+
+# Ranked and limited inside FTS5, which keeps only the best :limit hits as it
+# scores the matches, so only those rows are read from products
+_SEARCH = text("""
+    SELECT products.* FROM (
+        SELECT rowid, rank FROM products_fts
+        WHERE products_fts MATCH :match
+        ORDER BY rank
+        LIMIT :limit
+    ) AS hits
+    JOIN products ON products.id = hits.rowid
+    ORDER BY hits.rank
+""")
+
+
+class SearchCache:
+    """LRU of ranked product ids by (products_fts_version, match query, limit)"""
+    
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[Tuple[int, str, int], Tuple[int, ...]]" = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, key: Tuple[int, str, int]) -> Optional[Tuple[int, ...]]:
+        with self._lock:
+            ids = self._entries.get(key)
+            if ids is None:
+                self.misses += 1
+            else:
+                self._entries.move_to_end(key)
+                self.hits += 1
+        search_requests.inc(("miss",) if ids is None else ("hit",))
+        return ids
+    
+    def put(self, key: Tuple[int, str, int], ids: Tuple[int, ...]):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = ids
+            if len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+    
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else None,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+            }
+
+
+search_cache = SearchCache(max_entries=settings.SEARCH_CACHE_MAX_ENTRIES)
+
+
+def init_product_search(engine):
+    """Create the FTS index and its triggers, indexing existing products the first time"""
+    with engine.begin() as connection:
+        exists = connection.exec_driver_sql(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'products_fts'"
+        ).first()
+        if not exists:
+            for statement in _INDEX_DDL:
+                connection.exec_driver_sql(statement)
+            connection.exec_driver_sql("INSERT INTO products_fts(products_fts) VALUES ('rebuild')")
+        for statement in _SYNC_DDL:
+            connection.exec_driver_sql(statement)
+
+
+def to_match_query(q: str) -> str:
+    """Turn free text into an FTS5 query that prefix-matches every word"""
+    return " ".join(f'"{token}"*' for token in re.findall(r"\w+", q))
+
+
+def search_products(db: Session, q: str, limit: int) -> List[schemas.ProductResponse]:
+    """Search products by product_id or name, an exact product_id match first"""
+    match = to_match_query(q)
+    if not match:
+        return []
+    exact = db.query(models.Product).filter(models.Product.product_id == q.strip()).first()
+    # Read in the same transaction as the hits, so they are memoized under their own version
+    key = (db.execute(_VERSION).scalar_one(), match, limit)
+    ids = search_cache.get(key)
+    if ids is None:
+        products = db.query(models.Product).from_statement(_SEARCH).params(match=match, limit=limit).all()
+        search_cache.put(key, tuple(product.id for product in products))
+    else:
+        by_id = {product.id: product for product in db.query(models.Product).filter(models.Product.id.in_(ids))}
+        products = [by_id[product_id] for product_id in ids if product_id in by_id]
+    if exact is not None:
+        products = [exact] + [product for product in products if product.id != exact.id][:limit - 1]
+    return [schemas.ProductResponse.model_validate(product) for product in products]
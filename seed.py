@@ -1,29 +1,46 @@
 """
-Seed script to populate initial data
-"""
-from database import SessionLocal, engine, Base
-import models
+Seed script to populate initial data, or generated data at production scale.
 
-# Create tables
-Base.metadata.create_all(bind=engine)
+    python seed.py                                    # denominations and 5 sample products
+    python seed.py --products 1000000 --bills 10000000
 
-db = SessionLocal()
+Generated rows are written with multi-row INSERTs, one transaction per
+--chunk rows, and can be added to a database that already has data:
+denominations and products that exist are left alone, and bills are
+appended.
 
-# Add default denominations
-default_denoms = [2000, 500, 200, 100, 50, 20, 10, 5, 2, 1]
+Generated products SKU0000001... have log-uniform prices from Rs 5 to
+Rs 50,000 and GST slabs weighted towards 18%. Bills are spread evenly over
+the last --days days, oldest first, so ids follow created_at as they do in
+production. Carts are mostly small: 1 line in about a quarter of bills, a
+mean of about 3.6 lines, and at most 40. Products and customers are drawn
+with Zipf-like popularity, so a few best sellers and regulars dominate.
+Customers are paid up to the next Rs 100 and given change.
 
-for value in default_denoms:
-    existing = db.query(models.Denomination).filter(
-        models.Denomination.value == value
-    ).first()
-    
-    if not existing:
-        denom = models.Denomination(value=value)
-        db.add(denom)
-        print(f"Added denomination: {value}")
+Bills go through crud.insert_bill_rows like POST /bills/batch, so bill
+numbers, customers and sales rollups stay consistent. Stock is not
+decremented for generated history.
+"""
+import argparse
+import random
+import time
+from datetime import datetime, timedelta
+from itertools import accumulate
+from typing import List, NamedTuple, Sequence
 
-# Add sample products
-sample_products = [
+from sqlalchemy import func, select
+from sqlalchemy.dialects import sqlite
+
+import analytics
+import crud
+import models
+from app.config import settings
+from app.sqlite import begin_write
+from database import SessionLocal, init_db
+from pricing import from_paise, price_cart, to_basis_points, to_paise
+from utils import denominations_to_json
+
+SAMPLE_PRODUCTS = [
     {
         "product_id": "PROD001",
         "name": "Laptop",
@@ -61,18 +78,196 @@ sample_products = [
     }
 ]
 
-for prod_data in sample_products:
-    existing = db.query(models.Product).filter(
-        models.Product.product_id == prod_data["product_id"]
-    ).first()
+# Rows per multi-row INSERT of products (5 bound values each)
+PRODUCT_ROWS_PER_STATEMENT = 1000
+# Bills are paid up to the next Rs 100
+PAID_ROUNDING = 10000
+
+TAX_SLABS = (0.0, 5.0, 12.0, 18.0, 28.0)
+TAX_SLAB_WEIGHTS = (5, 20, 20, 45, 10)
+ADJECTIVES = ("Classic", "Premium", "Compact", "Deluxe", "Eco", "Smart", "Mini", "Pro", "Ultra", "Basic")
+NOUNS = ("Notebook", "Pen", "Cable", "Charger", "Bottle", "Lamp", "Mouse", "Keyboard", "Bag", "Speaker")
+
+MAX_CART_LINES = 40
+# P(n lines) falls by 28% per extra line: 28% single line carts, mean about 3.6 lines
+CART_LINES = range(1, MAX_CART_LINES + 1)
+CART_LINE_WEIGHTS = tuple(accumulate(0.72 ** (n - 1) for n in CART_LINES))
+QUANTITIES = range(1, 11)
+QUANTITY_WEIGHTS = tuple(accumulate(0.45 ** (n - 1) for n in QUANTITIES))
+
+
+class SeedProduct(NamedTuple):
+    pk: int
+    product_id: str
+    unit_price: int  # paise
+    tax_basis_points: int
+    tax_percentage: float
+
+
+def popularity(count: int, skew: float = 1.07) -> List[float]:
+    """Cumulative Zipf-like weights for random.choices: item 0 is the most popular"""
+    return list(accumulate(1 / (rank + 1) ** skew for rank in range(count)))
+
+
+def customer_email(number: int) -> str:
+    return f"customer{number:07d}@example.com"
+
+
+def random_cart(rng: random.Random, products: Sequence[SeedProduct], weights: Sequence[float]) -> dict:
+    """A cart of distinct products: SeedProduct -> quantity"""
+    lines = rng.choices(CART_LINES, cum_weights=CART_LINE_WEIGHTS)[0]
+    cart = {}
+    for product in rng.choices(products, cum_weights=weights, k=lines):
+        cart[product] = cart.get(product, 0) + rng.choices(QUANTITIES, cum_weights=QUANTITY_WEIGHTS)[0]
+    return cart
+
+
+def change_notes(balance: int) -> dict:
+    """Largest-first change for balance paise in the default denominations, as balance_denominations stores it"""
+    notes = {}
+    for value in settings.DEFAULT_DENOMINATIONS:
+        count, balance = divmod(balance, value * 100)
+        if count:
+            notes[float(value)] = count
+    return notes
+
+
+def seed_defaults(db):
+    """Default denominations and the sample products, skipping any that exist"""
+    begin_write(db)
+    db.execute(
+        sqlite.insert(models.Denomination).on_conflict_do_nothing(index_elements=["value"]),
+        [{"value": value} for value in settings.DEFAULT_DENOMINATIONS]
+    )
+    db.execute(
+        sqlite.insert(models.Product).on_conflict_do_nothing(index_elements=["product_id"]),
+        SAMPLE_PRODUCTS
+    )
+    db.commit()
+
+
+def generate_products(db, count: int, rng: random.Random, chunk: int):
+    """Insert products SKU0000001 to SKU<count>, skipping any that exist"""
+    started = time.perf_counter()
+    for start in range(0, count, chunk):
+        begin_write(db)
+        connection = db.connection()
+        rows = [
+            (
+                f"SKU{number:07d}",
+                f"{rng.choice(ADJECTIVES)} {rng.choice(NOUNS)} {number}",
+                rng.randint(1000, 100000),
+                round(5 * 10000 ** rng.random(), 2),
+                rng.choices(TAX_SLABS, TAX_SLAB_WEIGHTS)[0]
+            )
+            for number in range(start + 1, min(start + chunk, count) + 1)
+        ]
+        for offset in range(0, len(rows), PRODUCT_ROWS_PER_STATEMENT):
+            batch = rows[offset:offset + PRODUCT_ROWS_PER_STATEMENT]
+            connection.exec_driver_sql(
+                crud.product_upsert_sql(len(batch), skip_existing=True), tuple(value for row in batch for value in row)
+            )
+        db.commit()
+        done = min(start + chunk, count)
+        print(f"products {done:>10} / {count}  {done / (time.perf_counter() - started):>9.0f} rows/s")
+
+
+def load_products(db) -> List[SeedProduct]:
+    """Every product, generated ones first in SKU order so popularity follows SKU numbers"""
+    rows = db.execute(
+        select(
+            models.Product.id, models.Product.product_id,
+            models.Product.price_per_unit, models.Product.tax_percentage
+        ).order_by(models.Product.product_id.like("SKU%").desc(), models.Product.product_id)
+    )
+    return [
+        SeedProduct(pk, product_id, to_paise(price), to_basis_points(tax), tax)
+        for pk, product_id, price, tax in rows
+    ]
+
+
+def generate_bills(db, count: int, customers: int, days: float, rng: random.Random, chunk: int):
+    """Append count bills spread evenly over the last days days"""
+    products = load_products(db)
+    if not products:
+        raise SystemExit("No products to bill; seed some with --products first")
+    weights = popularity(len(products))
+    customer_weights = popularity(customers, skew=0.8)
+    customer_numbers = range(1, customers + 1)
+    product_pks = {product.product_id: product.pk for product in products}
     
-    if not existing:
-        product = models.Product(**prod_data)
-        db.add(product)
-        print(f"Added product: {prod_data['name']}")
+    end = datetime.utcnow()
+    step = timedelta(days=days) / max(count, 1)
+    first = end - step * count
+    started = time.perf_counter()
+    for start in range(0, count, chunk):
+        begin_write(db)
+        next_id = (db.scalar(select(func.max(models.Bill.id))) or 0) + 1
+        sales = analytics.SalesTally()
+        bill_rows, item_rows = [], []
+        for n in range(start, min(start + chunk, count)):
+            cart = random_cart(rng, products, weights)
+            priced = price_cart(
+                (product.product_id, product.unit_price, product.tax_basis_points, quantity)
+                for product, quantity in cart.items()
+            )
+            paid = -(-priced.total // PAID_ROUNDING) * PAID_ROUNDING
+            balance = paid - priced.total
+            created_at = first + step * n
+            bill_rows.append({
+                "id": next_id,
+                "customer_email": customer_email(rng.choices(customer_numbers, cum_weights=customer_weights)[0]),
+                "subtotal": from_paise(priced.subtotal),
+                "total_tax": from_paise(priced.tax),
+                "total_amount": from_paise(priced.total),
+                "paid_amount": from_paise(paid),
+                "balance_amount": from_paise(balance),
+                "balance_denominations": denominations_to_json(change_notes(balance)),
+                "created_at": created_at
+            })
+            item_rows.extend(
+                {
+                    "bill_id": next_id,
+                    "product_id": product.pk,
+                    "quantity": line.quantity,
+                    "unit_price": from_paise(line.unit_price),
+                    "tax_percentage": product.tax_percentage,
+                    "item_subtotal": from_paise(line.subtotal),
+                    "item_tax": from_paise(line.tax),
+                    "item_total": from_paise(line.total)
+                }
+                for product, line in zip(cart, priced.lines)
+            )
+            sales.add_priced(created_at, priced, product_pks)
+            next_id += 1
+        crud.insert_bill_rows(db, bill_rows, item_rows, [])
+        sales.write(db)
+        db.commit()
+        done = min(start + chunk, count)
+        print(f"bills    {done:>10} / {count}  {done / (time.perf_counter() - started):>9.0f} bills/s")
 
-db.commit()
-db.close()
 
-print("\nDatabase seeded successfully!")
+def run():
+    parser = argparse.ArgumentParser(description="Seed the billing database with sample or generated data")
+    parser.add_argument("--products", type=int, default=0, help="generated products to add")
+    parser.add_argument("--bills", type=int, default=0, help="generated bills to add")
+    parser.add_argument("--customers", type=int, default=0, help="distinct customers across the bills (default bills / 20)")
+    parser.add_argument("--days", type=float, default=365, help="spread the bills over this many days up to now")
+    parser.add_argument("--chunk", type=int, default=10000, help="rows per transaction")
+    parser.add_argument("--seed", type=int, default=42, help="random seed, for repeatable data")
+    args = parser.parse_args()
+    
+    init_db()
+    rng = random.Random(args.seed)
+    with SessionLocal() as db:
+        seed_defaults(db)
+        if args.products:
+            generate_products(db, args.products, rng, args.chunk)
+        if args.bills:
+            generate_bills(db, args.bills, args.customers or max(1, args.bills // 20), args.days, rng, args.chunk)
+    
+    print("\nDatabase seeded successfully!")
+
 
+if __name__ == "__main__":
+    run()
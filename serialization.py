@@ -0,0 +1,138 @@
+"""
+Fast JSON path for large list responses.
+
+With a response_model, FastAPI validates whatever a route returns against
+the schema again before encoding it, on top of the model_validate calls
+that built it from ORM objects. For pages of hundreds of bills, or the
+whole product catalog, that per-object work is most of the request.
+
+With FAST_JSON_RESPONSES on, GET /bills, GET /bills/search and GET
+/customers/{email}/purchases select plain row tuples instead of ORM
+objects, zip them into dicts in the response schemas' field order, and
+encode them once with dumps(). GET /products encodes the cached catalog
+once per catalog version. The routes keep their response_model for the
+OpenAPI docs, but return the bytes directly.
+
+A fields= query parameter narrows these responses, and the detail routes,
+to named fields. For bills the projection is done
+in SQL: only the requested columns are selected, and bill_items are not
+read at all unless asked for. Projected responses always take this path,
+as they do not fit the response schemas.
+
+dumps() uses orjson when it is installed and pydantic-core's encoder (the
+one FastAPI itself uses) otherwise. Both produce the same bytes as the
+schema path: compact separators, UTF-8 rather than escapes, floats in
+shortest round-trip form and naive datetimes in isoformat. The one
+difference is orjson writing 1e16 where pydantic writes 1e+16, for floats
+of 10^16 and up. benchmarks/bench_serialization.py checks the output
+matches and times both paths.
+"""
+from typing import Any, Iterable, List, NamedTuple, Optional, Tuple
+
+import pydantic_core
+from pydantic import TypeAdapter
+
+import models
+import schemas
+
+try:
+    import orjson
+except ImportError:  # optional: pydantic-core's encoder is about half as fast
+    orjson = None
+
+JSON_MEDIA_TYPE = "application/json"
+
+# Fields in the order of the response schemas, so dicts built in this order serialize like the schemas do
+BILL_FIELDS = tuple(schemas.BillSummaryResponse.model_fields)
+BILL_ITEM_FIELDS = tuple(schemas.BillItemResponse.model_fields)
+# GET /bills/{bill_id} items also carry their product's name and product_id
+BILL_DETAIL_ITEM_FIELDS = tuple(schemas.BillItemWithProduct.model_fields)
+PRODUCT_FIELDS = tuple(schemas.ProductResponse.model_fields)
+# Always selected for a bill, as keyset pagination and item loading need them
+BILL_KEY_FIELDS = ("id", "created_at")
+
+_products = TypeAdapter(List[schemas.ProductResponse])
+
+
+class BillFields(NamedTuple):
+    """Fields of a bill response to select and return; no item fields leaves bill_items out"""
+    bill: Tuple[str, ...]
+    items: Tuple[str, ...] = ()
+
+
+FULL_BILL = BillFields(BILL_FIELDS, BILL_ITEM_FIELDS)
+BILL_SUMMARY = BillFields(BILL_FIELDS)
+BILL_DETAIL = BillFields(BILL_FIELDS, BILL_DETAIL_ITEM_FIELDS)
+
+
+def _field_names(fields: str) -> List[str]:
+    names = [name.strip() for name in fields.split(",") if name.strip()]
+    if not names:
+        raise ValueError("fields must name at least one field")
+    return names
+
+
+def parse_bill_fields(fields: str, item_fields: Tuple[str, ...] = BILL_ITEM_FIELDS) -> BillFields:
+    """Parse a fields= value such as id,total_amount,bill_items.quantity.
+    
+    bill_items on its own selects every item field. Fields come back in
+    schema order whatever order they were given in.
+    """
+    bill, items, unknown = set(), set(), []
+    for name in _field_names(fields):
+        if name in BILL_FIELDS:
+            bill.add(name)
+        elif name == "bill_items":
+            items.update(item_fields)
+        elif name.startswith("bill_items.") and name[len("bill_items."):] in item_fields:
+            items.add(name[len("bill_items."):])
+        else:
+            unknown.append(name)
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    return BillFields(
+        tuple(name for name in BILL_FIELDS if name in bill),
+        tuple(name for name in item_fields if name in items)
+    )
+
+
+def parse_product_fields(fields: str) -> Tuple[str, ...]:
+    """Parse a fields= value such as product_id,name,price_per_unit, in schema order"""
+    names = set(_field_names(fields))
+    unknown = sorted(names.difference(PRODUCT_FIELDS))
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    return tuple(name for name in PRODUCT_FIELDS if name in names)
+
+
+def bill_columns(fields: BillFields) -> tuple:
+    """Bill columns to select for fields: the requested ones first, then any missing key columns"""
+    names = fields.bill + tuple(name for name in BILL_KEY_FIELDS if name not in fields.bill)
+    return tuple(getattr(models.Bill, name) for name in names)
+
+
+def dumps(content: Any) -> bytes:
+    """Encode dicts, lists and scalars (including datetimes) as compact UTF-8 JSON"""
+    if orjson is not None:
+        return orjson.dumps(content)
+    return pydantic_core.to_json(content)
+
+
+def bill_dicts(rows: Iterable[tuple], fields: BillFields) -> List[dict]:
+    """Rows of bill_columns(fields) as dicts of just the requested fields"""
+    names = fields.bill
+    # zip stops at the requested fields, leaving out key columns selected only for paging
+    return [dict(zip(names, row)) for row in rows]
+
+
+def project(model, fields: Tuple[str, ...]) -> dict:
+    return {name: getattr(model, name) for name in fields}
+
+
+def products_json(products: List[schemas.ProductResponse], fields: Optional[Tuple[str, ...]] = None) -> bytes:
+    """GET /products' body, without validating the already built models again"""
+    if fields is not None and fields != PRODUCT_FIELDS:
+        return dumps([project(product, fields) for product in products])
+    if orjson is not None:
+        return orjson.dumps([product.__dict__ for product in products])
+    return _products.dump_json(products)
@@ -1,17 +1,24 @@
+import base64
 import json
-from typing import Dict, List, Tuple
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from pricing import to_paise
 
 def calculate_balance_denominations(balance_amount: float, available_denominations: List[float]) -> Dict[float, int]:
-    """Calculate denominations needed for balance using greedy algorithm"""
+    """Calculate denominations needed for balance using greedy algorithm.
+    
+    Works in integer paise so no rounding drift accumulates between steps.
+    """
     sorted_denoms = sorted(available_denominations, reverse=True)
     denominations_dict = {}
-    remaining = balance_amount
+    remaining = to_paise(balance_amount)
     
     for denom in sorted_denoms:
-        if remaining >= denom:
-            count = int(remaining / denom)
+        denom_paise = to_paise(denom)
+        if denom_paise > 0 and remaining >= denom_paise:
+            count, remaining = divmod(remaining, denom_paise)
             denominations_dict[denom] = count
-            remaining = round(remaining - (count * denom), 2)
     
     return denominations_dict
 
@@ -38,6 +45,47 @@ def format_denominations(denoms_dict: Dict[float, int]) -> str:
     
     return ", ".join(parts) if parts else "No denominations"
 
-def generate_bill_number(bill_id: int) -> str:
-    """Generate bill number"""
-    return f"BILL-{bill_id:06d}"
+def generate_bill_number(number: int, prefix: str = "BILL", period: Optional[str] = None, width: int = 6) -> str:
+    """Generate bill number, e.g. BILL-000042 or BILL-2026-27-000042"""
+    if period:
+        return f"{prefix}-{period}-{number:0{width}d}"
+    return f"{prefix}-{number:0{width}d}"
+
+def encode_cursor(created_at: datetime, bill_id: int) -> str:
+    """Encode a (created_at, id) keyset position as an opaque cursor"""
+    raw = f"{created_at.isoformat()}|{bill_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """Decode a cursor produced by encode_cursor, raising ValueError if malformed"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        created_at, bill_id = raw.rsplit("|", 1)
+        return datetime.fromisoformat(created_at), int(bill_id)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise ValueError("Invalid cursor") from e
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Check an If-None-Match header against an ETag"""
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates or f"W/{etag}" in candidates
+
+def accepts_encoding(accept_encoding: Optional[str], coding: str) -> bool:
+    """Check whether an Accept-Encoding header allows a content coding"""
+    if not accept_encoding:
+        return False
+    weights = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.partition(";")
+        weight = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key.lower() == "q":
+                try:
+                    weight = float(value)
+                except ValueError:
+                    weight = 0.0
+        weights[name.strip().lower()] = weight
+    return weights.get(coding, weights.get("*", 0.0)) > 0